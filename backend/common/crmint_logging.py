@@ -12,13 +12,27 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""Logging helpers."""
+"""Logging helpers.
 
+Messages are not written synchronously to Cloud Logging. They are buffered in
+memory and shipped in batches by a background thread, either when enough
+messages are waiting or after a short delay, so that logging never blocks
+task execution or result handling. Call `flush()` to wait for the buffered
+messages to be written, e.g. when the instance shuts down.
+"""
+
+import collections
+import datetime
 import functools
-from typing import Optional
+import logging
+import queue
+import threading
+import time
+from typing import Any, Optional
 
+from google.api_core import retry
 from google.auth import credentials as auth_credentials
-from google.cloud import logging
+from google.cloud import logging as cloud_logging
 from google.cloud.logging import Logger
 
 
@@ -36,10 +50,150 @@ def get_logger(
   Returns:
     Configured `google.cloud.logging.logger.Logger` instance.
   """
-  client = logging.Client(project=project, credentials=credentials)
+  client = cloud_logging.Client(project=project, credentials=credentials)
   return client.logger('crmint-logger')
 
 
+@retry.Retry(deadline=30.0)
+def _commit(batch: cloud_logging.Batch) -> None:
+  """Writes a batch of entries, retrying transient API errors."""
+  batch.commit()
+
+
+class _BatchingTransport:
+  """Ships log entries to Cloud Logging in batches from a background thread.
+
+  Entries are queued in a bounded buffer. When the buffer is full, new entries
+  are dropped and counted rather than blocking the caller. Entries which fail
+  to be written are counted as well.
+  """
+
+  def __init__(self,
+               max_batch_size: int = 500,
+               max_latency: float = 1.0,
+               max_buffer_size: int = 10000):
+    """Creates a transport, its thread only starts with the first entry.
+
+    Args:
+      max_batch_size: Maximum number of entries written in one API call.
+      max_latency: Maximum number of seconds an entry waits in the buffer.
+      max_buffer_size: Maximum number of entries waiting to be written.
+    """
+    self._max_batch_size = max_batch_size
+    self._max_latency = max_latency
+    self._queue = queue.Queue(maxsize=max_buffer_size)
+    self._lock = threading.Lock()
+    self._thread = None
+    self.dropped_entries = 0
+    self.failed_entries = 0
+
+  def send(self, logger: Logger, method: str, payload: Any,
+           **kwargs: Any) -> None:
+    """Queues an entry to be written with `Batch.<method>(payload, **kwargs)`.
+
+    Args:
+      logger: Logger to write the entry with.
+      method: Name of the batch method to call, `log_text` or `log_struct`.
+      payload: Text or mapping to log.
+      **kwargs: Extra arguments of the batch method (e.g. `severity`).
+    """
+    # Entries are timestamped when logged rather than when written.
+    kwargs.setdefault('timestamp', datetime.datetime.now(datetime.timezone.utc))
+    self._ensure_thread()
+    try:
+      self._queue.put_nowait((logger, method, payload, kwargs))
+    except queue.Full:
+      with self._lock:
+        self.dropped_entries += 1
+
+  def flush(self, timeout: Optional[float] = None) -> bool:
+    """Waits until the entries queued so far are written.
+
+    Args:
+      timeout: Maximum number of seconds to wait, None to wait indefinitely.
+
+    Returns:
+      True if the entries were written before the timeout.
+    """
+    if self._thread is None:
+      return True
+    deadline = None if timeout is None else time.monotonic() + timeout
+    flushed = threading.Event()
+    try:
+      self._queue.put(flushed, timeout=timeout)
+    except queue.Full:
+      return False
+    if deadline is not None:
+      timeout = max(deadline - time.monotonic(), 0)
+    return flushed.wait(timeout)
+
+  def _ensure_thread(self) -> None:
+    if self._thread is not None:
+      return
+    with self._lock:
+      if self._thread is None:
+        self._thread = threading.Thread(
+            target=self._run, name='crmint-logging', daemon=True)
+        self._thread.start()
+
+  def _run(self) -> None:
+    while True:
+      entries = [self._queue.get()]
+      deadline = time.monotonic() + self._max_latency
+      while (len(entries) < self._max_batch_size
+             and not isinstance(entries[-1], threading.Event)):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+          break
+        try:
+          entries.append(self._queue.get(timeout=remaining))
+        except queue.Empty:
+          break
+      self._write([e for e in entries if not isinstance(e, threading.Event)])
+      if isinstance(entries[-1], threading.Event):
+        entries[-1].set()
+
+  def _write(self, entries: list[tuple[Logger, str, Any, dict[str, Any]]]):
+    batches = collections.defaultdict(list)
+    for logger, method, payload, kwargs in entries:
+      batches[logger].append((method, payload, kwargs))
+    for logger, logger_entries in batches.items():
+      try:
+        batch = cloud_logging.Batch(
+            logger, logger.client, resource=logger.default_resource)
+        for method, payload, kwargs in logger_entries:
+          getattr(batch, method)(payload, **kwargs)
+        _commit(batch)
+      except Exception:  # pylint: disable=broad-except
+        with self._lock:
+          self.failed_entries += len(logger_entries)
+        logging.exception('Failed to write %d log entries.',
+                          len(logger_entries))
+
+
+_transport = _BatchingTransport()
+
+
+def flush(timeout: Optional[float] = None) -> bool:
+  """Waits until the buffered messages are written to Cloud Logging.
+
+  Args:
+    timeout: Maximum number of seconds to wait, None to wait indefinitely.
+
+  Returns:
+    True if the buffered messages were written before the timeout.
+  """
+  return _transport.flush(timeout)
+
+
+def get_stats() -> dict[str, int]:
+  """Returns the number of messages dropped or failed to be written."""
+  return {
+      'dropped_entries': _transport.dropped_entries,
+      'failed_entries': _transport.failed_entries,
+  }
+
+
 def log_global_message(message: str, *, log_level: str) -> None:
   """Logs a text message with the given severity level.
 
@@ -48,7 +202,7 @@ def log_global_message(message: str, *, log_level: str) -> None:
     log_level: Level of logging (e.g. 'INFO', 'ERROR').
   """
   logger = get_logger()
-  logger.log_text(message, severity=log_level)
+  _transport.send(logger, 'log_text', message, severity=log_level)
 
 
 def log_message(
@@ -73,7 +227,7 @@ def log_message(
       or None.
   """
   logger = get_logger(project=logger_project, credentials=logger_credentials)
-  logger.log_struct({
+  _transport.send(logger, 'log_struct', {
       'labels': {
           'pipeline_id': pipeline_id,
           'job_id': job_id,
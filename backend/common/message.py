@@ -15,11 +15,14 @@
 """Helpers for communicating with Pub/Sub."""
 
 import base64
+import contextlib
 import datetime
 import functools
 import json
 import os
-from typing import Any
+import threading
+import time
+from typing import Any, Iterable, Iterator, Mapping
 
 import flask
 from google.cloud import pubsub_v1
@@ -45,6 +48,7 @@ class TooEarlyError(_Error):
   def __init__(self, scheduled_time):
     message = f'Resend message after {scheduled_time}'
     super().__init__(message, 419)
+    self.scheduled_time = scheduled_time
 
 
 class BadRequestError(_Error):
@@ -54,14 +58,37 @@ class BadRequestError(_Error):
     super().__init__('There is no valid PubSub message in the request', 400)
 
 
+class PublishError(Exception):
+  """Exception raised when messages of a batch failed to be published."""
+
+  def __init__(self, errors: list[tuple[dict[str, Any], Exception]]):
+    """Initializes the exception.
+
+    Args:
+      errors: List of (data, exception) tuples for each failed message.
+    """
+    super().__init__(
+        f'Failed to publish {len(errors)} message(s), first error: '
+        f'{errors[0][1]!r}')
+    self.errors = errors
+
+
+# Messages published in the current `batch()` context of each thread.
+_batches = threading.local()
+
+
 @functools.cache
-def _get_publisher_client() -> pubsub_v1.PublisherClient:
+def get_publisher_client() -> pubsub_v1.PublisherClient:
+  """Returns the Pub/Sub publisher client shared by the process."""
   return pubsub_v1.PublisherClient()
 
 
 def send(data: dict[str, Any], topic: str, delay: int = 0) -> None:
   """Sends data in a message to a PubSub topic to be processed with a delay.
 
+  Inside a `batch()` context, the message is only published and the delivery
+  confirmation is awaited when leaving the context.
+
   Args:
     data: Data structure to encode as the message.
     topic: Name of the topic to publish messages to.
@@ -76,13 +103,69 @@ def send(data: dict[str, Any], topic: str, delay: int = 0) -> None:
   binary_data = json.dumps(data).encode('utf-8')
   delay_delta = datetime.timedelta(seconds=delay)
   start_time = int((datetime.datetime.utcnow() + delay_delta).timestamp())
-  client = _get_publisher_client()
+  client = get_publisher_client()
   future = client.publish(topic_path,
                           binary_data,
                           start_time=str(start_time))
+  pending = getattr(_batches, 'pending', None)
+  if pending is not None:
+    pending.append((data, future))
+    return
   future.result(timeout=_PUBSUB_TIMEOUT)
 
 
+@contextlib.contextmanager
+def batch(join: bool = True) -> Iterator[None]:
+  """Context in which messages are published without waiting for each other.
+
+  The publisher client groups the messages sent in this context according to
+  its batch settings, and we wait for all of them to be published when leaving
+  the context.
+
+  Args:
+    join: Whether a nested context joins the outermost one, in which case
+      its messages are only waited for when leaving the outermost context.
+      Otherwise they are waited for when leaving this context, e.g. so that
+      a caller can handle the failures of its own messages.
+
+  Raises:
+    PublishError: if some messages failed to be published, listing them.
+  """
+  outer_pending = getattr(_batches, 'pending', None)
+  if join and outer_pending is not None:
+    yield
+    return
+  _batches.pending = []
+  try:
+    yield
+    pending = _batches.pending
+  finally:
+    _batches.pending = outer_pending
+  deadline = time.monotonic() + _PUBSUB_TIMEOUT
+  errors = []
+  for data, future in pending:
+    try:
+      future.result(timeout=max(deadline - time.monotonic(), 0))
+    except Exception as e:  # pylint: disable=broad-except
+      errors.append((data, e))
+  if errors:
+    raise PublishError(errors)
+
+
+def send_many(messages: Iterable[tuple[dict[str, Any], str, int]]) -> None:
+  """Sends many messages and waits for all of them to be published.
+
+  Args:
+    messages: Iterable of (data, topic, delay) tuples, see `send`.
+
+  Raises:
+    PublishError: if some messages failed to be published, listing them.
+  """
+  with batch():
+    for data, topic, delay in messages:
+      send(data, topic, delay=delay)
+
+
 def extract_data(request: flask.Request) -> dict[str, Any]:
   """Returns a PubSub message data from an incoming Flask request.
 
@@ -94,27 +177,40 @@ def extract_data(request: flask.Request) -> dict[str, Any]:
     message = envelope['message']
   except (TypeError, KeyError) as e:
     raise BadRequestError() from e
+  try:
+    data = base64.b64decode(message['data'])
+  except (KeyError, base64.binascii.Error) as e:
+    raise BadRequestError() from e
+  return decode_data(data, message.get('attributes'))
+
+
+def decode_data(data: bytes, attributes: Mapping[str, str]) -> dict[str, Any]:
+  """Returns the data of a PubSub message, once its delay has elapsed.
+
+  Args:
+    data: Raw message data, as published by `send`.
+    attributes: Attributes of the message.
+
+  Raises:
+    TooEarlyError: if the message should not be processed yet.
+    BadRequestError: if the message is not valid.
+  """
   try:
     start_time = datetime.datetime.fromtimestamp(
-        int(message['attributes']['start_time']))
+        int(attributes['start_time']))
     if datetime.datetime.utcnow() < start_time:
       raise TooEarlyError(start_time)
-  except KeyError as e:
+  except (TypeError, KeyError) as e:
     raise BadRequestError() from e
   try:
-    data = json.loads(base64.b64decode(message['data']).decode('utf-8'))
-  except (
-      KeyError,
-      base64.binascii.Error,
-      UnicodeDecodeError,
-      json.decoder.JSONDecodeError) as e:
+    return json.loads(data.decode('utf-8'))
+  except (UnicodeDecodeError, json.decoder.JSONDecodeError) as e:
     raise BadRequestError() from e
-  return data
 
 
 def shutdown() -> None:
   """Cleans Pub/Sub client state."""
   # Stop accepting new messages and commit outstanding ones (if possible).
-  _get_publisher_client().stop()
+  get_publisher_client().stop()
   crmint_logging.log_global_message(
       'PubSub client stopped.', log_level='WARNING')
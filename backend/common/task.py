@@ -51,7 +51,11 @@ class Task:
   @classmethod
   def from_request(cls, request):
     """Creates a task using data form an incoming Flask HTTP request."""
-    data = message.extract_data(request)
+    return cls.from_data(message.extract_data(request))
+
+  @classmethod
+  def from_data(cls, data):
+    """Creates a task using data from a Pub/Sub message."""
     return cls(
         data['task_name'],
         data['pipeline_id'],
@@ -0,0 +1,52 @@
+# Copyright 2024 Google Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Helpers to handle App Engine warmup requests.
+
+App Engine sends a warmup request to new instances before routing traffic to
+them (see `inbound_services` in the app yaml files). We use it to create the
+clients and connections that the first requests would otherwise pay for.
+"""
+
+import time
+from typing import Any, Callable, Sequence
+
+from common import crmint_logging
+
+
+def run(steps: Sequence[tuple[str, Callable[[], Any]]]) -> dict[str, Any]:
+  """Runs warmup steps and reports how long each step took.
+
+  A failing step is reported without interrupting the next steps, the
+  instance will then initialize the corresponding client on first use.
+
+  Args:
+    steps: List of (name, callable) tuples, called in order.
+
+  Returns:
+    Mapping from step names to their duration in seconds, or to the error
+    message if the step failed.
+  """
+  timings = {}
+  for name, step in steps:
+    start_time = time.perf_counter()
+    try:
+      step()
+    except Exception as e:  # pylint: disable=broad-except
+      timings[name] = f'{e.__class__.__name__}: {e}'
+    else:
+      timings[name] = round(time.perf_counter() - start_time, 3)
+  crmint_logging.log_global_message(
+      f'Instance warmed up: {timings}', log_level='INFO')
+  return timings
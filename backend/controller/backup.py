@@ -0,0 +1,116 @@
+# Copyright 2024 Google Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Streams all the pipelines of a stage to and from NDJSON.
+
+A backup has one JSON object per line, each with a `kind`:
+  - `global_params`: the global variables, on the first line.
+  - `pipeline`: a pipeline, in the format of the pipeline export.
+
+Both directions work on batches of pipelines, so that the memory used to back
+up or restore a stage depends on the batch size, not on its number of
+pipelines.
+"""
+
+import json
+from typing import Iterable, Iterator, Union
+
+from sqlalchemy import orm
+
+from controller import models
+
+_BATCH_SIZE = 100
+
+
+def dump(batch_size: int = _BATCH_SIZE) -> Iterator[str]:
+  """Yields the lines of a backup of all the pipelines.
+
+  Args:
+    batch_size: Number of pipelines loaded from the database at once.
+
+  Yields:
+    Lines of the backup, each ending with a newline.
+  """
+  global_params = [
+      {
+          'name': param.name,
+          'label': param.label,
+          'type': param.type,
+          'value': param.api_value,
+      }
+      for param in models.Param.where(pipeline_id=None, job_id=None)
+  ]
+  yield _dump_line({'kind': 'global_params', 'params': global_params})
+
+  # Pipelines are paged by id, as the MySQL driver fetches whole result sets.
+  # Relations of each page are loaded with one query per relationship.
+  query = models.Pipeline.query.options(
+      orm.selectinload(models.Pipeline.params),
+      orm.selectinload(models.Pipeline.schedules),
+      orm.selectinload(models.Pipeline.jobs).selectinload(models.Job.params),
+      orm.selectinload(models.Pipeline.jobs).selectinload(
+          models.Job.start_conditions),
+  ).order_by(models.Pipeline.id)
+  last_id = 0
+  while True:
+    pipelines = query.filter(
+        models.Pipeline.id > last_id).limit(batch_size).all()
+    for pipeline in pipelines:
+      yield _dump_line({'kind': 'pipeline', **pipeline.export_data()})
+    if len(pipelines) < batch_size:
+      return
+    last_id = pipelines[-1].id
+
+
+def restore(lines: Iterable[Union[str, bytes]],
+            batch_size: int = _BATCH_SIZE) -> int:
+  """Restores a backup, in a single transaction.
+
+  Global variables are replaced by the ones of the backup, pipelines are
+  created next to the existing ones.
+
+  Args:
+    lines: Lines of a backup, consumed incrementally.
+    batch_size: Number of pipelines inserted at once.
+
+  Returns:
+    Number of restored pipelines.
+
+  Raises:
+    ValueError: if a line isn't a valid backup record.
+  """
+  num_restored = 0
+  documents = []
+  with models.Pipeline.transaction():
+    for line in lines:
+      if not line.strip():
+        continue
+      record = json.loads(line)
+      kind = record.pop('kind', None)
+      if kind == 'global_params':
+        models.Param.update_list(record['params'])
+      elif kind == 'pipeline':
+        documents.append(record)
+        if len(documents) >= batch_size:
+          num_restored += len(models.Pipeline.import_many(documents))
+          documents = []
+      else:
+        raise ValueError(f'Unknown kind of backup record: {kind}')
+    if documents:
+      num_restored += len(models.Pipeline.import_many(documents))
+  return num_restored
+
+
+def _dump_line(record: dict) -> str:
+  return json.dumps(record) + '\n'
@@ -18,6 +18,7 @@ from typing import Callable, Optional
 
 import flask
 from sqlalchemy import orm
+from sqlalchemy import pool
 
 from common import crmint_logging
 from controller import extensions
@@ -34,14 +35,15 @@ def load_fixtures(logger_func: Optional[Callable[[str], None]] = None) -> None:
       'client_id', 'client_secret', 'emails_for_notifications',
       'google_ads_authentication_code', 'google_ads_refresh_token',
       'developer_token', 'app_conversion_api_developer_token']
-  for setting in general_settings:
-    general_setting = models.GeneralSetting.where(name=setting).first()
-    if not general_setting:
-      general_setting = models.GeneralSetting()
-      general_setting.name = setting
-      general_setting.save()
-      if logger_func:
-        logger_func('Added setting %s' % setting)
+  with models.GeneralSetting.transaction():
+    for setting in general_settings:
+      general_setting = models.GeneralSetting.where(name=setting).first()
+      if not general_setting:
+        general_setting = models.GeneralSetting()
+        general_setting.name = setting
+        general_setting.save()
+        if logger_func:
+          logger_func('Added setting %s' % setting)
 
 
 def reset_jobs_and_pipelines_statuses_to_idle() -> None:
@@ -76,6 +78,8 @@ def truncate_enqueued_tasks():
   """Truncates the enqueued_tasks table."""
   session = extensions.db.session
   session.execute('TRUNCATE TABLE enqueued_tasks')
+  session.query(models.Job).update(
+      {models.Job.enqueued_workers_count: 0}, synchronize_session=False)
   session.commit()
 
 
@@ -89,6 +93,21 @@ def get_tasks_info():
   }
 
 
+def warmup(app: flask.Flask) -> None:
+  """Opens the connections of the database pool ahead of the first requests."""
+  engine = extensions.db.get_engine(app)
+  pool_size = 1
+  if isinstance(engine.pool, pool.QueuePool):
+    pool_size = engine.pool.size()
+  connections = []
+  try:
+    for _ in range(pool_size):
+      connections.append(engine.connect())
+  finally:
+    for connection in connections:
+      connection.close()
+
+
 def shutdown(app: flask.Flask) -> None:
   """Cleans database state."""
   # Find all Sessions in memory and close them.
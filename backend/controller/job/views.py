@@ -102,9 +102,10 @@ class JobSingle(Resource):
 
     args = parser.parse_args()
 
-    job.assign_attributes(args)
-    job.save()
-    job.save_relations(args)
+    with models.Job.transaction():
+      job.assign_attributes(args)
+      job.save()
+      job.save_relations(args)
     return job, 200
 
 
@@ -114,7 +115,7 @@ class JobList(Resource):
   @marshal_with(job_fields)
   def get(self):
     args = parser.parse_args()
-    pipeline = models.Pipeline.find(args['pipeline_id'])
+    pipeline = models.Pipeline.find(args['pipeline_id'], profile='jobs')
     jobs = pipeline.jobs
     for job in jobs:
       job.updated_at = (
@@ -134,9 +135,10 @@ class JobList(Resource):
       }, 422
 
     job = models.Job(args['name'], args['worker_class'], args['pipeline_id'])
-    job.assign_attributes(args)
-    job.save()
-    job.save_relations(args)
+    with models.Job.transaction():
+      job.assign_attributes(args)
+      job.save()
+      job.save_relations(args)
     tracker = insight.GAProvider()
     tracker.track_event(
         category='jobs',
@@ -25,12 +25,11 @@ class BaseNotifier(object):
 
   def recipients(self, other_recipients):
     from controller import models  # pylint: disable=g-import-not-at-top
-    gsetting = models.GeneralSetting.where(
-        name='emails_for_notifications').first()
-    if gsetting is None or gsetting.value is None:
+    emails = models.GeneralSetting.get_value('emails_for_notifications')
+    if emails is None:
       recipients = other_recipients
     else:
-      recipients = list(set(gsetting.value.split() + other_recipients))
+      recipients = list(set(emails.split() + other_recipients))
     return recipients
 
 
@@ -21,6 +21,9 @@ Source: https://github.com/absent1706/sqlalchemy-mixins
 License: MIT
 """
 
+import contextlib
+from typing import Iterator
+
 from sqlalchemy import Column
 from sqlalchemy import DateTime
 from sqlalchemy import func
@@ -30,6 +33,9 @@ from sqlalchemy import sql
 
 _OPERATOR_SPLITTER = "__"
 
+# Key of the session info counting the nested `transaction()` contexts.
+_TRANSACTION_DEPTH_KEY = "active_record_transaction_depth"
+
 
 class TimestampsMixin(object):
   created_at = Column(DateTime, nullable=False, default=func.now())
@@ -99,6 +105,9 @@ class SessionMixin:
 class ActiveRecordMixin(InspectionMixin, SessionMixin):
   """Mixin combining Django-like helpers."""
 
+  # Loader options of the relationships, by name of load profile.
+  __load_profiles__ = {}
+
   @classproperty
   def settable_attributes(cls):  # pylint: disable=no-self-argument
     return cls.columns + cls.settable_relations
@@ -112,10 +121,42 @@ class ActiveRecordMixin(InspectionMixin, SessionMixin):
 
     return self
 
+  @classmethod
+  @contextlib.contextmanager
+  def transaction(cls) -> Iterator[None]:
+    """Groups the changes made in this context into a single commit.
+
+    In this context, `save`, `create`, `update`, `delete` and `commit` only
+    flush their changes (e.g. to get the ids of created records), which are
+    committed when leaving the outermost context. Changes are rolled back if
+    an exception is raised out of it. Nested contexts join the outermost one.
+    """
+    session = cls.session
+    depth = session.info.get(_TRANSACTION_DEPTH_KEY, 0)
+    session.info[_TRANSACTION_DEPTH_KEY] = depth + 1
+    try:
+      yield
+    except BaseException:
+      if not depth:
+        session.rollback()
+      raise
+    finally:
+      session.info[_TRANSACTION_DEPTH_KEY] = depth
+    if not depth:
+      session.commit()
+
+  @classmethod
+  def commit(cls):
+    """Commits the session, or only flushes it inside `transaction()`."""
+    if cls.session.info.get(_TRANSACTION_DEPTH_KEY):
+      cls.session.flush()
+    else:
+      cls.session.commit()
+
   def save(self):
     """Saves the updated model to the current entity db."""
     self.session.add(self)
-    self.session.commit()
+    self.commit()
     return self
 
   @classmethod
@@ -130,6 +171,77 @@ class ActiveRecordMixin(InspectionMixin, SessionMixin):
     """
     return cls().fill(**kwargs).save()
 
+  @classmethod
+  def create_many(cls, items):
+    """Creates many records at once, flushed together in a single commit.
+
+    Ids of the new records are set when this returns, but reading them after
+    a commit reloads each record. Call it inside `transaction()` when they
+    are needed, e.g. to create dependent records.
+
+    Args:
+      items: List of attributes dictionaries, one for each new record.
+
+    Returns:
+      List of the new Models.
+    """
+    records = [cls().fill(**kwargs) for kwargs in items]
+    if records:
+      cls.session.add_all(records)
+      cls.commit()
+    return records
+
+  @classmethod
+  def sync_many(cls, current, items, key="id"):
+    """Makes a set of records match the given list of attributes.
+
+    The differences between the current records and the items are computed
+    in memory, then applied with one bulk insert, one bulk update (of the
+    changed records only) and one delete, committed together.
+
+    Example:
+      Schedule.sync_many(
+          pipeline.schedules,
+          [{"id": 1, "cron": "* * * * *"}, {"cron": "0 * * * *"}])
+
+    Args:
+      current: Records of the set, as currently stored.
+      items: List of attributes dictionaries of the desired records. Items
+        matching no current record are inserted, without their primary key.
+      key: Name of the attribute matching items with current records.
+
+    Returns:
+      Tuple with the numbers of inserted, updated and deleted records.
+
+    Raises:
+      KeyError: if an item has an attribute which is not a column.
+    """
+    mapper = inspect(cls)
+    primary_key = mapper.get_property_by_column(mapper.primary_key[0]).key
+    current_by_key = {getattr(record, key): record for record in current}
+    inserts = []
+    updates = []
+    for item in items:
+      for name in item:
+        if name not in cls.columns:
+          raise KeyError("Attribute '{}' doesn't exist".format(name))
+      record = current_by_key.pop(item.get(key), None)
+      if record is None:
+        inserts.append({k: v for k, v in item.items() if k != primary_key})
+        continue
+      changes = {k: v for k, v in item.items() if getattr(record, k) != v}
+      if changes:
+        changes[primary_key] = getattr(record, primary_key)
+        updates.append(changes)
+    deleted_ids = [getattr(r, primary_key) for r in current_by_key.values()]
+    with cls.transaction():
+      if inserts:
+        cls.session.bulk_insert_mappings(cls, inserts)
+      if updates:
+        cls.session.bulk_update_mappings(cls, updates)
+      num_deleted = cls.destroy(*deleted_ids)
+    return len(inserts), len(updates), num_deleted
+
   def update(self, **kwargs):
     """Persists changes to the database."""
     return self.fill(**kwargs).save()
@@ -138,20 +250,30 @@ class ActiveRecordMixin(InspectionMixin, SessionMixin):
     """Removes the model from the current entity session and mark for deletion.
     """
     self.session.delete(self)
-    self.session.commit()
+    self.commit()
 
   @classmethod
   def destroy(cls, *ids):
-    """Deletes the records with the given ids.
+    """Deletes the records with the given ids in a single statement.
+
+    Bypasses the ORM unit of work, the deleted records loaded in the session
+    are removed from it but relationships loaded before aren't refreshed.
 
     Args:
       *ids: Primary key ids of records.
+
+    Returns:
+      Number of deleted records.
     """
-    for pk in ids:
-      obj = cls.find(pk)
-      if obj:
-        obj.delete()
-    cls.session.flush()
+    if not ids:
+      return 0
+    mapper = inspect(cls)
+    primary_key = mapper.get_property_by_column(mapper.primary_key[0])
+    num_deleted = cls.query.filter(
+        getattr(cls, primary_key.key).in_(ids)).delete(
+            synchronize_session="evaluate")
+    cls.commit()
+    return num_deleted
 
   @classmethod
   def all(cls):
@@ -162,13 +284,25 @@ class ActiveRecordMixin(InspectionMixin, SessionMixin):
     return cls.query.first()
 
   @classmethod
-  def find(cls, id_):
+  def with_profile(cls, profile):
+    """Returns a query loading relationships as defined by a load profile.
+
+    Args:
+      profile: Name of a load profile in `__load_profiles__`.
+    """
+    return cls.query.options(*cls.__load_profiles__[profile])
+
+  @classmethod
+  def find(cls, id_, profile=None):
     """Returns the record fetched for the given id.
 
     Args:
       id_: The primary key.
+      profile: Name of the load profile used to load relationships, None to
+        load them as configured on the model.
     """
-    return cls.query.get(id_)
+    query = cls.with_profile(profile) if profile else cls.query
+    return query.get(id_)
 
 
 class ReprMixin:
@@ -268,6 +402,45 @@ class SmartQueryMixin:
       conditions.append(op(column, value))
     return cls.query.filter(*conditions)
 
+  @classmethod
+  def update_where(cls, values, **filters):
+    """Updates the entities matching the given filters in a single statement.
+
+    Example:
+      Schedule.update_where({"cron": "0 0 * * *"}, pipeline_id=1)
+
+    Records loaded in the session are refreshed after the commit, or when
+    leaving the enclosing `transaction()`.
+
+    Args:
+      values: Mapping of attribute names (or columns) to their new values.
+      **filters: List of filtering conditions, see `where`.
+
+    Returns:
+      Number of updated entities.
+    """
+    num_updated = cls.where(**filters).update(
+        values, synchronize_session=False)
+    cls.commit()
+    return num_updated
+
+  @classmethod
+  def delete_where(cls, **filters):
+    """Deletes the entities matching the given filters in a single statement.
+
+    Bypasses the ORM unit of work, the deleted records loaded in the session
+    are removed from it but relationships loaded before aren't refreshed.
+
+    Args:
+      **filters: List of filtering conditions, see `where`.
+
+    Returns:
+      Number of deleted entities.
+    """
+    num_deleted = cls.where(**filters).delete(synchronize_session="evaluate")
+    cls.commit()
+    return num_deleted
+
 
 class AllFeaturesMixin(ActiveRecordMixin, SmartQueryMixin, ReprMixin):
   __repr__ = ReprMixin.__repr__
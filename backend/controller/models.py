@@ -14,29 +14,36 @@
 
 """Models definitions."""
 
+import collections
 import datetime
 import enum
 import numbers
 import re
+import threading
 import time
-from typing import Optional, Union
+from typing import Callable, Optional, Union
 import uuid
 
 import jinja2
 from sqlalchemy import Boolean
+from sqlalchemy import case
 from sqlalchemy import Column
 from sqlalchemy import DateTime
+from sqlalchemy import event
 from sqlalchemy import ForeignKey
+from sqlalchemy import func
 from sqlalchemy import Integer
 from sqlalchemy import orm
 from sqlalchemy import String
 from sqlalchemy import Text
 
 from common import crmint_logging
+from common import message
 from common import task
 from controller import extensions
 from controller import inline
 from controller import mailers
+from controller import pipeline_graph
 
 
 def _str_to_number(x: str) -> numbers.Number:
@@ -57,6 +64,15 @@ def _str_to_number(x: str) -> numbers.Number:
     return float(x)
 
 
+def _is_condition_fulfilled(condition: str, preceding_job_status: str) -> bool:
+  """Returns True if a start condition is fulfilled by the preceding job."""
+  if condition == StartCondition.CONDITION.SUCCESS:
+    return preceding_job_status == Job.STATUS.SUCCEEDED
+  if condition == StartCondition.CONDITION.FAIL:
+    return preceding_job_status != Job.STATUS.SUCCEEDED
+  return True
+
+
 @enum.unique
 class PipelineReadyStatus(enum.Enum):
   """Statuses for pipeline readiness."""
@@ -78,17 +94,30 @@ class Pipeline(extensions.db.Model):
   status = Column(String(50), nullable=False, default='idle')
   status_changed_at = Column(DateTime)
   jobs = orm.relationship(
-      'Job', backref='pipeline', lazy='joined')
+      'Job', backref='pipeline', lazy='selectin')
   run_on_schedule = Column(Boolean, nullable=False, default=False)
   schedules = orm.relationship(
       'Schedule',
-      lazy='joined',
+      lazy='selectin',
       order_by='asc(Schedule.id)',
       back_populates='pipeline')
   params = orm.relationship(
       'Param',
-      lazy='joined',
+      lazy='selectin',
       order_by='asc(Param.name)')
+  # Number of pipeline jobs in each status, kept up-to-date on flush.
+  idle_jobs_count = Column(Integer, nullable=False, default=0,
+                           server_default='0')
+  waiting_jobs_count = Column(Integer, nullable=False, default=0,
+                              server_default='0')
+  running_jobs_count = Column(Integer, nullable=False, default=0,
+                              server_default='0')
+  stopping_jobs_count = Column(Integer, nullable=False, default=0,
+                               server_default='0')
+  succeeded_jobs_count = Column(Integer, nullable=False, default=0,
+                                server_default='0')
+  failed_jobs_count = Column(Integer, nullable=False, default=0,
+                             server_default='0')
 
   class STATUS:  # pylint: disable=too-few-public-methods
     """Pipeline statuses."""
@@ -99,10 +128,79 @@ class Pipeline(extensions.db.Model):
     RUNNING = 'running'
     INACTIVE_STATUSES = [IDLE, FAILED, SUCCEEDED]
 
+  # Index of the start conditions between jobs, built on first use.
+  _graph = None
+
   def __init__(self, name=None):
     super().__init__()
     self.name = name
 
+  @property
+  def graph(self) -> pipeline_graph.PipelineGraph:
+    """Returns the index of the start conditions between the pipeline jobs."""
+    if self._graph is None:
+      self._graph = pipeline_graph.PipelineGraph(
+          [job.id for job in self.jobs],
+          [(sc.job_id, sc.preceding_job_id, sc.condition)
+           for job in self.jobs for sc in job.start_conditions])
+    return self._graph
+
+  def invalidate_graph(self) -> None:
+    """Discards the graph index after jobs or start conditions changed."""
+    self._graph = None
+
+  def job_statuses(self) -> dict[int, str]:
+    """Returns the current status of each pipeline job, in a single query."""
+    query = self.session.query(Job.id, Job.status).filter(
+        Job.pipeline_id == self.id)
+    return dict(query.all())
+
+  def job_status_counts(self) -> dict[str, int]:
+    """Returns the number of pipeline jobs in each status, in a single read."""
+    query = self.session.query(*_JOB_STATUS_COUNTERS.values()).filter(
+        Pipeline.id == self.id)
+    return dict(zip(_JOB_STATUS_COUNTERS, query.one()))
+
+  def set_job_statuses(self,
+                       status: str,
+                       from_statuses: Optional[list[str]] = None) -> int:
+    """Sets the status of the pipeline jobs with set-based UPDATE statements.
+
+    Args:
+      status: New status of the jobs.
+      from_statuses: Only updates the jobs currently in one of these statuses.
+        Updates all the pipeline jobs if None.
+
+    Returns:
+      Number of updated jobs.
+    """
+    filters = {'pipeline_id': self.id}
+    if from_statuses is not None:
+      filters['status__in'] = from_statuses
+    # Committing expires the jobs loaded in the session with stale statuses.
+    return Job.update_where(
+        {Job.status: status,
+         Job.status_changed_at: datetime.datetime.utcnow()},
+        **filters)
+
+  def recount_job_statuses(self) -> None:
+    """Recomputes the job status counters from the jobs table.
+
+    Only needed to repair counters. The pipeline row and the jobs are locked
+    while counting, so that concurrent status changes can't be overwritten.
+    """
+    with self.transaction():
+      self.session.query(Pipeline.id).filter(
+          Pipeline.id == self.id).with_for_update().one()
+      query = self.session.query(Job.status, func.count()).filter(
+          Job.pipeline_id == self.id).group_by(Job.status).with_for_update()
+      counts = dict(query.all())
+      Pipeline.query.filter_by(id=self.id).update(
+          {column: counts.get(status, 0)
+           for status, column in _JOB_STATUS_COUNTERS.items()},
+          synchronize_session=False)
+      self.commit()
+
   @property
   def has_jobs(self):
     return len(self.jobs) > 0
@@ -123,49 +221,40 @@ class Pipeline(extensions.db.Model):
       self.__setattr__(key, value)
 
   def save_relations(self, relations):
-    for key, value in relations.items():
-      if key == 'schedules':
-        self.assign_schedules(value)
-      elif key == 'params':
-        self.assign_params(value)
+    with self.transaction():
+      for key, value in relations.items():
+        if key == 'schedules':
+          self.assign_schedules(value)
+        elif key == 'params':
+          self.assign_params(value)
 
   def assign_params(self, parameters):
     Param.update_list(parameters, self)
 
   def assign_schedules(self, arg_schedules):
-    # Remove if records not in list ids for update
-    arg_schedule_ids = []
-    for arg_schedule in arg_schedules:
-      if arg_schedule.get('id') is not None:
-        # Updating
-        schedule = Schedule.find(arg_schedule.get('id'))
-        schedule.update(cron=arg_schedule['cron'])
-        arg_schedule_ids.append(arg_schedule['id'])
-      else:
-        # Creating
-        schedule = Schedule.create(pipeline_id=self.id,
-                                   cron=arg_schedule['cron'])
-        arg_schedule_ids.append(schedule.id)
-    # Removing
-    ids_for_removing = []
-    for schedule in self.schedules:
-      if schedule.id not in arg_schedule_ids:
-        ids_for_removing.append(schedule.id)
-    Schedule.destroy(*ids_for_removing)
+    Schedule.sync_many(self.schedules, [
+        {
+            'id': arg_schedule.get('id'),
+            'pipeline_id': self.id,
+            'cron': arg_schedule['cron'],
+        }
+        for arg_schedule in arg_schedules
+    ])
 
   def populate_params_runtime_values(self):
     inline.open_session()
     try:
-      global_context = {}
-      for param in Param.where(pipeline_id=None, job_id=None).all():
-        global_context[param.name] = param.populate_runtime_value()
-      pipeline_context = global_context.copy()
-      for param in self.params:
-        pipeline_context[param.name] = param.populate_runtime_value(
-            global_context)
-      for job in self.jobs:
-        for param in job.params:
-          param.populate_runtime_value(pipeline_context)
+      with self.transaction():
+        global_context = {}
+        for param in Param.where(pipeline_id=None, job_id=None).all():
+          global_context[param.name] = param.populate_runtime_value()
+        pipeline_context = global_context.copy()
+        for param in self.params:
+          pipeline_context[param.name] = param.populate_runtime_value(
+              global_context)
+        for job in self.jobs:
+          for param in job.params:
+            param.populate_runtime_value(pipeline_context)
       inline.close_session()
       return True
     except (jinja2.exceptions.TemplateError, TypeError, ValueError) as e:
@@ -218,11 +307,13 @@ class Pipeline(extensions.db.Model):
   def _start(self) -> None:
     # Updates statuses of pipeline and jobs, before starting any task.
     self.set_status(Pipeline.STATUS.RUNNING)
+    self.set_job_statuses(Job.STATUS.WAITING)
+    # Starts jobs now that all statuses are up-to-date. Jobs with start
+    # conditions wait for preceding jobs.
+    roots = self.graph.roots
     for job in self.jobs:
-      job.set_status(Job.STATUS.WAITING)
-    # Starts jobs now that all statuses are up-to-date.
-    for job in self.jobs:
-      job.start()
+      if job.id in roots:
+        job.start()
 
   def start(self, manual=False) -> bool:
     """Returns True if all jobs have been started."""
@@ -258,8 +349,7 @@ class Pipeline(extensions.db.Model):
     ]
     if ready_status in notify_failure_for_statuses:
       self.set_status(Pipeline.STATUS.FAILED)
-      for job in self.jobs:
-        job.set_status(Job.STATUS.FAILED)
+      self.set_job_statuses(Job.STATUS.FAILED)
     return False
 
   def stop(self) -> bool:
@@ -267,8 +357,10 @@ class Pipeline(extensions.db.Model):
     if self.status != Pipeline.STATUS.RUNNING:
       return False
     self.set_status(Pipeline.STATUS.STOPPING)
-    for job in self.jobs:
-      job.stop()
+    # Same transitions as `Job.stop`, waiting for running tasks to complete.
+    self.set_job_statuses(Job.STATUS.IDLE, from_statuses=[Job.STATUS.WAITING])
+    self.set_job_statuses(
+        Job.STATUS.STOPPING, from_statuses=[Job.STATUS.RUNNING])
     return True
 
   def _start_as_single(self, job: 'Job') -> Union['TaskEnqueued', None]:
@@ -288,92 +380,196 @@ class Pipeline(extensions.db.Model):
     job.set_status(Job.STATUS.FAILED)
     return
 
-  def has_finished(self) -> bool:
+  def has_finished(self, counts: Optional[dict[str, int]] = None) -> bool:
     """Returns True if a pipeline is in a finished state.
 
     A pipeline is considered finished when all jobs are in an inactive status.
+
+    Args:
+      counts: Number of jobs in each status, as returned by
+        `job_status_counts`. Fetched if None.
     """
-    for job in self.jobs:
-      if job.status not in Job.STATUS.INACTIVE_STATUSES:
-        return False
-    return True
+    if counts is None:
+      counts = self.job_status_counts()
+    return not any(count for status, count in counts.items()
+                   if status not in Job.STATUS.INACTIVE_STATUSES)
 
-  def has_stopped(self) -> bool:
-    """Returns True if a pipeline was stopped and has jobs in idle status."""
-    for job in self.jobs:
-      if job.status in Job.STATUS.IDLE:
-        return True
-    return False
+  def has_stopped(self, counts: Optional[dict[str, int]] = None) -> bool:
+    """Returns True if a pipeline was stopped and has jobs in idle status.
+
+    Args:
+      counts: Number of jobs in each status, as returned by
+        `job_status_counts`. Fetched if None.
+    """
+    if counts is None:
+      counts = self.job_status_counts()
+    return counts[Job.STATUS.IDLE] > 0
 
-  def has_failed(self) -> bool:
+  def has_failed(self, counts: Optional[dict[str, int]] = None) -> bool:
     """Returns True if a pipeline is in a failed state.
 
     A pipeline is considered failed if one of these conditions is met:
       1. a leaf job failed (isolated or not)
       2. a starting condition is not fulfilled
+
+    Args:
+      counts: Number of jobs in each status, as returned by
+        `job_status_counts`. Fetched if None.
     """
-    for job in self.jobs:
+    if counts is None:
+      counts = self.job_status_counts()
+    graph = self.graph
+    # Without failed jobs, only a succeeded job can invalidate a condition
+    # expecting its failure.
+    if (not counts[Job.STATUS.FAILED]
+        and StartCondition.CONDITION.FAIL not in graph.condition_types):
+      return False
+    statuses = self.job_statuses()
+    for job_id in graph.job_ids:
       # 1. Checks if a leaf job has failed.
-      if not job.dependent_jobs:
-        if job.status == Job.STATUS.FAILED:
-          return True
+      if job_id in graph.leaves and statuses.get(job_id) == Job.STATUS.FAILED:
+        return True
       # 2. Checks if a starting condition has been invalidated.
-      for start_condition in job.start_conditions:
-        if job.start_condition_invalidated(start_condition):
+      for preceding_job_id, condition in graph.conditions(job_id):
+        preceding_job_status = statuses.get(preceding_job_id)
+        if (preceding_job_status in [Job.STATUS.FAILED, Job.STATUS.SUCCEEDED]
+            and not _is_condition_fulfilled(condition, preceding_job_status)):
           return True
     return False
 
   # TODO(dulacp): rename this method to `job_finished`
   def leaf_job_finished(self) -> None:
     """Determines if the pipeline should be considered finished or failed."""
-    if self.has_failed():
+    counts = self.job_status_counts()
+    if self.has_failed(counts):
       self.stop()
       self.set_status(Pipeline.STATUS.FAILED)
       mailers.NotificationMailer().finished_pipeline(self)
-    elif self.has_stopped():
+    elif self.has_stopped(counts):
       self.set_status(Pipeline.STATUS.IDLE)
-    elif self.has_finished():
+    elif self.has_finished(counts):
       self.set_status(Pipeline.STATUS.SUCCEEDED)
       mailers.NotificationMailer().finished_pipeline(self)
 
   def import_data(self, data):
-    self.run_on_schedule = data.get('run_on_schedule', False)
-    self.assign_params(data['params'])
-    self.assign_schedules(data['schedules'])
+    with self.transaction():
+      self.run_on_schedule = data.get('run_on_schedule', False)
+      self.assign_params(data['params'])
+      self.assign_schedules(data['schedules'])
+      Job.import_many([(self.id, data['jobs'] or [])])
+      self.invalidate_graph()
+
+  @classmethod
+  def import_many(cls, documents):
+    """Creates pipelines from exported documents, in a single transaction.
+
+    Pipelines and jobs are inserted first, as their ids are needed by their
+    relations. Params, schedules and start conditions of all the documents
+    are then inserted with one bulk statement for each table.
+
+    Args:
+      documents: List of exported pipelines, as loaded from JSON.
+
+    Returns:
+      List of the new pipelines, in the order of the documents.
+    """
+    with cls.transaction():
+      pipelines = cls.create_many([
+          {
+              'name': data['name'],
+              'run_on_schedule': data.get('run_on_schedule', False),
+          }
+          for data in documents
+      ])
+      params = []
+      schedules = []
+      for pipeline, data in zip(pipelines, documents):
+        params.extend({'pipeline_id': pipeline.id,
+                       **Param.attributes_from_api(arg_param)}
+                      for arg_param in data['params'])
+        schedules.extend({'pipeline_id': pipeline.id, 'cron': s['cron']}
+                         for s in data['schedules'])
+      cls.session.bulk_insert_mappings(Param, params)
+      cls.session.bulk_insert_mappings(Schedule, schedules)
+      Job.import_many([(pipeline.id, data['jobs'] or [])
+                       for pipeline, data in zip(pipelines, documents)])
+    return pipelines
+
+  def export_data(self):
+    """Returns the pipeline as a document accepted by `import_many`.
+
+    Jobs are identified by random ids, only valid within the document.
+    """
     job_mapping = {}
+    for job in self.jobs:
+      job_mapping[job.id] = uuid.uuid4().hex
+
     jobs = []
-    if data['jobs']:
-      for job_data in data['jobs']:
-        job = Job.create()
-        job.pipeline_id = self.id
-        job.assign_attributes(job_data)
-        job.save()
-        job.save_relations(job_data)
-        jobs.append(job)
-        job_mapping[job_data['id']] = job.id
-      for job in jobs:
-        index = list(job_mapping.values()).index(job.id)
-        job_id = list(job_mapping.keys())[index]
-        job_data = next((j for j in data['jobs'] if j['id'] == job_id), None)
-        job.assign_hash_start_conditions(job_data['hash_start_conditions'],
-                                         job_mapping)
+    for job in self.jobs:
+      params = []
+      for param in job.params:
+        params.append({
+            'name': param.name,
+            'value': param.api_value,
+            'label': param.label,
+            'is_required': param.is_required,
+            'type': param.type,
+            'description': param.description
+        })
+      start_conditions = []
+      for start_condition in job.start_conditions:
+        start_conditions.append({
+            'preceding_job_id': job_mapping[start_condition.preceding_job_id],
+            'condition': start_condition.condition
+        })
+      jobs.append({
+          'id': job_mapping[job.id],
+          'name': job.name,
+          'worker_class': job.worker_class,
+          'params': params,
+          'hash_start_conditions': start_conditions
+      })
+
+    pipeline_params = []
+    for param in self.params:
+      pipeline_params.append({
+          'name': param.name,
+          'value': param.value,
+          'type': param.type,
+      })
+
+    pipeline_schedules = []
+    for schedule in self.schedules:
+      pipeline_schedules.append({
+          'cron': schedule.cron,
+      })
+
+    return {
+        'name': self.name,
+        'run_on_schedule': self.run_on_schedule,
+        'jobs': jobs,
+        'params': pipeline_params,
+        'schedules': pipeline_schedules
+    }
 
   def is_blocked(self):
     return (self.run_on_schedule or
             self.status in [Pipeline.STATUS.RUNNING, Pipeline.STATUS.STOPPING])
 
   def destroy(self):
-    sc_ids = [sc.id for sc in self.schedules]
-    if sc_ids:
-      Schedule.destroy(*sc_ids)
-
-    for job in self.jobs:
-      job.destroy()
-
-    param_ids = [p.id for p in self.params]
-    if param_ids:
-      Param.destroy(*param_ids)
-    self.delete()
+    with self.transaction():
+      job_ids = [job.id for job in self.jobs]
+      if job_ids:
+        StartCondition.delete_where(job_id__in=job_ids)
+        StartCondition.delete_where(preceding_job_id__in=job_ids)
+        Param.delete_where(job_id__in=job_ids)
+        Job.delete_where(pipeline_id=self.id)
+      Param.delete_where(pipeline_id=self.id)
+      Schedule.delete_where(pipeline_id=self.id)
+      # Relationships loaded before still reference the deleted records.
+      self.session.expire(self, ['jobs', 'schedules', 'params'])
+      self.invalidate_graph()
+      self.delete()
 
 
 class TaskEnqueued(extensions.db.Model):
@@ -392,6 +588,8 @@ class TaskEnqueued(extensions.db.Model):
     num_deleted = cls.query.filter(cls.task_namespace.like(pattern)).delete(
         synchronize_session=False
     )
+    Job.query.filter_by(pipeline_id=pipeline_id).update(
+        {Job.enqueued_workers_count: 0}, synchronize_session=False)
     return num_deleted
 
   @classmethod
@@ -411,28 +609,31 @@ class TaskEnqueued(extensions.db.Model):
         worker_class="TaskEnqueued",
         pipeline_id=0,
         job_id=0)
-      for task in old_tasks:
-        # Parse task_namespace to get pipeline_id and job_id
-        match = re.match(r'pipeline=(\d+)_job=(\d+)', task.task_namespace)
-        if match:
-          pipeline_id = int(match.group(1))
-          job_id = int(match.group(2))
-          crmint_logging.log_message(
-            f"Deleting old task: {task.task_name} "
-            f"(Pipeline ID: {pipeline_id}, Job ID: {job_id})",
-            log_level="DEBUG",
-            worker_class="TaskEnqueued",
-            pipeline_id=pipeline_id,
-            job_id=job_id)
-        else:
-          crmint_logging.log_message(
-            f"Deleting old task with unparseable namespace: {task.task_namespace}",
-            log_level="DEBUG",
-            worker_class="TaskEnqueued",
-            pipeline_id=0,
-            job_id=0)
-        # Delete the task
-        task.delete()
+      with cls.transaction():
+        for task in old_tasks:
+          # Parse task_namespace to get pipeline_id and job_id
+          match = re.match(r'pipeline=(\d+)_job=(\d+)', task.task_namespace)
+          if match:
+            pipeline_id = int(match.group(1))
+            job_id = int(match.group(2))
+            crmint_logging.log_message(
+              f"Deleting old task: {task.task_name} "
+              f"(Pipeline ID: {pipeline_id}, Job ID: {job_id})",
+              log_level="DEBUG",
+              worker_class="TaskEnqueued",
+              pipeline_id=pipeline_id,
+              job_id=job_id)
+            Job.add_running_tasks(job_id, -1)
+          else:
+            crmint_logging.log_message(
+              f"Deleting old task with unparseable namespace: "
+              f"{task.task_namespace}",
+              log_level="DEBUG",
+              worker_class="TaskEnqueued",
+              pipeline_id=0,
+              job_id=0)
+          # Delete the task
+          task.delete()
       crmint_logging.log_message(
         f"Deleted {num_old_tasks} old tasks.",
         log_level="DEBUG",
@@ -448,12 +649,6 @@ class TaskEnqueued(extensions.db.Model):
         job_id=0)
     return num_old_tasks
 
-  @classmethod
-  def count_in_namespace(cls, task_namespace: str) -> int:
-    """Returns the number of tasks still running in the given namespace."""
-    count_query = cls.where(task_namespace=task_namespace)
-    return count_query.count()
-
   @property
   def name(self):
     """TODO(dulacp): remove this helper, used to avoid too much refactoring."""
@@ -512,16 +707,23 @@ class Job(extensions.db.Model):
 
   id = Column(Integer, primary_key=True, autoincrement=True)
   name = Column(String(255))
-  status = Column(String(50), nullable=False, default='idle')
+  # Previous values are loaded on change to update pipeline counters.
+  status = orm.column_property(
+      Column(String(50), nullable=False, default='idle'),
+      active_history=True)
   status_changed_at = Column(DateTime)
   worker_class = Column(String(255))
-  pipeline_id = Column(Integer, ForeignKey('pipelines.id'))
-  params = orm.relationship('Param', backref='job', lazy='joined')
+  pipeline_id = orm.column_property(
+      Column(Integer, ForeignKey('pipelines.id')), active_history=True)
+  # Number of tasks enqueued for this job which did not finish yet.
+  enqueued_workers_count = Column(
+      Integer, nullable=False, default=0, server_default='0')
+  params = orm.relationship('Param', backref='job', lazy='selectin')
   start_conditions = orm.relationship(
       'StartCondition',
       primaryjoin='Job.id==StartCondition.job_id',
       back_populates='job',
-      lazy='joined')
+      lazy='selectin')
   affected_conditions = orm.relationship(
       'StartCondition',
       primaryjoin='Job.id==StartCondition.preceding_job_id',
@@ -557,19 +759,112 @@ class Job(extensions.db.Model):
     self.pipeline_id = pipeline_id
 
   def destroy(self):
-    sc_ids = [sc.id for sc in self.start_conditions]
-    if sc_ids:
-      StartCondition.destroy(*sc_ids)
+    with self.transaction():
+      StartCondition.delete_where(job_id=self.id)
+      StartCondition.delete_where(preceding_job_id=self.id)
+      Param.delete_where(job_id=self.id)
+      # Relationships loaded before still reference the deleted records.
+      self.session.expire(
+          self, ['params', 'start_conditions', 'affected_conditions'])
+      self._invalidate_pipeline_graph()
+      self.delete()
+
+  @classmethod
+  def import_many(cls, pipelines_jobs):
+    """Creates exported jobs with their params and start conditions.
+
+    Exported jobs reference each other with ids only valid in their export,
+    remapped to the ids of the new jobs.
+
+    Args:
+      pipelines_jobs: List of (pipeline_id, jobs_data) tuples, where
+        jobs_data is the list of exported jobs of the pipeline.
+
+    Returns:
+      List of the new jobs.
+    """
+    with cls.transaction():
+      jobs = []
+      for pipeline_id, jobs_data in pipelines_jobs:
+        for job_data in jobs_data:
+          job = cls(pipeline_id=pipeline_id)
+          job.assign_attributes(job_data)
+          jobs.append(job)
+      cls.session.add_all(jobs)
+      cls.commit()
+      params = []
+      start_conditions = []
+      new_jobs = iter(jobs)
+      for _, jobs_data in pipelines_jobs:
+        pipeline_jobs = [(job_data, next(new_jobs)) for job_data in jobs_data]
+        job_mapping = {job_data['id']: job.id
+                       for job_data, job in pipeline_jobs}
+        for job_data, job in pipeline_jobs:
+          params.extend({'job_id': job.id,
+                         **Param.attributes_from_api(arg_param)}
+                        for arg_param in job_data.get('params', []))
+          start_conditions.extend(
+              {
+                  'job_id': job.id,
+                  'preceding_job_id': job_mapping[sc['preceding_job_id']],
+                  'condition': sc['condition'],
+              }
+              for sc in job_data.get('hash_start_conditions', []))
+      cls.session.bulk_insert_mappings(Param, params)
+      cls.session.bulk_insert_mappings(StartCondition, start_conditions)
+    return jobs
+
+  @classmethod
+  def update_where(cls, values, **filters):
+    """Updates the jobs matching the given filters in bulk.
 
-    dependent_job_sc_ids = [
-        sc.id for sc in StartCondition.where(preceding_job_id=self.id).all()]
-    if dependent_job_sc_ids:
-      StartCondition.destroy(*dependent_job_sc_ids)
+    Bulk updates bypass the flush listeners keeping the pipeline job status
+    counters up to date (see `_JOB_STATUS_COUNTERS`). When statuses change,
+    jobs are updated with one statement per previous status, and the counters
+    are incremented by the number of rows each statement changed.
 
-    param_ids = [p.id for p in self.params]
-    if param_ids:
-      Param.destroy(*param_ids)
-    self.delete()
+    Args:
+      values: Mapping of attribute names (or columns) to their new values.
+      **filters: List of filtering conditions, see `where`.
+
+    Returns:
+      Number of updated jobs.
+
+    Raises:
+      ValueError: if statuses are updated without filtering on a pipeline, or
+        if jobs are moved to another pipeline.
+    """
+    values_by_name = {getattr(k, 'key', k): v for k, v in values.items()}
+    if 'pipeline_id' in values_by_name:
+      raise ValueError('Jobs cannot be moved to another pipeline in bulk.')
+    if 'status' not in values_by_name:
+      return super().update_where(values, **filters)
+    pipeline_id = filters.get('pipeline_id')
+    if pipeline_id is None:
+      raise ValueError('Job statuses are only updated in bulk per pipeline.')
+    status = values_by_name['status']
+    if 'status' in filters:
+      from_statuses = [filters.pop('status')]
+    else:
+      from_statuses = filters.pop('status__in', list(_JOB_STATUS_COUNTERS))
+    # Jobs already in the new status are updated first, so that the jobs
+    # updated next aren't matched again.
+    from_statuses = sorted(from_statuses, key=lambda f: f != status)
+    deltas = collections.Counter()
+    num_updated = 0
+    with cls.transaction():
+      for from_status in from_statuses:
+        num_changed = super().update_where(
+            values, status=from_status, **filters)
+        deltas[pipeline_id, from_status] -= num_changed
+        deltas[pipeline_id, status] += num_changed
+        num_updated += num_changed
+      _apply_job_status_deltas(cls.session, deltas)
+    return num_updated
+
+  def _invalidate_pipeline_graph(self) -> None:
+    if self.pipeline is not None:
+      self.pipeline.invalidate_graph()
 
   def assign_attributes(self, attributes):
     for key, value in attributes.items():
@@ -578,11 +873,12 @@ class Job(extensions.db.Model):
       self.__setattr__(key, value)
 
   def save_relations(self, relations):
-    for key, value in relations.items():
-      if key == 'params':
-        self.assign_params(value)
-      elif key == 'start_conditions':
-        self.assign_start_conditions(value)
+    with self.transaction():
+      for key, value in relations.items():
+        if key == 'params':
+          self.assign_params(value)
+        elif key == 'start_conditions':
+          self.assign_start_conditions(value)
 
   def add_start_conditions(self, items):
     for item in items:
@@ -591,47 +887,19 @@ class Job(extensions.db.Model):
   def assign_params(self, parameters):
     Param.update_list(parameters, self)
 
-  def assign_hash_start_conditions(self, arg_start_conditions, job_mapping):
-    for arg_start_condition in arg_start_conditions:
-      preceding_job_id = job_mapping[arg_start_condition['preceding_job_id']]
-      StartCondition.create(
-          job_id=self.id,
-          preceding_job_id=preceding_job_id,
-          condition=arg_start_condition['condition']
-      )
-
   def assign_start_conditions(self, arg_start_conditions):
-    scs = []
-    for arg_start_condition in arg_start_conditions:
-      scs.append(StartCondition.parse_value(arg_start_condition))
-
-    arg_sc_ids = {sc['id'] for sc in scs}
-    cur_sc_ids = {sc.preceding_job_id for sc in self.start_conditions}
-
-    sc_intersection_ids = set(arg_sc_ids) & set(cur_sc_ids)
-    new_sc_ids = set(arg_sc_ids) - set(cur_sc_ids)
-    for v in scs:
-      # Add new start conditions
-      if v['id'] in new_sc_ids:
-        StartCondition.create(
-            job_id=self.id,
-            preceding_job_id=v['id'],
-            condition=v['condition']
-        )
-      # Update current start conditions
-      elif v['id'] in sc_intersection_ids:
-        sc = StartCondition.where(
-            job_id=self.id,
-            preceding_job_id=v['id']
-        ).first()
-        sc.condition = v['condition']
-        sc.save()
-    # Delete extra start conditions
-    delete_sc_ids = set(cur_sc_ids) - set(arg_sc_ids)
-    StartCondition.where(
-        job_id=self.id,
-        preceding_job_id__in=delete_sc_ids
-    ).delete(synchronize_session=False)
+    scs = [StartCondition.parse_value(arg_start_condition)
+           for arg_start_condition in arg_start_conditions]
+    # Start conditions are identified by their preceding job.
+    StartCondition.sync_many(self.start_conditions, [
+        {
+            'job_id': self.id,
+            'preceding_job_id': sc['id'],
+            'condition': sc['condition'],
+        }
+        for sc in scs
+    ], key='preceding_job_id')
+    self._invalidate_pipeline_graph()
 
   def set_status(self, status):
     self.update(status=status, status_changed_at=datetime.datetime.utcnow())
@@ -642,42 +910,51 @@ class Job(extensions.db.Model):
       return False
     return True
 
-  def start_condition_invalidated(self,
-                                  start_condition: StartCondition) -> bool:
-    predecing_job_status = start_condition.preceding_job.status
-    if predecing_job_status not in [Job.STATUS.FAILED, Job.STATUS.SUCCEEDED]:
-      # Still running or idle
-      return False
-    return not self._start_condition_is_fulfilled(start_condition)
-
-  def _start_condition_is_fulfilled(self, start_condition) -> bool:
-    preceding_job_status = start_condition.preceding_job.status
-    if start_condition.condition == StartCondition.CONDITION.SUCCESS:
-      if preceding_job_status != Job.STATUS.SUCCEEDED:
-        return False
-    elif start_condition.condition == StartCondition.CONDITION.FAIL:
-      if preceding_job_status == Job.STATUS.SUCCEEDED:
-        return False
-    return True
+  def _start_dependent_jobs(
+      self, statuses: dict[int, str]) -> list[TaskEnqueued]:
+    """Starts the jobs depending on this one, in topological order.
+
+    Args:
+      statuses: Status of each pipeline job, updated with the started jobs.
 
-  def _start_dependent_jobs(self) -> list[TaskEnqueued]:
+    Returns:
+      List of tasks enqueued for the started jobs.
+    """
+    graph = self.pipeline.graph
+    dependent_ids = set(graph.dependents(self.id))
+    jobs_by_id = {job.id: job for job in self.pipeline.jobs}
     enqueued_tasks = []
-    for job in self.dependent_jobs:
-      started_task = job.start()
+    for job_id in graph.topological_order:
+      if job_id not in dependent_ids:
+        continue
+      started_task = jobs_by_id[job_id].start(statuses)
       if started_task:
+        statuses[job_id] = Job.STATUS.RUNNING
         enqueued_tasks.append(started_task)
     return enqueued_tasks
 
-  def start(self) -> Union[TaskEnqueued, None]:
+  def start(
+      self,
+      statuses: Optional[dict[int, str]] = None) -> Union[TaskEnqueued, None]:
+    """Starts the job if all its start conditions are fulfilled.
+
+    Args:
+      statuses: Status of each pipeline job, as returned by
+        `Pipeline.job_statuses`. Fetched if None.
+    """
     if self.status not in Job.STATUS.WAITING:
       # NOTE: Usually means that a single job was started from the UI,
       #       so other jobs are still in an inactive status.
       return None
-    for start_condition in self.start_conditions:
-      if start_condition.preceding_job.status not in Job.STATUS.INACTIVE_STATUSES:
+    conditions = self.pipeline.graph.conditions(self.id)
+    if conditions and statuses is None:
+      statuses = self.pipeline.job_statuses()
+    for preceding_job_id, condition in conditions:
+      preceding_job_status = statuses.get(preceding_job_id)
+      if preceding_job_status not in Job.STATUS.INACTIVE_STATUSES:
         # Starting condition still running.
         return None
-      if not self._start_condition_is_fulfilled(start_condition):
+      if not _is_condition_fulfilled(condition, preceding_job_status):
         # Cannot start this job, pipeline has failed.
         self.pipeline.leaf_job_finished()
         return None
@@ -695,44 +972,94 @@ class Job(extensions.db.Model):
   def _get_task_namespace(self):
     return f'pipeline={self.pipeline_id}_job={self.id}'
 
-  def _add_task_with_name(self, task_name: str) -> TaskEnqueued:
-    """Keeps track of running tasks with commit confirmation."""
-    namespace = self._get_task_namespace()
-    return TaskEnqueued.create(task_namespace=namespace, task_name=task_name)
+  @classmethod
+  def add_running_tasks(cls, job_id: int, delta: int) -> int:
+    """Atomically adds delta to the number of running tasks of a job.
 
-  def _get_tasks_with_name(self, task_name: str) -> list[TaskEnqueued]:
-    """Returns list of tasks attached to a given name with retries."""
-    task_namespace = self._get_task_namespace()
-    return TaskEnqueued.where(task_namespace=task_namespace,
-                              task_name=task_name).all()
+    The update locks the job row until the transaction is committed, so
+    concurrent callers are serialized and each of them reads the counter
+    resulting from its own update.
 
-  def _enqueued_task_count(self):
-    task_namespace = self._get_task_namespace()
-    return TaskEnqueued.count_in_namespace(task_namespace)
+    Args:
+      job_id: Id of the job.
+      delta: Number of tasks added, negative for finished tasks.
+
+    Returns:
+      Number of running tasks after the update, floored at zero.
+    """
+    counter = cls.enqueued_workers_count
+    cls.query.filter_by(id=job_id).update(
+        {counter: case((counter + delta > 0, counter + delta), else_=0)},
+        synchronize_session=False)
+    return cls.session.query(counter).filter(cls.id == job_id).scalar()
 
   def enqueue(self,
               worker_class: str,
               worker_params: dict[str, ...],
               delay: int = 0) -> Union[TaskEnqueued, None]:
-    if self.status != Job.STATUS.RUNNING:
-      return None
-    name = str(uuid.uuid4())
-    general_settings = {gs.name: gs.value for gs in GeneralSetting.all()}
-    task_inst = task.Task(
-        name,
-        self.pipeline_id,
-        self.id,
-        worker_class,
-        worker_params,
-        general_settings)
-    task_inst.enqueue(delay)
-    crmint_logging.log_message(
-        f'Enqueued task for (worker_class, name): ({worker_class}, {name})',
-        log_level='DEBUG',
-        worker_class=self.worker_class,
-        pipeline_id=self.pipeline_id,
-        job_id=self.id)
-    return self._add_task_with_name(name)
+    tasks = self.enqueue_many([(worker_class, worker_params, delay)])
+    return tasks[0] if tasks else None
+
+  def enqueue_many(
+      self,
+      workers_to_enqueue: list[tuple[str, dict[str, ...], int]],
+  ) -> list[TaskEnqueued]:
+    """Enqueues many tasks for this job at once.
+
+    General settings are read once for all the tasks, messages are published
+    as a single batch and the enqueued tasks are recorded in one commit.
+
+    Args:
+      workers_to_enqueue: List of (worker_class, worker_params[, delay]).
+
+    Returns:
+      List of the recorded tasks, empty if the job is not running.
+
+    Raises:
+      message.PublishError: if some tasks failed to be published, in which
+        case only the published ones are recorded.
+    """
+    if self.status != Job.STATUS.RUNNING or not workers_to_enqueue:
+      return []
+    general_settings = GeneralSetting.values()
+    task_insts = []
+    publish_error = None
+    try:
+      # Not joining an outer batch, so that publish failures are known before
+      # recording the tasks.
+      with message.batch(join=False):
+        for worker_class, worker_params, *delay in workers_to_enqueue:
+          task_inst = task.Task(
+              str(uuid.uuid4()),
+              self.pipeline_id,
+              self.id,
+              worker_class,
+              worker_params,
+              general_settings)
+          task_inst.enqueue(*delay)
+          task_insts.append(task_inst)
+    except message.PublishError as e:
+      failed_names = {data['task_name'] for data, _ in e.errors}
+      task_insts = [t for t in task_insts if t.name not in failed_names]
+      publish_error = e
+    namespace = self._get_task_namespace()
+    tasks = [TaskEnqueued(task_namespace=namespace, task_name=t.name)
+             for t in task_insts]
+    extensions.db.session.add_all(tasks)
+    if tasks:
+      self.add_running_tasks(self.id, len(tasks))
+    self.commit()
+    for task_inst in task_insts:
+      crmint_logging.log_message(
+          f'Enqueued task for (worker_class, name): '
+          f'({task_inst.worker_class}, {task_inst.name})',
+          log_level='DEBUG',
+          worker_class=self.worker_class,
+          pipeline_id=self.pipeline_id,
+          job_id=self.id)
+    if publish_error is not None:
+      raise publish_error
+    return tasks
 
   def _task_finished(self,
                      task_name: str,
@@ -755,9 +1082,11 @@ class Job(extensions.db.Model):
         worker_class=self.worker_class,
         pipeline_id=self.pipeline_id,
         job_id=self.id)
+    num_deleted = TaskEnqueued.where(
+        task_namespace=self._get_task_namespace(),
+        task_name=task_name).delete()
     # Handles tasks that are not registered which should be considered an error.
-    found_tasks = self._get_tasks_with_name(task_name)
-    if not found_tasks:
+    if not num_deleted:
       crmint_logging.log_message(
         f'Unregistered task for name: {task_name}. '
         f'Setting jobs/pipeline to idle.',
@@ -767,23 +1096,14 @@ class Job(extensions.db.Model):
         job_id=self.id)
       # Clear the enqueued tasks queue for this namespace
       TaskEnqueued.delete_tasks_like_namespace(self.pipeline_id)
-      # Set the job to idle
-      self.set_status(Job.STATUS.IDLE)
+      # Set all jobs in the pipeline to idle, this job included
+      num_jobs = self.pipeline.set_job_statuses(Job.STATUS.IDLE)
       crmint_logging.log_message(
-        f'Job {self.id} has been set to IDLE.',
+        f'{num_jobs} jobs in pipeline have been set to IDLE.',
         log_level='INFO',
         worker_class=self.worker_class,
         pipeline_id=self.pipeline_id,
         job_id=self.id)
-      # Set all jobs in the pipeline to idle
-      for job in self.pipeline.jobs:
-        job.set_status(Job.STATUS.IDLE)
-        crmint_logging.log_message(
-          f'Job {job.id} in pipeline has been set to IDLE.',
-          log_level='INFO',
-          worker_class=self.worker_class,
-          pipeline_id=self.pipeline_id,
-          job_id=job.id)
       # Set the pipeline to idle
       self.pipeline.set_status(Pipeline.STATUS.IDLE)
       crmint_logging.log_message(
@@ -794,10 +1114,10 @@ class Job(extensions.db.Model):
         job_id=self.id)
       return 0
 
-    # Deletes matched tasks
-    for task_inst in found_tasks:
-      task_inst.delete()
-    num_running_tasks = self._enqueued_task_count()
+    # Deleting the task and decrementing the counter are committed together,
+    # the job row staying locked in between.
+    num_running_tasks = self.add_running_tasks(self.id, -num_deleted)
+    self.commit()
     crmint_logging.log_message(
         f'Running tasks: {num_running_tasks}',
         log_level='INFO',
@@ -806,7 +1126,8 @@ class Job(extensions.db.Model):
         job_id=self.id)
 
     # NOTE: `was_last_task_lock` acts as a kind of concurrent lock, only one
-    #       task can validate this condition.
+    #       task can validate this condition since the counter is updated
+    #       under the job row lock.
     was_last_task_lock = num_running_tasks == 0
     if not was_last_task_lock:
       return num_running_tasks
@@ -831,10 +1152,12 @@ class Job(extensions.db.Model):
     # We can safely start children jobs, because of our above concurrent lock.
     # NOTE: Only if stopping has not been triggered.
     # NOTE: And only if other jobs are still waiting.
+    dependent_ids = self.pipeline.graph.dependents(self.id)
+    statuses = self.pipeline.job_statuses()
     waiting_signal = all(
-        job.status == Job.STATUS.WAITING for job in self.dependent_jobs)
-    if self.dependent_jobs and not stopping_signal and waiting_signal:
-      self._start_dependent_jobs()
+        statuses.get(job_id) == Job.STATUS.WAITING for job_id in dependent_ids)
+    if dependent_ids and not stopping_signal and waiting_signal:
+      self._start_dependent_jobs(statuses)
       return 0
 
     self.pipeline.leaf_job_finished()
@@ -858,6 +1181,78 @@ class Job(extensions.db.Model):
     return False
 
 
+# Counter of the pipeline jobs in each status. Counters are incremented and
+# decremented by deltas, never written with absolute values, so that
+# concurrent transactions don't overwrite each other's changes:
+#   - Jobs created, deleted or changed through the ORM unit of work are
+#     counted by the flush listeners below.
+#   - Job.update_where counts the jobs it updates in bulk.
+# Other bulk statements must not change job statuses or pipelines, and jobs
+# are only deleted in bulk with their pipeline.
+_JOB_STATUS_COUNTERS = {
+    Job.STATUS.IDLE: Pipeline.idle_jobs_count,
+    Job.STATUS.WAITING: Pipeline.waiting_jobs_count,
+    Job.STATUS.RUNNING: Pipeline.running_jobs_count,
+    Job.STATUS.STOPPING: Pipeline.stopping_jobs_count,
+    Job.STATUS.SUCCEEDED: Pipeline.succeeded_jobs_count,
+    Job.STATUS.FAILED: Pipeline.failed_jobs_count,
+}
+
+
+def _value_change(obj: Job, key: str) -> tuple[..., ...]:
+  """Returns the (old, new) values of an attribute in the current flush."""
+  history = orm.attributes.get_history(obj, key)
+  if not history.has_changes():
+    value = history.unchanged[0] if history.unchanged else None
+    return value, value
+  old_value = history.deleted[0] if history.deleted else None
+  new_value = history.added[0] if history.added else None
+  return old_value, new_value
+
+
+@event.listens_for(orm.Session, 'before_flush')
+def _snapshot_deleted_jobs(session, flush_context, instances):
+  """Records the pipeline and status of deleted jobs before they vanish."""
+  del flush_context, instances  # Unused argument
+  session.info['deleted_jobs'] = [
+      (obj.pipeline_id, obj.status)
+      for obj in session.deleted if isinstance(obj, Job)]
+
+
+@event.listens_for(orm.Session, 'after_flush')
+def _update_job_status_counters(session, flush_context):
+  """Updates pipeline job counters in the transaction changing job statuses."""
+  del flush_context  # Unused argument
+  deltas = collections.Counter()
+  for pipeline_id, status in session.info.pop('deleted_jobs', []):
+    deltas[pipeline_id, status] -= 1
+  for obj in session.new:
+    if isinstance(obj, Job):
+      deltas[obj.pipeline_id, obj.status or Job.STATUS.IDLE] += 1
+  for obj in session.dirty:
+    if isinstance(obj, Job):
+      old_pipeline_id, new_pipeline_id = _value_change(obj, 'pipeline_id')
+      old_status, new_status = _value_change(obj, 'status')
+      if (old_pipeline_id, old_status) != (new_pipeline_id, new_status):
+        deltas[old_pipeline_id, old_status] -= 1
+        deltas[new_pipeline_id, new_status] += 1
+  _apply_job_status_deltas(session, deltas)
+
+
+def _apply_job_status_deltas(session: orm.Session,
+                             deltas: collections.Counter) -> None:
+  """Adds deltas to pipeline job counters, keyed by (pipeline_id, status)."""
+  values_by_pipeline = collections.defaultdict(dict)
+  for (pipeline_id, status), delta in deltas.items():
+    column = _JOB_STATUS_COUNTERS.get(status)
+    if pipeline_id is not None and column is not None and delta:
+      values_by_pipeline[pipeline_id][column] = column + delta
+  for pipeline_id, values in values_by_pipeline.items():
+    session.execute(
+        Pipeline.__table__.update().where(
+            Pipeline.id == pipeline_id).values(values))
+
+
 def _update_legacy_syntaxes(template: str) -> str:
   """Returns an updated template, using correct jinj2 engine syntax.
 
@@ -929,41 +1324,33 @@ class Param(extensions.db.Model):
     self.name = name
     self.type = param_type
 
+  @classmethod
+  def attributes_from_api(cls, arg_param):
+    """Returns the column values of a param submitted to the API."""
+    attributes = {
+        'name': arg_param['name'],
+        'label': arg_param.get('label', arg_param['name']),
+        'type': arg_param['type'],
+    }
+    if arg_param['type'] == 'boolean':
+      attributes['value'] = arg_param['value']
+    else:
+      attributes['value'] = str(arg_param['value'])
+    return attributes
+
   @classmethod
   def update_list(cls, parameters, obj=None):
-    arg_param_ids = []
+    items = []
     for arg_param in parameters:
-      param = None
-      if arg_param.get('id') is not None:
-        # Updating
-        param = Param.find(arg_param.get('id'))
-      else:
-        # Creating
-        param = Param()
-        if obj and isinstance(obj, Pipeline):
-          param.pipeline_id = obj.id
-        elif obj and isinstance(obj, Job):
-          param.job_id = obj.id
-      param.name = arg_param['name']
-      try:
-        param.label = arg_param['label']
-      except KeyError:
-        param.label = arg_param['name']
-      param.type = arg_param['type']
-      if arg_param['type'] == 'boolean':
-        param.value = arg_param['value']
-      else:
-        param.value = str(arg_param['value'])
-      param.save()
-      arg_param_ids.append(param.id)
-    # Removing
-    ids_for_removing = []
+      item = {'id': arg_param.get('id'), **cls.attributes_from_api(arg_param)}
+      if obj and isinstance(obj, Pipeline):
+        item['pipeline_id'] = obj.id
+      elif obj and isinstance(obj, Job):
+        item['job_id'] = obj.id
+      items.append(item)
     params = obj.params if obj else Param.where(pipeline_id=None,
                                                 job_id=None).all()
-    for param in params:
-      if param.id not in arg_param_ids:
-        ids_for_removing.append(param.id)
-    Param.destroy(*ids_for_removing)
+    cls.sync_many(params, items)
 
 
 class Schedule(extensions.db.Model):
@@ -979,6 +1366,87 @@ class Schedule(extensions.db.Model):
       'Pipeline', foreign_keys=[pipeline_id], back_populates='schedules')
 
 
+# Relationships are loaded with one query per relationship (`selectin`), so
+# that loading a pipeline doesn't fetch the product of its jobs, params,
+# schedules and start conditions. Load profiles only load eagerly what each
+# endpoint reads, other relationships are loaded on first access.
+# Mappers are configured first to create the `Job.pipeline` backref.
+orm.configure_mappers()
+Pipeline.__load_profiles__ = {
+    # Pipeline details, jobs being only counted.
+    'single': (
+        orm.selectinload(Pipeline.jobs).lazyload(Job.params),
+        orm.selectinload(Pipeline.jobs).lazyload(Job.start_conditions),
+        orm.selectinload(Pipeline.params),
+        orm.selectinload(Pipeline.schedules),
+    ),
+    # Jobs of a pipeline, with their params and start conditions.
+    'jobs': (
+        orm.lazyload(Pipeline.params),
+        orm.lazyload(Pipeline.schedules),
+        orm.selectinload(Pipeline.jobs).selectinload(Job.params),
+        orm.selectinload(Pipeline.jobs).selectinload(Job.start_conditions),
+    ),
+    # Everything needed to start a pipeline.
+    'start': (
+        orm.lazyload(Pipeline.schedules),
+        orm.selectinload(Pipeline.params),
+        orm.selectinload(Pipeline.jobs).selectinload(Job.params),
+        orm.selectinload(Pipeline.jobs).selectinload(Job.start_conditions),
+    ),
+    # Schedules only, to find the pipelines to start on schedule.
+    'schedules': (
+        orm.lazyload(Pipeline.jobs),
+        orm.lazyload(Pipeline.params),
+        orm.selectinload(Pipeline.schedules),
+    ),
+}
+Job.__load_profiles__ = {
+    # Job finishing a task, the other jobs being only needed when it
+    # finishes.
+    'task_result': (
+        orm.lazyload(Job.params),
+        orm.lazyload(Job.start_conditions),
+        orm.joinedload(Job.pipeline).lazyload(Pipeline.jobs),
+        orm.joinedload(Job.pipeline).lazyload(Pipeline.params),
+        orm.joinedload(Job.pipeline).lazyload(Pipeline.schedules),
+    ),
+}
+
+
+class _SettingsCache:
+  """In-process cache of the general settings values.
+
+  Values are reloaded after `ttl` seconds so that updates made by another
+  instance are eventually seen. Invalidating bumps a version, which prevents
+  a reload started before the invalidation from storing stale values.
+  """
+
+  def __init__(self, ttl: float):
+    self._ttl = ttl
+    self._lock = threading.Lock()
+    self._values = None
+    self._expires_at = 0.0
+    self._version = 0
+
+  def get(self, loader: Callable[[], dict[str, str]]) -> dict[str, str]:
+    with self._lock:
+      if self._values is not None and time.monotonic() < self._expires_at:
+        return dict(self._values)
+      version = self._version
+    values = loader()
+    with self._lock:
+      if version == self._version:
+        self._values = values
+        self._expires_at = time.monotonic() + self._ttl
+    return dict(values)
+
+  def invalidate(self) -> None:
+    with self._lock:
+      self._version += 1
+      self._values = None
+
+
 class GeneralSetting(extensions.db.Model):
   """Model to store a general setting."""
   __tablename__ = 'general_settings'
@@ -988,6 +1456,32 @@ class GeneralSetting(extensions.db.Model):
   name = Column(String(255))
   value = Column(Text())
 
+  _cache = _SettingsCache(ttl=30)
+
+  @classmethod
+  def values(cls) -> dict[str, str]:
+    """Returns the value of each general setting, keyed by name."""
+    return cls._cache.get(lambda: {gs.name: gs.value for gs in cls.all()})
+
+  @classmethod
+  def get_value(cls, name: str, default: Optional[str] = None) -> str:
+    """Returns the value of a general setting, or default if unset."""
+    value = cls.values().get(name)
+    return default if value is None else value
+
+  @classmethod
+  def invalidate_cache(cls) -> None:
+    cls._cache.invalidate()
+
+  def save(self):
+    super().save()
+    self.invalidate_cache()
+    return self
+
+  def delete(self):
+    super().delete()
+    self.invalidate_cache()
+
 
 # TODO(dulacp): deprecate the Stage model.
 class Stage(extensions.db.Model):
@@ -19,7 +19,6 @@ import json
 import os
 import textwrap
 import time
-import uuid
 
 import flask
 from flask_restful import abort
@@ -35,6 +34,7 @@ import werkzeug
 
 from common import crmint_logging
 from common import insight
+from controller import backup
 from controller import models
 from controller.cron_utils import is_valid_cron
 
@@ -103,7 +103,7 @@ class PipelineSingle(Resource):
 
   @marshal_with(pipeline_fields)
   def get(self, pipeline_id):
-    pipeline = models.Pipeline.find(pipeline_id)
+    pipeline = models.Pipeline.find(pipeline_id, profile='single')
     abort_if_pipeline_doesnt_exist(pipeline, pipeline_id)
     return pipeline
 
@@ -138,9 +138,10 @@ class PipelineSingle(Resource):
       if not is_valid_cron(cron):
         return {'message': f'Invalid cron expression: {cron}'}, 422
 
-    pipeline.assign_attributes(args)
-    pipeline.save()
-    pipeline.save_relations(args)
+    with models.Pipeline.transaction():
+      pipeline.assign_attributes(args)
+      pipeline.save()
+      pipeline.save_relations(args)
     return pipeline, 200
 
 
@@ -188,9 +189,10 @@ class PipelineList(Resource):
   def post(self):
     args = parser.parse_args()
     pipeline = models.Pipeline(name=args['name'])
-    pipeline.assign_attributes(args)
-    pipeline.save()
-    pipeline.save_relations(args)
+    with models.Pipeline.transaction():
+      pipeline.assign_attributes(args)
+      pipeline.save()
+      pipeline.save_relations(args)
     tracker = insight.GAProvider()
     tracker.track_event(category='pipelines', action='create')
     return pipeline, 201
@@ -227,29 +229,7 @@ class PipelineExport(Resource):
     tracker = insight.GAProvider()
     tracker.track_event(category='pipelines', action='export')
     pipeline = models.Pipeline.find(pipeline_id)
-    jobs = self._get_jobs(pipeline)
-
-    pipeline_params = []
-    for param in pipeline.params:
-      pipeline_params.append({
-          'name': param.name,
-          'value': param.value,
-          'type': param.type,
-      })
-
-    pipeline_schedules = []
-    for schedule in pipeline.schedules:
-      pipeline_schedules.append({
-          'cron': schedule.cron,
-      })
-
-    data = {
-        'name': pipeline.name,
-        'run_on_schedule': pipeline.run_on_schedule,
-        'jobs': jobs,
-        'params': pipeline_params,
-        'schedules': pipeline_schedules
-    }
+    data = pipeline.export_data()
 
     ts = time.time()
     pipeline_date = datetime.datetime.fromtimestamp(ts)
@@ -262,49 +242,21 @@ class PipelineExport(Resource):
         'Content-type': 'text/json'
     }
 
-  def _get_jobs(self, pipeline):
-    job_mapping = {}
-    for job in pipeline.jobs:
-      job_mapping[job.id] = uuid.uuid4().hex
-
-    jobs = []
-    for job in pipeline.jobs:
-      params = []
-      for param in job.params:
-        params.append({
-            'name': param.name,
-            'value': param.api_value,
-            'label': param.label,
-            'is_required': param.is_required,
-            'type': param.type,
-            'description': param.description
-        })
-      start_conditions = []
-      for start_condition in job.start_conditions:
-        start_conditions.append({
-            'preceding_job_id': job_mapping[start_condition.preceding_job_id],
-            'condition': start_condition.condition
-        })
-      jobs.append({
-          'id': job_mapping[job.id],
-          'name': job.name,
-          'worker_class': job.worker_class,
-          'params': params,
-          'hash_start_conditions': start_conditions
-      })
-    return jobs
-
 
 import_parser = reqparse.RequestParser()
 import_parser.add_argument(
     'upload_file',
     type=werkzeug.datastructures.FileStorage,
-    location='files'
+    location='files',
+    action='append'
 )
 
 
 class PipelineImport(Resource):
-  """Class for importing of pipeline in yaml format."""
+  """Class for importing of pipelines in json format.
+
+  Several files can be uploaded at once, all imported in one transaction.
+  """
 
   @marshal_with(pipeline_fields)
   def post(self):
@@ -313,16 +265,35 @@ class PipelineImport(Resource):
 
     args = import_parser.parse_args()
 
-    file_ = args['upload_file']
-    data = {}
-    if file_:
-      data = json.loads(file_.read())
-      pipeline = models.Pipeline(name=data['name'])
-      pipeline.save()
-      pipeline.import_data(data)
-      return pipeline, 201
+    files = args['upload_file']
+    if files:
+      documents = [json.loads(file_.read()) for file_ in files]
+      pipelines = models.Pipeline.import_many(documents)
+      if len(pipelines) == 1:
+        return pipelines[0], 201
+      return pipelines, 201
+
+    return {}
 
-    return data
+
+class PipelineBackup(Resource):
+  """Class for backing up and restoring all the pipelines in ndjson format."""
+
+  def get(self):
+    tracker = insight.GAProvider()
+    tracker.track_event(category='pipelines', action='backup')
+    return flask.Response(
+        flask.stream_with_context(backup.dump()),
+        mimetype='application/x-ndjson')
+
+  def post(self):
+    tracker = insight.GAProvider()
+    tracker.track_event(category='pipelines', action='restore')
+    try:
+      num_restored = backup.restore(flask.request.stream)
+    except (ValueError, KeyError) as e:
+      abort(400, message=f'Invalid backup: {e}')
+    return {'restored_pipelines': num_restored}, 201
 
 
 class PipelineRunOnSchedule(Resource):
@@ -432,6 +403,7 @@ api.add_resource(PipelineStart, '/pipelines/<pipeline_id>/start')
 api.add_resource(PipelineStop, '/pipelines/<pipeline_id>/stop')
 api.add_resource(PipelineExport, '/pipelines/<pipeline_id>/export')
 api.add_resource(PipelineImport, '/pipelines/import')
+api.add_resource(PipelineBackup, '/pipelines/backup')
 api.add_resource(
     PipelineRunOnSchedule,
     '/pipelines/<pipeline_id>/run_on_schedule'
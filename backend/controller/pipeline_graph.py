@@ -0,0 +1,95 @@
+# Copyright 2024 Google Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-memory index of the dependencies between the jobs of a pipeline.
+
+Start and finish decisions only need the shape of the pipeline (which jobs
+depend on which, and under which condition) and the current job statuses.
+The shape is indexed once per loaded pipeline, so that these decisions don't
+walk the ORM relationships, each walk potentially issuing lazy loads.
+"""
+
+import collections
+from typing import Iterable, Sequence
+
+
+class PipelineGraph:
+  """Directed acyclic graph of start conditions between jobs.
+
+  Attributes:
+    job_ids: Ids of all the jobs of the pipeline.
+    topological_order: Job ids ordered so that each job comes after the jobs
+      it depends on. Jobs part of a cycle come last, in their original order.
+    roots: Ids of the jobs without start conditions.
+    leaves: Ids of the jobs no other job depends on.
+    condition_types: Set of the condition types used in the pipeline.
+  """
+
+  def __init__(self,
+               job_ids: Sequence[int],
+               edges: Iterable[tuple[int, int, str]]):
+    """Indexes the jobs of a pipeline.
+
+    Args:
+      job_ids: Ids of all the jobs of the pipeline.
+      edges: List of (job_id, preceding_job_id, condition) tuples, one for
+        each start condition. Edges referencing jobs outside of the pipeline
+        are ignored.
+    """
+    self.job_ids = tuple(job_ids)
+    known_ids = set(self.job_ids)
+    conditions = collections.defaultdict(list)
+    dependents = collections.defaultdict(list)
+    condition_types = set()
+    for job_id, preceding_job_id, condition in edges:
+      if job_id not in known_ids or preceding_job_id not in known_ids:
+        continue
+      conditions[job_id].append((preceding_job_id, condition))
+      condition_types.add(condition)
+      if job_id not in dependents[preceding_job_id]:
+        dependents[preceding_job_id].append(job_id)
+    self._conditions = {k: tuple(v) for k, v in conditions.items()}
+    self._dependents = {k: tuple(v) for k, v in dependents.items()}
+    self.roots = frozenset(i for i in self.job_ids if i not in conditions)
+    self.leaves = frozenset(i for i in self.job_ids if i not in dependents)
+    self.condition_types = frozenset(condition_types)
+    self.topological_order = self._sort()
+
+  def _sort(self) -> tuple[int, ...]:
+    """Returns job ids in topological order, using Kahn's algorithm."""
+    in_degrees = {
+        job_id: len({p for p, _ in self.conditions(job_id)})
+        for job_id in self.job_ids
+    }
+    queue = collections.deque(i for i in self.job_ids if not in_degrees[i])
+    order = []
+    while queue:
+      job_id = queue.popleft()
+      order.append(job_id)
+      for dependent_id in self.dependents(job_id):
+        in_degrees[dependent_id] -= 1
+        if not in_degrees[dependent_id]:
+          queue.append(dependent_id)
+    if len(order) < len(self.job_ids):
+      sorted_ids = set(order)
+      order.extend(i for i in self.job_ids if i not in sorted_ids)
+    return tuple(order)
+
+  def conditions(self, job_id: int) -> tuple[tuple[int, str], ...]:
+    """Returns the (preceding_job_id, condition) pairs of a job."""
+    return self._conditions.get(job_id, ())
+
+  def dependents(self, job_id: int) -> tuple[int, ...]:
+    """Returns the ids of the jobs having a start condition on a job."""
+    return self._dependents.get(job_id, ())
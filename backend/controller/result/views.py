@@ -36,12 +36,11 @@ class ResultResource(Resource):
     except message.BadRequestError as e:
       return e.message, e.code
     if res.success:
-      job = models.Job.find(res.job_id)
-      for worker_enqueue_agrs in res.workers_to_enqueue:
-        job.enqueue(*worker_enqueue_agrs)
+      job = models.Job.find(res.job_id, profile='task_result')
+      job.enqueue_many(res.workers_to_enqueue)
       job.task_succeeded(res.task_name)
     else:
-      job = models.Job.find(res.job_id)
+      job = models.Job.find(res.job_id, profile='task_result')
       job.task_failed(res.task_name)
     return 'OK', 200
 
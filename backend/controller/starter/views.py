@@ -18,7 +18,6 @@ import datetime
 
 from flask import Blueprint, request
 from flask_restful import Api, Resource
-from sqlalchemy import orm
 
 from common import crmint_logging, insight, message
 from controller import cron_utils, models
@@ -33,11 +32,7 @@ class StarterResource(Resource):
   def _start_scheduled_pipelines(self):
     """Finds and tries starting the pipelines scheduled to be executed now."""
     now_dt = datetime.datetime.utcnow()
-    scheduled_pipelines = models.Pipeline.query.options(
-      orm.lazyload(models.Pipeline.jobs),
-      orm.lazyload(models.Pipeline.params),
-      orm.joinedload(models.Pipeline.schedules)
-    ).filter_by(
+    scheduled_pipelines = models.Pipeline.with_profile('schedules').filter_by(
       run_on_schedule=True
     ).all()
     pipelines_to_start = [
@@ -50,7 +45,7 @@ class StarterResource(Resource):
   def _start_pipelines(self, pipeline_ids):
     """Tries finding and starting pipelines with IDs specified."""
     for pipeline_id in pipeline_ids:
-      pipeline = models.Pipeline.query.get(pipeline_id)
+      pipeline = models.Pipeline.find(pipeline_id, profile='start')
       if pipeline:
         pipeline.start()
 
@@ -78,7 +78,7 @@ class Configuration(Resource):
     settings = models.GeneralSetting.query.order_by(models.GeneralSetting.name)
 
     # Get client id and secret from input fields stored in database
-    client_id = models.GeneralSetting.where(name='client_id').first().value
+    client_id = models.GeneralSetting.get_value('client_id')
     # Url to redirect
     url = ads_auth_code.get_url(client_id)
 
@@ -110,9 +110,8 @@ class GeneralSettingsRoute(Resource):
   def put(self):
     args = settings_parser.parse_args()
     # Get client id and secret from input fields stored in database
-    client_id = models.GeneralSetting.where(name='client_id').first().value
-    client_secret = models.GeneralSetting.where(
-        name='client_secret').first().value
+    client_id = models.GeneralSetting.get_value('client_id')
+    client_secret = models.GeneralSetting.get_value('client_secret')
 
     # Gets value from the google_ads_authentication_code field
     ads_code = [d['value'] for d in args['settings']
@@ -122,17 +121,23 @@ class GeneralSettingsRoute(Resource):
     else:
       token = None
 
+    names = [arg['name'] for arg in args['settings']]
+    query = models.GeneralSetting.query.filter(
+        models.GeneralSetting.name.in_(names))
+    settings_by_name = {setting.name: setting for setting in query}
     settings = []
     for arg in args['settings']:
-      setting = models.GeneralSetting.where(name=arg['name']).first()
+      setting = settings_by_name.get(arg['name'])
       if setting:
         if setting.name == 'google_ads_refresh_token' and token:
-          setting.update(value=token)
+          setting.value = token
         elif setting.name == 'google_ads_authentication_code':
-          setting.update(value='')
+          setting.value = ''
         else:
-          setting.update(value=arg['value'])
+          setting.value = arg['value']
       settings.append(setting)
+    models.GeneralSetting.commit()
+    models.GeneralSetting.invalidate_cache()
     return settings
 
 
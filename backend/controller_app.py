@@ -18,10 +18,12 @@ import signal
 import sys
 import types
 
+import flask
 import flask_tasks
 from common import auth_filter
 from common import crmint_logging
 from common import message
+from common import warmup
 from controller import app as app_factory
 from controller import database
 
@@ -30,12 +32,24 @@ flask_tasks.add(app)
 auth_filter.add(app)
 
 
+@app.route('/_ah/warmup', methods=['GET'])
+def warmup_instance():
+  """Creates clients and database connections before the first requests."""
+  timings = warmup.run([
+      ('logging', crmint_logging.get_logger),
+      ('pubsub', message.get_publisher_client),
+      ('database', lambda: database.warmup(app)),
+  ])
+  return flask.jsonify(timings), 200
+
+
 def shutdown_handler(sig: int, frame: types.FrameType) -> None:
   """Gracefully shuts down the instance.
 
   Within the 3 seconds window, try to do as much as possible:
     1. Commit all pending Pub/Sub messages (as much as possible).
     2. Drop all connections to the database.
+    3. Write all buffered log messages (as much as possible).
 
   You can read more about this practice:
   https://cloud.google.com/blog/topics/developers-practitioners/graceful-shutdowns-cloud-run-deep-dive.
@@ -50,6 +64,7 @@ def shutdown_handler(sig: int, frame: types.FrameType) -> None:
       log_level='WARNING')
   message.shutdown()
   database.shutdown(app)
+  crmint_logging.flush(timeout=1.0)
   sys.exit(0)
 
 
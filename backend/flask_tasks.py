@@ -16,6 +16,7 @@ import json
 
 import click
 
+from controller import backup
 from controller import database
 from controller import models
 
@@ -34,9 +35,23 @@ def add(app):
   @app.cli.command()
   @click.argument('files', nargs=-1)
   def import_pipelines(files):
+    """Import pipelines from exported files, in a single transaction."""
+    documents = []
     for filename in files:
       with open(filename) as f:
-        data = json.loads(f.read())
-        pipeline = models.Pipeline(name=data['name'])
-        pipeline.save()
-        pipeline.import_data(data)
+        documents.append(json.loads(f.read()))
+    pipelines = models.Pipeline.import_many(documents)
+    click.echo(f'Imported {len(pipelines)} pipelines.')
+
+  @app.cli.command()
+  @click.argument('output', type=click.File('w'))
+  def backup_pipelines(output):
+    """Write all the pipelines and global variables as ndjson."""
+    output.writelines(backup.dump())
+
+  @app.cli.command()
+  @click.argument('input_', metavar='INPUT', type=click.File('r'))
+  def restore_pipelines(input_):
+    """Restore pipelines and global variables written by backup-pipelines."""
+    num_restored = backup.restore(input_)
+    click.echo(f'Restored {num_restored} pipelines.')
@@ -0,0 +1,162 @@
+# Copyright 2024 Google Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pulls tasks from Pub/Sub and executes them on a bounded pool of threads.
+
+This is an alternative to the `/push/start-task` endpoint of the jobs app,
+where each task runs in the thread of a push request. A single long-lived
+puller process can execute many I/O-bound tasks (e.g. waiters) concurrently:
+
+  - Pub/Sub flow control bounds the number of tasks leased at once to the
+    number of executor threads, so tasks never wait for a thread while their
+    lease is running.
+  - The Pub/Sub client extends the lease of tasks running for a long time,
+    up to `max_lease_duration` seconds.
+  - Concurrency can be capped per worker class. Tasks above their cap are
+    released to be delivered again a bit later, possibly to another instance.
+  - Delayed tasks received too early are released to be delivered again
+    when due, or in `MAX_ACK_DEADLINE` seconds for longer delays.
+"""
+
+from concurrent import futures
+import datetime
+import math
+import threading
+from typing import Mapping, Optional
+
+from google.cloud import pubsub_v1
+from google.cloud.pubsub_v1.subscriber import message as pubsub_message
+from google.cloud.pubsub_v1.subscriber import scheduler
+
+from common import crmint_logging
+from common import message
+from common import task
+from jobs import runner
+
+
+class TaskPuller:
+  """Executes tasks pulled from a Pub/Sub subscription."""
+
+  # Bounds of the ack deadlines accepted by Pub/Sub, in seconds.
+  MIN_ACK_DEADLINE = 10
+  MAX_ACK_DEADLINE = 600
+
+  # Seconds before a task above its worker class limit is delivered again.
+  WORKER_CLASS_LIMIT_BACKOFF = 10
+
+  def __init__(self,
+               subscription_path: str,
+               *,
+               max_workers: int = 16,
+               worker_class_limits: Optional[Mapping[str, int]] = None,
+               max_lease_duration: int = 3600,
+               subscriber: Optional[pubsub_v1.SubscriberClient] = None):
+    """Creates a task puller.
+
+    Args:
+      subscription_path: Path of a pull subscription to the
+        `crmint-start-task` topic (e.g.
+        `projects/my-project/subscriptions/crmint-start-task-pull`).
+      max_workers: Maximum number of tasks executed concurrently.
+      worker_class_limits: Mapping from worker class names to the maximum
+        number of their tasks executed concurrently. Worker classes missing
+        from the mapping are only bounded by `max_workers`.
+      max_lease_duration: Maximum number of seconds a task lease is extended
+        while its execution is running.
+      subscriber: Pub/Sub subscriber client, created if None.
+    """
+    self._subscription_path = subscription_path
+    self._max_workers = max_workers
+    self._max_lease_duration = max_lease_duration
+    self._subscriber = subscriber or pubsub_v1.SubscriberClient()
+    self._semaphores = {
+        name: threading.BoundedSemaphore(limit)
+        for name, limit in (worker_class_limits or {}).items()
+    }
+    self._streaming_pull_future = None
+
+  def start(self) -> futures.Future:
+    """Starts pulling tasks in background threads.
+
+    Returns:
+      Future resolved when the puller stops, raising if pulling failed.
+    """
+    executor = futures.ThreadPoolExecutor(
+        max_workers=self._max_workers, thread_name_prefix='crmint-task')
+    flow_control = pubsub_v1.types.FlowControl(
+        max_messages=self._max_workers,
+        max_lease_duration=self._max_lease_duration)
+    self._streaming_pull_future = self._subscriber.subscribe(
+        self._subscription_path,
+        callback=self.process_message,
+        flow_control=flow_control,
+        scheduler=scheduler.ThreadScheduler(executor),
+        await_callbacks_on_shutdown=True)
+    crmint_logging.log_global_message(
+        f'Pulling tasks from {self._subscription_path} with '
+        f'{self._max_workers} workers.',
+        log_level='INFO')
+    return self._streaming_pull_future
+
+  def stop(self) -> None:
+    """Stops pulling new tasks and waits for the running ones."""
+    if self._streaming_pull_future is not None:
+      self._streaming_pull_future.cancel()
+      # Resolved once the running callbacks are done.
+      self._streaming_pull_future.result()
+      self._streaming_pull_future = None
+
+  def process_message(self, msg: pubsub_message.Message) -> None:
+    """Executes the task of a message, called by the Pub/Sub client."""
+    try:
+      task_inst = task.Task.from_data(
+          message.decode_data(msg.data, msg.attributes))
+    except message.TooEarlyError as e:
+      delay = e.scheduled_time - datetime.datetime.utcnow()
+      self._postpone(msg, delay.total_seconds())
+      return
+    except (message.BadRequestError, KeyError):
+      crmint_logging.log_global_message(
+          f'Dropped invalid task message: {msg.message_id}',
+          log_level='ERROR')
+      msg.ack()
+      return
+
+    semaphore = self._semaphores.get(task_inst.worker_class)
+    if semaphore is not None and not semaphore.acquire(blocking=False):
+      self._postpone(msg, self.WORKER_CLASS_LIMIT_BACKOFF)
+      return
+    try:
+      runner.run_task(task_inst)
+    except Exception:  # pylint: disable=broad-except
+      # Same as an error status on the push endpoint, Pub/Sub redelivers.
+      msg.nack()
+      raise
+    else:
+      msg.ack()
+    finally:
+      if semaphore is not None:
+        semaphore.release()
+
+  def _postpone(self, msg: pubsub_message.Message, seconds: float) -> None:
+    """Releases a message to be delivered again in about `seconds`.
+
+    Nacked messages are delivered again at once unless the subscription has
+    a retry policy, instead the lease is set to expire after the delay.
+    """
+    deadline = min(max(math.ceil(seconds), self.MIN_ACK_DEADLINE),
+                   self.MAX_ACK_DEADLINE)
+    msg.modify_ack_deadline(deadline)
+    # Stops extending the lease, so that it expires at the new deadline.
+    msg.drop()
@@ -0,0 +1,74 @@
+# Copyright 2024 Google Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Executes tasks received by the jobs service, whatever their delivery."""
+
+import traceback
+
+from common import crmint_logging
+from common import result
+from common import task
+from jobs.workers import finder
+from jobs.workers import worker
+
+
+def run_task(task_inst: task.Task) -> None:
+  """Executes a task and reports its result to the controller.
+
+  Tasks failing with an unexpected error are enqueued again until the worker
+  reaches its maximum number of attempts.
+
+  Args:
+    task_inst: Task to execute.
+  """
+  crmint_logging.log_message(
+      f'Starting task for name: {task_inst.name}',
+      log_level='DEBUG',
+      worker_class=task_inst.worker_class,
+      pipeline_id=task_inst.pipeline_id,
+      job_id=task_inst.job_id)
+
+  worker_class = finder.get_worker_class(task_inst.worker_class)
+  worker_params = task_inst.worker_params.copy()
+  for setting in worker_class.GLOBAL_SETTINGS:
+    worker_params[setting] = task_inst.general_settings[setting]
+  worker_inst = worker_class(
+      worker_params, task_inst.pipeline_id, task_inst.job_id)
+
+  try:
+    workers_to_enqueue = worker_inst.execute()
+    crmint_logging.log_message(
+        f'Executed task for name: {task_inst.name}',
+        log_level='DEBUG',
+        worker_class=task_inst.worker_class,
+        pipeline_id=task_inst.pipeline_id,
+        job_id=task_inst.job_id)
+  except worker.WorkerException as e:
+    class_name = e.__class__.__name__
+    worker_inst.log_error(f'Execution failed: {class_name}: {e}')
+    result_inst = result.Result(task_inst.name, task_inst.job_id, False)
+    result_inst.report()
+  except Exception:  # pylint: disable=broad-except
+    formatted_exception = traceback.format_exc()
+    worker_inst.log_error(f'Unexpected error {formatted_exception}')
+    if task_inst.attempts < worker_inst.MAX_ATTEMPTS:
+      task_inst.reenqueue()
+    else:
+      worker_inst.log_error(f'Giving up after {task_inst.attempts} attempt(s)')
+      result_inst = result.Result(task_inst.name, task_inst.job_id, False)
+      result_inst.report()
+  else:
+    result_inst = result.Result(
+        task_inst.name, task_inst.job_id, True, workers_to_enqueue)
+    result_inst.report()
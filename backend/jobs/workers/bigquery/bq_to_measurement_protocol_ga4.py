@@ -19,32 +19,192 @@ need credentials to authenticate calls, instead it uses a secret key to
 control access.
 """
 
+from concurrent import futures
 import json
 import math
-import string
+import threading
+import time
+from typing import Any, Iterable, Optional
 import urllib
+import uuid
 
-from google.api_core import page_iterator
+from google.cloud import storage
 import requests
+from requests import adapters
+from urllib3.util import retry
 
+from jobs.workers import clients
+from jobs.workers import json_template
 from jobs.workers import worker
+from jobs.workers.bigquery import bq_utils
 from jobs.workers.bigquery import bq_worker
 from jobs.workers.ga import ga_utils
 
+# Maximum number of events accepted by the Measurement Protocol in one request.
+# https://developers.google.com/analytics/devguides/collection/protocol/ga4/sending-events#limitations
+MP_MAX_EVENTS_PER_REQUEST = 25
+
+# Maximum size of the body of a Measurement Protocol request, in bytes.
+MP_MAX_REQUEST_BYTES = 130000
+
+
+def _group_payloads(
+    payloads: list[dict[str, Any]],
+    max_events: int,
+    max_bytes: int = MP_MAX_REQUEST_BYTES) -> list[dict[str, Any]]:
+  """Merges payloads sent on behalf of the same user into multi-event payloads.
+
+  Payloads are merged when all their top-level fields but `events` are
+  identical (e.g. same `client_id`, `user_id`, `timestamp_micros` and user
+  properties), since the Measurement Protocol applies these fields to every
+  event of a request. The order in which payloads are first seen is preserved.
+  Payloads without events are left as they are.
+
+  Args:
+    payloads: List of rendered Measurement Protocol payloads.
+    max_events: Maximum number of events to pack in one payload.
+    max_bytes: Maximum size of a merged payload encoded in JSON. A payload
+      with a single event above this size is still sent on its own.
+
+  Returns:
+    List of payloads with at most `max_events` events each.
+  """
+  groups = {}
+  for index, payload in enumerate(payloads):
+    events = payload.get('events', None)
+    if not isinstance(events, list) or not events:
+      groups[index] = (payload, None)
+      continue
+    shared_fields = {k: v for k, v in payload.items() if k != 'events'}
+    key = json.dumps(shared_fields, sort_keys=True)
+    if key not in groups:
+      groups[key] = (payload, [])
+    groups[key][1].extend(events)
+  batched_payloads = []
+  for first_payload, events in groups.values():
+    if events is None:
+      batched_payloads.append(first_payload)
+      continue
+    batch_bytes = base_bytes = len(json.dumps(dict(first_payload, events=[])))
+    batch = []
+    for event in events:
+      # Events are separated by a comma and a space in the encoded payload.
+      event_bytes = len(json.dumps(event)) + 2
+      if batch and (len(batch) >= max_events
+                    or batch_bytes + event_bytes > max_bytes):
+        batched_payloads.append(dict(first_payload, events=batch))
+        batch_bytes, batch = base_bytes, []
+      batch.append(event)
+      batch_bytes += event_bytes
+    batched_payloads.append(dict(first_payload, events=batch))
+  return batched_payloads
+
+
+class _TokenBucket:
+  """Thread-safe token bucket limiting the rate of outgoing requests."""
+
+  def __init__(self, rate: float, capacity: Optional[float] = None):
+    """Creates a token bucket.
+
+    Args:
+      rate: Number of tokens added per second. A non-positive rate disables
+        the rate limiting.
+      capacity: Maximum number of tokens to accumulate. Defaults to `rate`,
+        allowing bursts of up to one second worth of requests.
+    """
+    self._rate = rate
+    self._capacity = capacity or max(rate, 1)
+    self._tokens = self._capacity
+    self._last_refill = time.monotonic()
+    self._lock = threading.Lock()
+
+  def acquire(self) -> None:
+    """Blocks until a token is available and consumes it."""
+    if self._rate <= 0:
+      return
+    while True:
+      with self._lock:
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._tokens = min(self._capacity, self._tokens + elapsed * self._rate)
+        self._last_refill = now
+        if self._tokens >= 1:
+          self._tokens -= 1
+          return
+        wait_time = (1 - self._tokens) / self._rate
+      time.sleep(wait_time)
+
+
+class _ShardCheckpoint:
+  """Progress of a shard of requests persisted in Cloud Storage.
+
+  Objects are stored under `<folder>/<run_id>/shard-<start_index>/`:
+    - `checkpoint.json` holds the index of the next request to send, in the
+      deterministic order of the batched payloads of the shard.
+    - `errors-<request_index>.ndjson` holds the payloads which failed to be
+      sent in the chunk of requests starting at `request_index`, along with
+      the error message. Naming errors files after their chunk ensures that
+      a retried chunk overwrites its errors instead of duplicating them.
+  """
+
+  def __init__(self,
+               client: storage.Client,
+               folder_uri: str,
+               run_id: str,
+               start_index: int):
+    bucket_name, _, prefix = folder_uri.removeprefix('gs://').partition('/')
+    self._bucket = client.bucket(bucket_name)
+    self._prefix = '/'.join(
+        p for p in (prefix.strip('/'), run_id, f'shard-{start_index}') if p)
+    self.uri = f'gs://{bucket_name}/{self._prefix}'
+
+  def load(self) -> tuple[int, int]:
+    """Returns the next request index and the number of failed requests."""
+    blob = self._bucket.get_blob(f'{self._prefix}/checkpoint.json')
+    if blob is None:
+      return 0, 0
+    state = json.loads(blob.download_as_text())
+    return state['next_request_index'], state['failed_requests']
+
+  def save(self, next_request_index: int, failed_requests: int) -> None:
+    blob = self._bucket.blob(f'{self._prefix}/checkpoint.json')
+    blob.upload_from_string(
+        json.dumps({
+            'next_request_index': next_request_index,
+            'failed_requests': failed_requests,
+        }),
+        content_type='application/json')
+
+  def record_failures(self,
+                      request_index: int,
+                      failures: list[tuple[dict[str, Any], str]]) -> None:
+    blob = self._bucket.blob(
+        f'{self._prefix}/errors-{request_index:06d}.ndjson')
+    blob.upload_from_string(
+        ''.join(json.dumps({'payload': payload, 'error': error}) + '\n'
+                for payload, error in failures),
+        content_type='application/x-ndjson')
+
 
 class BQToMeasurementProtocolGA4(bq_worker.BQWorker):
   """Reads a BigQuery table of arbitraty size and schedule processing tasks.
 
-  This worker reads the table by chunks of `BQ_BATCH_SIZE` rows and feed these
-  rows into a processing worker of type `BQToMeasurementProtocolProcessorGA4`.
-  This ensures that we never timeout on large tables, especially since Pub/Sub
-  might be very sensitive to long running tasks not returning a status quickly
-  enough.
+  This worker splits the table into shards of `BQ_BATCH_SIZE` rows and feeds
+  each shard into a processing worker of type
+  `BQToMeasurementProtocolProcessorGA4`, addressed by its starting row index.
+  Shards are planned from the table row count alone, so scheduling never reads
+  the table rows themselves. This ensures that we never timeout on large
+  tables, especially since Pub/Sub might be very sensitive to long running
+  tasks not returning a status quickly enough.
+
+  If the table has more than `MAX_ENQUEUED_JOBS` shards, we stop enqueuing new
+  processing tasks and schedule a new `BQToMeasurementProtocolGA4` worker with
+  the `bq_start_index` parameter pointing to the next shard to schedule. This
+  keeps the size of the result message reported to the controller bounded.
 
-  If we enqueued more than `MAX_ENQUEUED_JOBS` processing tasks, we stop
-  enqueuing new processing tasks and schedule a new `BQToMeasurementProtocolGA4`
-  worker with the `bq_page_token` parameter pointing to the next page to read
-  from. This also ensures that we never timeout on large tables.
+  When `mp_checkpoint_uri` is set, processing tasks checkpoint their progress
+  in this Cloud Storage folder (see `BQToMeasurementProtocolProcessorGA4`),
+  under a run identifier generated once per execution of the scheduler.
   """
 
   PARAMS = [
@@ -59,6 +219,13 @@ class BQToMeasurementProtocolGA4(bq_worker.BQWorker):
                                       'JSON template')),
       ('mp_batch_size', 'number', True, 20, ('Measurement Protocol '
                                              'batch size')),
+      ('mp_max_concurrent_requests', 'number', False, 10,
+       'Measurement Protocol maximum number of concurrent requests'),
+      ('mp_max_requests_per_second', 'number', False, 100,
+       'Measurement Protocol maximum requests per second (0 for no limit)'),
+      ('mp_checkpoint_uri', 'string', False, '',
+       ('Cloud Storage folder for progress checkpoints and failed hits '
+        '(e.g. gs://bucket/mp-checkpoints)')),
       ('debug', 'boolean', True, False, 'Debug mode'),
   ]
 
@@ -66,49 +233,110 @@ class BQToMeasurementProtocolGA4(bq_worker.BQWorker):
   BQ_BATCH_SIZE = 1000
 
   # Maximum number of jobs to enqueued before spawning a new scheduler.
-  MAX_ENQUEUED_JOBS = 50
+  MAX_ENQUEUED_JOBS = 500
 
   def _execute(self) -> None:
-    client = self._get_client()
-    bq_project_id = self._params['bq_project_id']
-    bq_dataset_id = self._params['bq_dataset_id']
-    dataset = client.get_dataset(f'{bq_project_id}.{bq_dataset_id}')
-    page_token = self._params.get('bq_page_token', None)
-    row_iterator = client.list_rows(
-        dataset.table(self._params['bq_table_id']),
-        page_token=page_token,
-        page_size=self.BQ_BATCH_SIZE)
+    # Schedulers enqueued before shards were addressed by row index carry a
+    # page token, which can't be mapped to the index of its first row.
+    if (self._params.get('bq_page_token', None)
+        and 'bq_start_index' not in self._params):
+      raise worker.WorkerException(
+          'Cannot schedule the remaining rows from a legacy page token, '
+          'the rows from this page to the end of the table were not sent.')
+    num_rows = self._params.get('bq_num_rows', None)
+    if num_rows is None:
+      client = self._get_client()
+      table = client.get_table(f'{self._params["bq_project_id"]}.'
+                               f'{self._params["bq_dataset_id"]}.'
+                               f'{self._params["bq_table_id"]}')
+      num_rows = table.num_rows or 0
+      self.log_info(f'Scheduling {num_rows} rows to be processed in shards '
+                    f'of {self.BQ_BATCH_SIZE} rows')
+
+    # Identifies this run in checkpoints, continuation schedulers reuse it.
+    if not self._params.get('mp_run_id'):
+      self._params['mp_run_id'] = uuid.uuid4().hex
 
+    start_index = self._params.get('bq_start_index', None) or 0
     enqueued_jobs_count = 0
-    for _ in row_iterator.pages:
-      # Enqueue job for this page
+    for shard_index in range(start_index, num_rows, self.BQ_BATCH_SIZE):
+      # Spawns a new job to schedule the remaining shards.
+      if enqueued_jobs_count >= self.MAX_ENQUEUED_JOBS:
+        worker_params = self._params.copy()
+        worker_params['bq_num_rows'] = num_rows
+        worker_params['bq_start_index'] = shard_index
+        self._enqueue(self.__class__.__name__, worker_params, 0)
+        return
+
+      # Enqueue job for this shard
       worker_params = self._params.copy()
-      worker_params['bq_page_token'] = page_token
+      worker_params['bq_start_index'] = shard_index
       worker_params['bq_batch_size'] = self.BQ_BATCH_SIZE
       self._enqueue('BQToMeasurementProtocolProcessorGA4', worker_params, 0)
       enqueued_jobs_count += 1
 
-      # Updates the page token reference for the next iteration.
-      page_token = row_iterator.next_page_token
-
-      # Spawns a new job to schedule the remaining pages.
-      if (enqueued_jobs_count >= self.MAX_ENQUEUED_JOBS
-          and page_token is not None):
-        worker_params = self._params.copy()
-        worker_params['bq_page_token'] = page_token
-        self._enqueue(self.__class__.__name__, worker_params, 0)
-        return
-
 
 class BQToMeasurementProtocolProcessorGA4(bq_worker.BQWorker):
   """Reads the provided table chunk and stream it to Measurement Protocol API.
 
-  A chunk is fully determined by two parameters: `bq_page_token` and
+  A chunk is fully determined by two parameters: `bq_start_index` and
   `bq_batch_size`. This worker will read this given chunk and stream its
   content to the Measurement Protocol API for GA4 Properties.
+
+  Rows rendered for the same user are merged into multi-event requests of at
+  most `mp_batch_size` events (capped to the API limit of 25 events). Requests
+  are sent concurrently over a pool of keep-alive connections, with at most
+  `mp_max_concurrent_requests` requests in flight and a rate limited to
+  `mp_max_requests_per_second`. Throttled (429) and server errors (5xx) are
+  retried with an exponential backoff.
+
+  If `mp_checkpoint_uri` is set, requests are sent in chunks of
+  `CHECKPOINT_INTERVAL` requests and the progress is saved in Cloud Storage
+  after each chunk, so that a retried task resumes from the last completed
+  chunk instead of sending the same hits twice. Requests rejected by the API
+  are then recorded in NDJSON files next to the checkpoint instead of failing
+  the task. Without checkpoints, the first rejected request fails the task.
   """
 
-  def _send_payload(self, payload, url_param) -> None:
+  # Attempts of tasks hitting unexpected errors (e.g. connection errors) when
+  # checkpoints are enabled, each retry resuming from the last checkpoint.
+  # Without checkpoints a retry would send again the hits already sent, so
+  # tasks are then attempted once.
+  CHECKPOINTED_MAX_ATTEMPTS = 3
+
+  # Number of requests sent between two checkpoints.
+  CHECKPOINT_INTERVAL = 100
+
+  # Defaults used for tasks enqueued before these parameters existed.
+  DEFAULT_MAX_CONCURRENT_REQUESTS = 10
+  DEFAULT_MAX_REQUESTS_PER_SECOND = 100
+
+  # Retry policy for throttled and failing Measurement Protocol requests.
+  MAX_RETRIES = 5
+  RETRY_BACKOFF_FACTOR = 0.5
+  RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+  def _get_session(self, max_concurrency: int) -> requests.Session:
+    """Returns an HTTP session pooling up to `max_concurrency` connections."""
+    retry_policy = retry.Retry(
+        total=self.MAX_RETRIES,
+        backoff_factor=self.RETRY_BACKOFF_FACTOR,
+        status_forcelist=self.RETRY_STATUS_CODES,
+        allowed_methods=frozenset(['POST']),
+        respect_retry_after_header=True,
+        raise_on_status=False)
+    adapter = adapters.HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=max_concurrency,
+        max_retries=retry_policy)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    return session
+
+  def _send_payload(self,
+                    session: requests.Session,
+                    payload: dict[str, Any],
+                    url_param: str) -> None:
     if self._params['debug']:
       domain = 'https://www.google-analytics.com/debug/mp/collect'
     else:
@@ -118,9 +346,9 @@ class BQToMeasurementProtocolProcessorGA4(bq_worker.BQWorker):
         url_param: self._params['measurement_id'],
         'api_secret': self._params['api_secret'],
     })
-    response = requests.post(f'{domain}?{querystring}',
-                             data=json.dumps(payload),
-                             headers={'content-type': 'application/json'})
+    response = session.post(f'{domain}?{querystring}',
+                            data=json.dumps(payload),
+                            headers={'content-type': 'application/json'})
     if self._params['debug']:
       for msg in response.json()['validationMessages']:
         self.log_warn(f'Validation Message: {msg["description"]}, '
@@ -131,7 +359,10 @@ class BQToMeasurementProtocolProcessorGA4(bq_worker.BQWorker):
                                      f'({response.status_code}) and '
                                      f'parameters: {payload}')
 
-  def _stream_rows(self, page: page_iterator.Page, url_param: str) -> None:
+  def _stream_rows(self,
+                   rows: Iterable[dict[str, Any]],
+                   url_param: str,
+                   checkpoint: Optional[_ShardCheckpoint] = None) -> None:
     # Warns users if they are using an unsupported formatting syntax.
     if '%(' in self._params['template']:
       self.log_warn(
@@ -139,30 +370,113 @@ class BQToMeasurementProtocolProcessorGA4(bq_worker.BQWorker):
           'please update to the Template Strings syntax: '
           'https://docs.python.org/3/library/string.html#template-strings.')
 
-    # TODO(dulacp): Migrate to jinja2 templates, will help for batches
-    # TODO(dulacp): Implement batches to optimize the overall upload duration.
-    num_rows = page.num_items
-    template = string.Template(self._params['template'])
-    for idx, row in enumerate(page):
-      payload = template.substitute(dict(row.items()))
-      self._send_payload(json.loads(payload), url_param)
-      if idx % (math.ceil(num_rows / 10)) == 0:
-        progress = idx / num_rows
-        self.log_info(f'Completed {progress:.2%} of the measurement '
-                      f'protocol hits')
+    template = json_template.JSONTemplate(self._params['template'])
+    payloads = [template.render(row) for row in rows]
+    max_events = min(int(self._params['mp_batch_size']),
+                     MP_MAX_EVENTS_PER_REQUEST)
+    batched_payloads = _group_payloads(payloads, max(max_events, 1))
+    num_requests = len(batched_payloads)
+    self.log_info(f'Sending {len(payloads)} rows in {num_requests} '
+                  f'measurement protocol requests')
+    max_concurrency = max(int(self._params.get(
+        'mp_max_concurrent_requests',
+        self.DEFAULT_MAX_CONCURRENT_REQUESTS)), 1)
+    rate_limiter = _TokenBucket(float(self._params.get(
+        'mp_max_requests_per_second',
+        self.DEFAULT_MAX_REQUESTS_PER_SECOND)))
+
+    if checkpoint is None:
+      next_request_index, failed_requests = 0, 0
+      chunk_size = max(num_requests, 1)
+    else:
+      next_request_index, failed_requests = checkpoint.load()
+      chunk_size = self.CHECKPOINT_INTERVAL
+      if next_request_index:
+        self.log_info(f'Resuming from request {next_request_index} out of '
+                      f'{num_requests} with checkpoint at {checkpoint.uri}')
+
+    with self._get_session(max_concurrency) as session:
+
+      def send(payload: dict[str, Any]) -> None:
+        rate_limiter.acquire()
+        self._send_payload(session, payload, url_param)
+
+      executor = futures.ThreadPoolExecutor(max_workers=max_concurrency)
+      try:
+        for chunk_index in range(next_request_index, num_requests, chunk_size):
+          chunk = batched_payloads[chunk_index:chunk_index + chunk_size]
+          pending = {executor.submit(send, p): p for p in chunk}
+          failures = []
+          for idx, future in enumerate(futures.as_completed(pending),
+                                       start=chunk_index):
+            try:
+              future.result()
+            except worker.WorkerException as e:
+              if checkpoint is None:
+                raise
+              failures.append((pending[future], str(e)))
+            if idx % (math.ceil(num_requests / 10)) == 0:
+              progress = idx / num_requests
+              self.log_info(f'Completed {progress:.2%} of the measurement '
+                            f'protocol hits')
+          if checkpoint is not None:
+            if failures:
+              checkpoint.record_failures(chunk_index, failures)
+              failed_requests += len(failures)
+            checkpoint.save(chunk_index + len(chunk), failed_requests)
+      finally:
+        # Stops sending the remaining requests if one of them failed.
+        executor.shutdown(wait=True, cancel_futures=True)
+    if failed_requests:
+      self.log_warn(f'{failed_requests} measurement protocol requests failed, '
+                    f'see errors recorded at {checkpoint.uri}')
     self.log_info('Done with measurement protocol hits.')
 
+  @property
+  def MAX_ATTEMPTS(self) -> int:  # pylint: disable=invalid-name
+    if self._has_checkpoints():
+      return self.CHECKPOINTED_MAX_ATTEMPTS
+    return 1
+
+  def _has_checkpoints(self) -> bool:
+    # Checkpoints are only valid within the run which planned the shards.
+    return bool(self._params.get('mp_checkpoint_uri', None) and
+                self._params.get('mp_run_id', None))
+
+  def _get_checkpoint(self) -> Optional[_ShardCheckpoint]:
+    """Returns the checkpoint of this shard, None if checkpoints are disabled."""
+    if not self._has_checkpoints():
+      if self._params.get('mp_checkpoint_uri', None):
+        self.log_warn('Checkpoints disabled, the task has no run id.')
+      return None
+    return _ShardCheckpoint(clients.get_client(storage.Client),
+                            self._params['mp_checkpoint_uri'],
+                            self._params['mp_run_id'],
+                            self._params.get('bq_start_index', None) or 0)
+
   def _execute(self) -> None:
     client = self._get_client()
     dataset = client.get_dataset(
         f'{self._params["bq_project_id"]}.{self._params["bq_dataset_id"]}')
-    row_iterator = client.list_rows(
-        dataset.table(self._params['bq_table_id']),
-        page_token=self._params.get('bq_page_token', None),
-        page_size=self._params['bq_batch_size'])
     url_param = ga_utils.get_url_param_by_id(self._params['measurement_id'])
-    # We are only interested in the first page results, since our chunk is
-    # fully specicifed by (page_token, batch_size). The next page will be
-    # processed by another processing instance.
-    first_page = next(row_iterator.pages)
-    self._stream_rows(first_page, url_param)
+    if ('bq_page_token' in self._params
+        and 'bq_start_index' not in self._params):
+      # Tasks enqueued before shards were addressed by row index read the
+      # page of their token instead.
+      row_iterator = client.list_rows(
+          dataset.table(self._params['bq_table_id']),
+          page_token=self._params['bq_page_token'],
+          page_size=self._params['bq_batch_size'])
+      rows = [dict(row.items()) for row in next(row_iterator.pages)]
+      self._stream_rows(rows, url_param)
+      return
+    # Our chunk is fully specified by (start_index, batch_size), the next
+    # chunks are processed by other processing instances.
+    rows = bq_utils.read_rows(
+        client,
+        dataset.table(self._params['bq_table_id']),
+        start_index=self._params.get('bq_start_index', None) or 0,
+        max_results=self._params['bq_batch_size'],
+        page_size=self._params['bq_batch_size'],
+        num_rows=self._params.get('bq_num_rows', None))
+    self._stream_rows(rows, url_param, self._get_checkpoint())
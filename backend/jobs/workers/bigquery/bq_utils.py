@@ -1,11 +1,18 @@
 """Utilities for bigquery workers."""
 
 import json
-from typing import Any, Dict, Iterable
+from typing import Any, Dict, Iterable, Iterator, Optional, Union
 
 from google.cloud import bigquery
+from google.cloud import bigquery_storage
 from google.cloud.bigquery.schema import SchemaField
 
+from jobs.workers import clients
+
+# Tables with fewer rows are read with the tabledata.list REST API, since
+# creating a Storage Read API session costs more than it saves on them.
+STORAGE_READ_API_MIN_ROWS = 10000
+
 
 def get_schema_field(field_config: Dict[str, Any]) -> SchemaField:
   """Converts a field config into a schema field instance.
@@ -61,3 +68,57 @@ def bytes_converter(total_bytes_processed: int) -> str:
   else:
     terabytes = round(total_bytes_processed / (1000 * 1000 * 1000 * 1000), 2)
     return f'{terabytes} TB'
+
+
+def read_rows(
+    client: bigquery.Client,
+    table: Union[bigquery.Table, bigquery.TableReference, str],
+    start_index: Optional[int] = None,
+    max_results: Optional[int] = None,
+    page_size: Optional[int] = None,
+    bqstorage_client: Optional[bigquery_storage.BigQueryReadClient] = None,
+    num_rows: Optional[int] = None
+) -> Iterator[Dict[str, Any]]:
+  """Yields the rows of a BigQuery table as dictionaries.
+
+  Full reads of tables with at least `STORAGE_READ_API_MIN_ROWS` rows go
+  through the BigQuery Storage Read API, which streams Arrow record batches
+  from parallel read streams. Smaller tables and row ranges, which cannot be
+  addressed with the Storage Read API, are read with the tabledata.list API.
+  The table metadata is only fetched for full reads of a table reference whose
+  number of rows isn't given, row ranges leave it to `client.list_rows`.
+
+  Args:
+    client: BigQuery client.
+    table: The table to read, or a reference to it.
+    start_index: Index of the first row to read, or None for a full read.
+    max_results: Maximum number of rows to read, or None for a full read.
+    page_size: Number of rows per page fetched with the tabledata.list API.
+    bqstorage_client: BigQuery Storage Read API client. A new client is
+      created when needed if None.
+    num_rows: Number of rows of the table, if already known by the caller.
+
+  Yields:
+    A mapping from column names to values for each row of the table.
+  """
+  full_read = start_index is None and max_results is None
+  if full_read and num_rows is None:
+    if not isinstance(table, bigquery.Table):
+      table = client.get_table(table)
+    num_rows = table.num_rows
+  row_iterator = client.list_rows(
+      table,
+      start_index=start_index,
+      max_results=max_results,
+      page_size=page_size)
+  use_storage_api = full_read and (num_rows or 0) >= STORAGE_READ_API_MIN_ROWS
+  if not use_storage_api:
+    for row in row_iterator:
+      yield dict(row.items())
+    return
+  if bqstorage_client is None:
+    bqstorage_client = clients.get_client(
+        bigquery_storage.BigQueryReadClient)
+  for record_batch in row_iterator.to_arrow_iterable(
+      bqstorage_client=bqstorage_client):
+    yield from record_batch.to_pylist()
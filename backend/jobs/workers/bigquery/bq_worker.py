@@ -14,43 +14,58 @@
 
 """CRMint's abstract worker dealing with BigQuery."""
 
+import functools
 import json
 import os
 import time
+from typing import Sequence
 
 from google.api_core.client_info import ClientInfo
 from google.cloud import bigquery
+from jobs.workers import clients
 from jobs.workers import worker
 
+SCOPES = [
+    'https://www.googleapis.com/auth/bigquery',
+    'https://www.googleapis.com/auth/cloud-platform',
+    'https://www.googleapis.com/auth/drive',
+]
+
 PROJECT_DIR = os.path.join(os.path.dirname(__file__), '../../../')
 CONFIG_PATH = os.path.join(PROJECT_DIR, 'consent', 'bigquery_opt_in.json')
 
 
+@functools.cache
+def _get_client_info():
+  """Returns the client info reporting usage if the user opted in."""
+  try:
+    with open(CONFIG_PATH, 'r') as fp:
+      config = json.load(fp)
+    bigquery_opt_in = config.get('bigquery_opt_in', False)
+  except FileNotFoundError:
+    bigquery_opt_in = False
+  if bigquery_opt_in:
+    return ClientInfo(user_agent='cloud-solutions/crmint-ibqml-usage-v2')
+  return None
+
+
+def get_client(scopes: Sequence[str] = tuple(SCOPES)) -> bigquery.Client:
+  """Returns the BigQuery client shared by workers using the given scopes."""
+  return clients.get_client(
+      bigquery.Client,
+      scopes=scopes,
+      client_options={'scopes': list(scopes)},
+      client_info=_get_client_info(),
+  )
+
+
 class BQWorker(worker.Worker):
   """Abstract BigQuery worker."""
 
-  _SCOPES = [
-      'https://www.googleapis.com/auth/bigquery',
-      'https://www.googleapis.com/auth/cloud-platform',
-      'https://www.googleapis.com/auth/drive',
-  ]
+  _SCOPES = SCOPES
 
   def _get_client(self):
-    try:
-      with open(CONFIG_PATH, 'r') as fp:
-        config = json.load(fp)
-      bigquery_opt_in = config.get('bigquery_opt_in', False)
-    except FileNotFoundError:
-      bigquery_opt_in = False
-    if bigquery_opt_in:
-      client_info = ClientInfo(
-        user_agent='cloud-solutions/crmint-ibqml-usage-v2')
-    else:
-      client_info = None
-    return bigquery.Client(
-      client_options={'scopes': self._SCOPES},
-      client_info=client_info,
-    )
+    return get_client(self._SCOPES)
 
   def _get_prefix(self):
     return f'{self._pipeline_id}_{self._job_id}_{self.__class__.__name__}'
@@ -17,6 +17,7 @@
 from google.cloud import bigquery
 from google.cloud import storage
 
+from jobs.workers import clients
 from jobs.workers.bigquery import bq_utils
 from jobs.workers.bigquery import bq_worker
 from jobs.workers.storage import storage_utils
@@ -78,7 +79,7 @@ class StorageToBQImporter(bq_worker.BQWorker):
     else:
       job_config.create_disposition = 'CREATE_IF_NEEDED'
 
-    gcs_client = storage.Client()
+    gcs_client = clients.get_client(storage.Client)
     matched_uris = storage_utils.get_matched_uris(gcs_client,
                                                   self._params['source_uris'])
     dataset_ref = bigquery.DatasetReference(
@@ -0,0 +1,69 @@
+# Copyright 2024 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Process-wide registry of Google Cloud clients shared by workers.
+
+Creating a client resolves the default credentials, opens a new HTTP session
+or gRPC channel and pays for a TLS handshake on its first call. Clients are
+thread-safe, so workers executed by the same process share one client per
+(service, project, location, scopes) instead of creating one for each task.
+"""
+
+import threading
+from typing import Any, Callable, Hashable, Optional, Sequence, TypeVar
+
+_T = TypeVar('_T')
+
+_clients: dict[Hashable, Any] = {}
+_lock = threading.Lock()
+
+
+def get_client(client_class: Callable[..., _T],
+               *,
+               project: Optional[str] = None,
+               location: Optional[str] = None,
+               scopes: Optional[Sequence[str]] = None,
+               **kwargs: Any) -> _T:
+  """Returns the shared client of the given class, creating it on first use.
+
+  Args:
+    client_class: Client class (or factory) identifying the service.
+    project: GCP Project ID of the client, None for the default project.
+      Passed to the client constructor when set.
+    location: Location of the client, None for global clients. Only used to
+      identify the client, callers set the matching endpoint in `kwargs`.
+    scopes: OAuth scopes of the client. Only used to identify the client,
+      callers set the matching client options in `kwargs`.
+    **kwargs: Extra arguments passed to the client constructor on creation.
+
+  Returns:
+    Instance of `client_class`, created at most once per key.
+  """
+  key = (client_class, project, location, tuple(scopes or ()))
+  client = _clients.get(key)
+  if client is None:
+    with _lock:
+      client = _clients.get(key)
+      if client is None:
+        if project is not None:
+          kwargs['project'] = project
+        client = client_class(**kwargs)
+        _clients[key] = client
+  return client
+
+
+def clear() -> None:
+  """Forgets all the shared clients, mostly useful in tests."""
+  with _lock:
+    _clients.clear()
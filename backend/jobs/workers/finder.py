@@ -12,103 +12,166 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""Listing available workers."""
+"""Listing available workers.
 
-from typing import Type, TypeVar
+Worker modules import heavy client libraries (e.g. BigQuery, Vertex AI), so
+they are only imported when a worker class is first requested. Worker
+parameters are read from the source code of worker modules, which lets the UI
+list them without importing these libraries.
+"""
+
+import ast
+import functools
+import importlib
+from importlib import util as importlib_util
+from typing import Any, Optional, Type, TypeVar
 
-from jobs.workers import commenter
 from jobs.workers import worker
-from jobs.workers.bigquery import bq_ml_trainer
-from jobs.workers.bigquery import bq_query_launcher
-from jobs.workers.bigquery import bq_script_executor
-from jobs.workers.bigquery import bq_to_measurement_protocol_ga4
-from jobs.workers.bigquery import bq_to_storage_exporter
-from jobs.workers.bigquery import bq_to_vertexai_dataset
-from jobs.workers.bigquery import bq_waiter
-from jobs.workers.bigquery import storage_to_bq_importer
-from jobs.workers.ga import ga_audiences_updater
-from jobs.workers.ga import ga_audiences_updater_ga4
-from jobs.workers.ga import ga_conversion_event_creator_ga4
-from jobs.workers.ga import ga_custom_dimension_creator_ga4
-from jobs.workers.ga import ga_data_importer
-from jobs.workers.ga import ga_waiter
-from jobs.workers.storage import storage_cleaner
-from jobs.workers.vertexai import vertexai_batch_predictor_to_bq
-from jobs.workers.vertexai import vertexai_tabular_trainer
-from jobs.workers.vertexai import vertexai_waiter
-from jobs.workers.vertexai import vertexai_worker
 
 ConcreteWorker = TypeVar('ConcreteWorker', bound=worker.Worker)
 
+_WORKERS_PACKAGE = 'jobs.workers'
+
+# Maps worker class names to the module defining them, relative to
+# `jobs.workers`.
 WORKERS_MAPPING = {
     # 'AutoMLImporter',
     # 'AutoMLPredictor',
     # 'AutoMLTrainer',
-    'BQMLTrainer':
-        bq_ml_trainer.BQMLTrainer,
-    'BQQueryLauncher':
-        bq_query_launcher.BQQueryLauncher,
-    'BQScriptExecutor':
-        bq_script_executor.BQScriptExecutor,
+    'BQMLTrainer': 'bigquery.bq_ml_trainer',
+    'BQQueryLauncher': 'bigquery.bq_query_launcher',
+    'BQScriptExecutor': 'bigquery.bq_script_executor',
     # 'BQToAppConversionAPI',
     # 'BQToCM',
     # 'BQToMeasurementProtocol',
-    'BQToMeasurementProtocolGA4':
-        bq_to_measurement_protocol_ga4.BQToMeasurementProtocolGA4,
-    'BQToStorageExporter':
-        bq_to_storage_exporter.BQToStorageExporter,
-    'BQToVertexAIDataset':
-        bq_to_vertexai_dataset.BQToVertexAIDataset,
-    'Commenter':
-        commenter.Commenter,
-    'GAAudiencesUpdater':
-        ga_audiences_updater.GAAudiencesUpdater,
-    'GA4AudiencesUpdater':
-        ga_audiences_updater_ga4.GA4AudiencesUpdater,
-    'GA4ConversionEventCreator':
-        ga_conversion_event_creator_ga4.GA4ConversionEventCreator,
-    'GA4CustomDimensionCreator':
-        ga_custom_dimension_creator_ga4.GA4CustomDimensionCreator,
-    'GADataImporter':
-        ga_data_importer.GADataImporter,
+    'BQToMeasurementProtocolGA4': 'bigquery.bq_to_measurement_protocol_ga4',
+    'BQToStorageExporter': 'bigquery.bq_to_storage_exporter',
+    'BQToVertexAIDataset': 'bigquery.bq_to_vertexai_dataset',
+    'Commenter': 'commenter',
+    'GAAudiencesUpdater': 'ga.ga_audiences_updater',
+    'GA4AudiencesUpdater': 'ga.ga_audiences_updater_ga4',
+    'GA4ConversionEventCreator': 'ga.ga_conversion_event_creator_ga4',
+    'GA4CustomDimensionCreator': 'ga.ga_custom_dimension_creator_ga4',
+    'GADataImporter': 'ga.ga_data_importer',
     # 'GAToBQImporter',
     # 'MLPredictor',
     # 'MLTrainer',
     # 'MLVersionDeployer',
     # 'StorageChecker',
-    'StorageCleaner':
-        storage_cleaner.StorageCleaner,
-    'StorageToBQImporter':
-        storage_to_bq_importer.StorageToBQImporter,
-    'VertexAIBatchPredictorToBQ':
-        vertexai_batch_predictor_to_bq.VertexAIBatchPredictorToBQ,
-    'VertexAITabularTrainer':
-        vertexai_tabular_trainer.VertexAITabularTrainer,
+    'StorageCleaner': 'storage.storage_cleaner',
+    'StorageToBQImporter': 'bigquery.storage_to_bq_importer',
+    'VertexAIBatchPredictorToBQ': 'vertexai.vertexai_batch_predictor_to_bq',
+    'VertexAITabularTrainer': 'vertexai.vertexai_tabular_trainer',
 }
 
 _PRIVATE_WORKERS_MAPPING = {
     'BQToMeasurementProtocolProcessorGA4':
-        bq_to_measurement_protocol_ga4.BQToMeasurementProtocolProcessorGA4,
-    'BQWaiter': bq_waiter.BQWaiter,
-    'GADataImportUploadWaiter': ga_waiter.GADataImportUploadWaiter,
-    'VertexAIWaiter': vertexai_waiter.VertexAIWaiter,
-    'VertexAIWorker': vertexai_worker.VertexAIWorker,
+        'bigquery.bq_to_measurement_protocol_ga4',
+    'BQWaiter': 'bigquery.bq_waiter',
+    'GADataImportUploadWaiter': 'ga.ga_waiter',
+    'VertexAIWaiter': 'vertexai.vertexai_waiter',
+    'VertexAIWorker': 'vertexai.vertexai_worker',
+}
+
+# Case-insensitive index of all workers, mapping lowercase names to the
+# worker class name and its module.
+_WORKERS_INDEX = {
+    name.lower(): (name, f'{_WORKERS_PACKAGE}.{module}')
+    for mapping in (WORKERS_MAPPING, _PRIVATE_WORKERS_MAPPING)
+    for name, module in mapping.items()
 }
 
 
+def _find_worker(class_name: str) -> tuple[str, str]:
+  try:
+    return _WORKERS_INDEX[class_name.lower()]
+  except KeyError:
+    raise ModuleNotFoundError(f'No worker named: {class_name}') from None
+
+
 def get_worker_class(class_name: str) -> Type[ConcreteWorker]:
   """Returns a worker class.
 
   Args:
-    class_name: The name of the worker class.
+    class_name: The name of the worker class, case insensitive.
+
+  Raises:
+    ModuleNotFoundError: if the class name cannot be found.
+  """
+  name, module_path = _find_worker(class_name)
+  return getattr(importlib.import_module(module_path), name)
+
+
+def get_all_worker_classes() -> list[Type[ConcreteWorker]]:
+  """Imports and returns all worker classes, e.g. to warm up an instance."""
+  return [get_worker_class(name) for name, _ in _WORKERS_INDEX.values()]
+
+
+@functools.cache
+def _parse_module(module_path: str) -> ast.Module:
+  spec = importlib_util.find_spec(module_path)
+  with open(spec.origin, 'r') as fp:
+    return ast.parse(fp.read(), filename=spec.origin)
+
+
+def _find_params_in_source(module_path: str,
+                           class_name: str) -> Optional[list[Any]]:
+  """Returns the PARAMS of a class, read from the source of its module.
+
+  Base classes are followed when they are defined in the same module or in a
+  module imported with `from package import module`.
+
+  Args:
+    module_path: Absolute path of the module defining the class.
+    class_name: Name of the class.
+
+  Returns:
+    The list of parameters, or None if they cannot be found statically.
+  """
+  tree = _parse_module(module_path)
+  imported_modules = {}
+  for node in tree.body:
+    if isinstance(node, ast.ImportFrom) and node.level == 0:
+      for alias in node.names:
+        imported_modules[alias.asname or alias.name] = (
+            f'{node.module}.{alias.name}')
+  for node in tree.body:
+    if not isinstance(node, ast.ClassDef) or node.name != class_name:
+      continue
+    for statement in node.body:
+      if (isinstance(statement, ast.Assign)
+          and len(statement.targets) == 1
+          and isinstance(statement.targets[0], ast.Name)
+          and statement.targets[0].id == 'PARAMS'):
+        try:
+          return ast.literal_eval(statement.value)
+        except ValueError:
+          return None
+    if len(node.bases) != 1:
+      return None
+    base = node.bases[0]
+    if isinstance(base, ast.Name):
+      return _find_params_in_source(module_path, base.id)
+    if (isinstance(base, ast.Attribute)
+        and isinstance(base.value, ast.Name)
+        and base.value.id in imported_modules):
+      return _find_params_in_source(imported_modules[base.value.id], base.attr)
+    return None
+  return None
+
+
+@functools.cache
+def get_worker_params(class_name: str) -> list[tuple[Any, ...]]:
+  """Returns the parameters of a worker class without importing it if possible.
+
+  Args:
+    class_name: The name of the worker class, case insensitive.
 
   Raises:
     ModuleNotFoundError: if the class name cannot be found.
   """
-  for name in WORKERS_MAPPING:
-    if class_name.lower() == name.lower():
-      return WORKERS_MAPPING[name]
-  for name in _PRIVATE_WORKERS_MAPPING:
-    if class_name.lower() == name.lower():
-      return _PRIVATE_WORKERS_MAPPING[name]
-  raise ModuleNotFoundError
+  name, module_path = _find_worker(class_name)
+  params = _find_params_in_source(module_path, name)
+  if params is None:
+    params = get_worker_class(name).PARAMS
+  return [tuple(p) for p in params]
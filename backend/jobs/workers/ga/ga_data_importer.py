@@ -19,6 +19,7 @@ import tempfile
 
 from google.cloud import storage
 
+from jobs.workers import clients
 from jobs.workers import worker
 from jobs.workers.ga import ga_utils
 from jobs.workers.storage import storage_utils
@@ -61,7 +62,7 @@ class GADataImporter(worker.Worker):
       self.log_info('Kept all uploads')
     with tempfile.NamedTemporaryFile(delete=False) as temp:
       temp_filepath = temp.name
-    storage_utils.download_file(storage.Client(),
+    storage_utils.download_file(clients.get_client(storage.Client),
                                 uri_path=self._params['csv_uri'],
                                 destination_path=temp_filepath)
     self.log_info('Downloaded file from Cloud Storage to App Engine')
@@ -2,21 +2,27 @@
 
 import dataclasses
 import enum
+import functools
 import json
 import re
-import string
+import threading
 import time
-from typing import Callable, Mapping, NewType, Optional, Type, TypeVar, Union
+from typing import (Any, Callable, Mapping, NewType, Optional, Type, TypeVar,
+                    Union)
 
 from google.api_core import retry
+from google.auth import credentials as auth_credentials
 from google.cloud import bigquery
 from googleapiclient import discovery
+from googleapiclient import discovery_cache
 from googleapiclient import errors
 from googleapiclient import http as api_httplib
 import httplib2
 
 from common import crmint_logging
 from common import utils
+from jobs.workers import json_template
+from jobs.workers.bigquery import bq_utils
 
 _MAX_RESULTS_PER_CALL = 100
 _NUMBER_OF_RETRIES = 3
@@ -39,20 +45,46 @@ _GA4_AUDIENCE_OUTPUT_ONLY_FIELDS = [
 ]
 
 
+# Clients built with the default HTTP transport. Since `httplib2.Http` is not
+# thread-safe, each thread keeps its own clients, built from the discovery
+# documents shared by the whole process.
+_clients = threading.local()
+
+
 def _null_progress_callback(unused_msg: str) -> None:
   """Default progress callback. Used to simplify the tests."""
 
 
+@functools.cache
+def _get_discovery_document(
+    service: str, version: str) -> Optional[dict[str, Any]]:
+  """Returns the parsed discovery document shipped with the API client library.
+
+  Documents are parsed once per process. Building a client from a document
+  only sets the same parameter defaults in it, so threads can share it.
+  """
+  document = discovery_cache.get_static_doc(service, version)
+  if document is None:
+    return None
+  return json.loads(document)
+
+
 def get_client(
     service: str,
     version: str,
     http: Optional[Union[httplib2.Http, api_httplib.HttpMock]] = None,
     request_builder: Union[
         Type[api_httplib.HttpRequest],
-        api_httplib.RequestMockBuilder] = api_httplib.HttpRequest
+        api_httplib.RequestMockBuilder] = api_httplib.HttpRequest,
+    credentials: Optional[auth_credentials.Credentials] = None,
 ) -> discovery.Resource:
   """Configures a client for the Google Analytics API and caches its result.
 
+  Clients using the default HTTP transport are built once per thread from the
+  discovery document shipped with the API client library, and reused by the
+  next calls with the same service, version and credentials. The document is
+  parsed once per process, which makes building clients in other threads cheap.
+
   Args:
     service: API name (e.g. analyticsreporting, analyticsadmin, etc).
     version: Version of the API to configure the GA client with.
@@ -60,18 +92,41 @@ def get_client(
         HTTP requests will be made through.
     request_builder: Instance of googleapiclient.http.HttpRequest, encapsulator
         for an HTTP request. Especially useful in testing.
+    credentials: Credentials to authorize requests with, None for the default
+        credentials. Ignored if `http` is set.
 
   Returns:
     Google Analytics API client of type `googleapiclient.discovery.Resource`.
   """
-  static_discovery = False if isinstance(http, api_httplib.HttpMock) else None
-  return discovery.build(
-      service,
-      version,
-      num_retries=_NUMBER_OF_RETRIES,
-      http=http,
-      requestBuilder=request_builder,
-      static_discovery=static_discovery)
+  if http is not None or request_builder is not api_httplib.HttpRequest:
+    static_discovery = (
+        False if isinstance(http, api_httplib.HttpMock) else None)
+    return discovery.build(
+        service,
+        version,
+        num_retries=_NUMBER_OF_RETRIES,
+        http=http,
+        requestBuilder=request_builder,
+        credentials=credentials,
+        static_discovery=static_discovery)
+
+  if not hasattr(_clients, 'cache'):
+    _clients.cache = {}
+  key = (service, version, credentials)
+  client = _clients.cache.get(key)
+  if client is None:
+    document = _get_discovery_document(service, version)
+    if document is None:
+      client = discovery.build(
+          service,
+          version,
+          num_retries=_NUMBER_OF_RETRIES,
+          credentials=credentials)
+    else:
+      client = discovery.build_from_document(
+          document, credentials=credentials)
+    _clients.cache[key] = client
+  return client
 
 
 @dataclasses.dataclass(frozen=True)
@@ -226,12 +281,9 @@ def get_audience_patches(
     template: JSON string for Audience API body.
   """
   patches = []
-  rows = bq_client.list_rows(table_ref)
-  template = string.Template(template)
-  for row in rows:
-    template_rendered = template.substitute(dict(row.items()))
-    data = json.loads(template_rendered)
-    patches.append(AudiencePatch(data))
+  template = json_template.JSONTemplate(template)
+  for row in bq_utils.read_rows(bq_client, table_ref):
+    patches.append(AudiencePatch(template.render(row)))
   return patches
 
 
@@ -0,0 +1,205 @@
+# Copyright 2024 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compiled JSON templates using the Template Strings placeholder syntax.
+
+Workers render a JSON template for each row of a BigQuery table. Instead of
+substituting placeholders in the template text and parsing the resulting JSON
+for every row, the template is parsed once into a tree of JSON values with
+placeholder slots, which is then filled to build each row payload directly.
+
+Two kinds of slots are supported:
+  1. Placeholders inside a JSON string (e.g. `"${client_id}"` or
+     `"prefix-${id}"`) are replaced by the text representation of the value,
+     the resulting string being properly escaped.
+  2. Placeholders outside a JSON string (e.g. `"value": ${score}`) are
+     replaced by the JSON value of the row value, so numbers, booleans and
+     nulls keep their types.
+"""
+
+import json
+import re
+import string
+from typing import Any, Mapping, Union
+
+# Marks the boundaries of placeholder slots in the intermediate JSON text.
+# The escaped form is what we write in the JSON text, the decoded form is what
+# we find back in the parsed strings.
+_ESCAPED_MARKER = '\\u0000'
+_MARKER = '\x00'
+_SLOT_PATTERN = re.compile(f'{_MARKER}(\\d+){_MARKER}')
+
+
+class _StrSlot:
+  """JSON string mixing literal text and placeholders."""
+
+  def __init__(self, parts: list[Union[str, int]], names: list[str]):
+    self._parts = [p if isinstance(p, str) else names[p] for p in parts]
+    self._is_name = [isinstance(p, int) for p in parts]
+
+  def render(self, mapping: Mapping[str, Any]) -> str:
+    return ''.join(
+        str(mapping[part]) if is_name else part
+        for part, is_name in zip(self._parts, self._is_name))
+
+
+class _RawSlot:
+  """Placeholder standing for a whole JSON value."""
+
+  def __init__(self, name: str):
+    self._name = name
+
+  def render(self, mapping: Mapping[str, Any]) -> Any:
+    value = mapping[self._name]
+    if value is None or isinstance(value, (bool, int, float)):
+      return value
+    return json.loads(str(value))
+
+
+class _Dict:
+
+  def __init__(self, items: list[tuple[Any, Any]]):
+    self._items = items
+
+  def render(self, mapping: Mapping[str, Any]) -> dict[str, Any]:
+    return {_render(k, mapping): _render(v, mapping) for k, v in self._items}
+
+
+class _List:
+
+  def __init__(self, items: list[Any]):
+    self._items = items
+
+  def render(self, mapping: Mapping[str, Any]) -> list[Any]:
+    return [_render(v, mapping) for v in self._items]
+
+
+_NODE_TYPES = (_StrSlot, _RawSlot, _Dict, _List)
+
+
+def _render(node: Any, mapping: Mapping[str, Any]) -> Any:
+  if isinstance(node, _NODE_TYPES):
+    return node.render(mapping)
+  return node
+
+
+def _compile_value(value: Any, names: list[str], raw_slots: set[int]) -> Any:
+  """Converts a parsed JSON value into a tree of nodes and constants."""
+  if isinstance(value, dict):
+    items = [(_compile_value(k, names, raw_slots),
+              _compile_value(v, names, raw_slots)) for k, v in value.items()]
+    return _Dict(items)
+  if isinstance(value, list):
+    return _List([_compile_value(v, names, raw_slots) for v in value])
+  if isinstance(value, str) and _MARKER in value:
+    parts = []
+    for i, part in enumerate(_SLOT_PATTERN.split(value)):
+      if i % 2:
+        parts.append(int(part))
+      elif part:
+        parts.append(part)
+    if len(parts) == 1 and isinstance(parts[0], int):
+      if parts[0] in raw_slots:
+        return _RawSlot(names[parts[0]])
+    elif any(isinstance(p, int) and p in raw_slots for p in parts):
+      raise ValueError('Placeholders outside JSON strings must stand for '
+                       'a whole JSON value')
+    return _StrSlot(parts, names)
+  return value
+
+
+def _mark_slots(template: str) -> tuple[str, list[str], set[int]]:
+  """Replaces placeholders by markers in the template text.
+
+  Args:
+    template: Template text using the Template Strings syntax.
+
+  Returns:
+    A tuple of the marked JSON text, the placeholder names indexed by slot,
+    and the indices of slots found outside JSON strings.
+
+  Raises:
+    ValueError: if the template contains an invalid placeholder.
+  """
+  chunks = []
+  names = []
+  raw_slots = set()
+  in_string = False
+  escaped = False
+  pos = 0
+  for match in string.Template.pattern.finditer(template):
+    # Tracks whether the placeholder starts inside a JSON string.
+    for char in template[pos:match.start()]:
+      if escaped:
+        escaped = False
+      elif char == '\\':
+        escaped = in_string
+      elif char == '"':
+        in_string = not in_string
+    chunks.append(template[pos:match.start()])
+    pos = match.end()
+    if match.group('escaped') is not None:
+      chunks.append('$')
+      continue
+    name = match.group('named') or match.group('braced')
+    if name is None:
+      raise ValueError(f'Invalid placeholder in template at index '
+                       f'{match.start("invalid")}')
+    marker = f'{_ESCAPED_MARKER}{len(names)}{_ESCAPED_MARKER}'
+    if not in_string:
+      raw_slots.add(len(names))
+      marker = f'"{marker}"'
+    chunks.append(marker)
+    names.append(name)
+  chunks.append(template[pos:])
+  return ''.join(chunks), names, raw_slots
+
+
+class JSONTemplate:
+  """JSON template parsed once and rendered for many mappings of values.
+
+  Templates which cannot be compiled (e.g. placeholders building a part of a
+  JSON number) are rendered by substituting the template text and parsing the
+  resulting JSON, like `json.loads(string.Template(template).substitute(...))`.
+  """
+
+  def __init__(self, template: str):
+    """Compiles a JSON template.
+
+    Args:
+      template: JSON text using the Template Strings syntax for placeholders.
+        https://docs.python.org/3/library/string.html#template-strings
+    """
+    self.template = template
+    try:
+      marked_template, names, raw_slots = _mark_slots(template)
+      self._tree = _compile_value(
+          json.loads(marked_template), names, raw_slots)
+    except ValueError:
+      self._tree = None
+      self._text_template = string.Template(template)
+
+  def render(self, mapping: Mapping[str, Any]) -> Any:
+    """Returns the JSON value built with the given placeholder values.
+
+    Args:
+      mapping: Mapping from placeholder names to their values.
+
+    Raises:
+      KeyError: if a placeholder has no value in the mapping.
+      ValueError: if the rendered template is not a valid JSON.
+    """
+    if self._tree is None:
+      return json.loads(self._text_template.substitute(mapping))
+    return _render(self._tree, mapping)
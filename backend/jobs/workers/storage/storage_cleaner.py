@@ -18,6 +18,7 @@ import datetime
 
 from google.cloud import storage
 
+from jobs.workers import clients
 from jobs.workers import worker
 from jobs.workers.storage import storage_utils
 
@@ -36,7 +37,7 @@ class StorageCleaner(worker.Worker):
   def _execute(self):
     max_delta = datetime.timedelta(days=self._params['expiration_days'])
     now_dt = datetime.datetime.now(tz=datetime.timezone.utc)
-    client = storage.Client()
+    client = clients.get_client(storage.Client)
     blobs = storage_utils.get_matching_blobs(client, self._params['file_uris'])
     for blob in blobs:
       # NB: `blob.updated` contains the datetime of last updates.
@@ -23,6 +23,7 @@ from google.cloud import aiplatform
 from google.cloud.aiplatform_v1.types import job_state as js
 from google.cloud.aiplatform_v1.types import pipeline_state as ps
 
+from jobs.workers import clients
 from jobs.workers import worker
 
 
@@ -42,25 +43,28 @@ _JOB_COMPLETE_STATES = frozenset([
 class VertexAIWorker(worker.Worker):
   """Worker that polls job status and respawns itself if the job is not done."""
 
-  def _get_vertexai_job_client(self, location):
+  def _get_vertexai_client(self, client_class, location):
     api_endpoint = f'{location}-aiplatform.googleapis.com'
-    client_options = {'api_endpoint': api_endpoint}
-    return aiplatform.gapic.JobServiceClient(client_options=client_options)
+    return clients.get_client(
+        client_class,
+        location=location,
+        client_options={'api_endpoint': api_endpoint})
+
+  def _get_vertexai_job_client(self, location):
+    return self._get_vertexai_client(
+        aiplatform.gapic.JobServiceClient, location)
 
   def _get_vertexai_pipeline_client(self, location):
-    api_endpoint = f'{location}-aiplatform.googleapis.com'
-    client_options = {'api_endpoint': api_endpoint}
-    return aiplatform.gapic.PipelineServiceClient(client_options=client_options)
+    return self._get_vertexai_client(
+        aiplatform.gapic.PipelineServiceClient, location)
 
   def _get_vertexai_dataset_client(self, location):
-    api_endpoint = f'{location}-aiplatform.googleapis.com'
-    client_options = {'api_endpoint': api_endpoint}
-    return aiplatform.gapic.DatasetServiceClient(client_options=client_options)
+    return self._get_vertexai_client(
+        aiplatform.gapic.DatasetServiceClient, location)
 
   def _get_vertexai_model_client(self, location):
-    api_endpoint = f'{location}-aiplatform.googleapis.com'
-    client_options = {'api_endpoint': api_endpoint}
-    return aiplatform.gapic.ModelServiceClient(client_options=client_options)
+    return self._get_vertexai_client(
+        aiplatform.gapic.ModelServiceClient, location)
 
   def _get_batch_prediction_job(self, job_client, job_name):
     return job_client.get_batch_prediction_job(name=job_name)
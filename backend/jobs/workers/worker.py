@@ -18,7 +18,6 @@
 import json
 from typing import Any, Optional
 
-from google.api_core.retry import Retry
 from google.auth import credentials
 
 from common import crmint_logging
@@ -75,7 +74,6 @@ class Worker:
     self._logger_project = logger_project
     self._logger_credentials = logger_credentials
 
-  @Retry()
   def _log(self, level: str, message: str) -> None:
     crmint_logging.log_message(
         message,
@@ -14,7 +14,6 @@
 
 import signal
 import sys
-import traceback
 import types
 
 from flask import json
@@ -24,10 +23,10 @@ from flask.globals import request
 from common import auth_filter
 from common import crmint_logging
 from common import message
-from common import result
 from common import task
+from common import warmup
+from jobs import runner
 from jobs.workers import finder
-from jobs.workers import worker
 
 app = Flask(__name__)
 auth_filter.add(app)
@@ -41,9 +40,9 @@ def workers_list():
 
 @app.route('/api/workers/<worker_class>/params', methods=['GET'])
 def worker_parameters(worker_class):
-  klass = finder.get_worker_class(worker_class)
+  params = finder.get_worker_params(worker_class)
   keys = ['name', 'type', 'required', 'default', 'label']
-  return (json.jsonify([dict(zip(keys, param)) for param in klass.PARAMS]),
+  return (json.jsonify([dict(zip(keys, param)) for param in params]),
           {'Access-Control-Allow-Origin': '*'})
 
 
@@ -55,47 +54,28 @@ def start_task():
   except (message.BadRequestError, message.TooEarlyError) as e:
     return e.message, e.code
 
-  crmint_logging.log_message(
-      f'Starting task for name: {task_inst.name}',
-      log_level='DEBUG',
-      worker_class=task_inst.worker_class,
-      pipeline_id=task_inst.pipeline_id,
-      job_id=task_inst.job_id)
+  runner.run_task(task_inst)
+  return 'OK', 200
 
-  worker_class = finder.get_worker_class(task_inst.worker_class)
-  worker_params = task_inst.worker_params.copy()
-  for setting in worker_class.GLOBAL_SETTINGS:
-    worker_params[setting] = task_inst.general_settings[setting]
-  worker_inst = worker_class(
-      worker_params, task_inst.pipeline_id, task_inst.job_id)
 
-  try:
-    workers_to_enqueue = worker_inst.execute()
-    crmint_logging.log_message(
-        f'Executed task for name: {task_inst.name}',
-        log_level='DEBUG',
-        worker_class=task_inst.worker_class,
-        pipeline_id=task_inst.pipeline_id,
-        job_id=task_inst.job_id)
-  except worker.WorkerException as e:
-    class_name = e.__class__.__name__
-    worker_inst.log_error(f'Execution failed: {class_name}: {e}')
-    result_inst = result.Result(task_inst.name, task_inst.job_id, False)
-    result_inst.report()
-  except Exception as e:  # pylint: disable=broad-except
-    formatted_exception = traceback.format_exc()
-    worker_inst.log_error(f'Unexpected error {formatted_exception}')
-    if task_inst.attempts < worker_inst.MAX_ATTEMPTS:
-      task_inst.reenqueue()
-    else:
-      worker_inst.log_error(f'Giving up after {task_inst.attempts} attempt(s)')
-      result_inst = result.Result(task_inst.name, task_inst.job_id, False)
-      result_inst.report()
-  else:
-    result_inst = result.Result(
-        task_inst.name, task_inst.job_id, True, workers_to_enqueue)
-    result_inst.report()
-  return 'OK', 200
+@app.route('/_ah/warmup', methods=['GET'])
+def warmup_instance():
+  """Creates the clients used by tasks before the instance receives any."""
+  # Imported here to keep the client libraries out of the app import time.
+  # pylint: disable=import-outside-toplevel
+  from jobs.workers.bigquery import bq_worker
+  from jobs.workers.ga import ga_utils
+  # pylint: enable=import-outside-toplevel
+  timings = warmup.run([
+      ('logging', crmint_logging.get_logger),
+      ('pubsub', message.get_publisher_client),
+      ('workers', finder.get_all_worker_classes),
+      ('bigquery', bq_worker.get_client),
+      ('analytics', lambda: ga_utils.get_client('analytics', 'v3')),
+      ('analyticsadmin',
+       lambda: ga_utils.get_client('analyticsadmin', 'v1alpha')),
+  ])
+  return json.jsonify(timings), 200
 
 
 def shutdown_handler(sig: int, frame: types.FrameType) -> None:
@@ -103,6 +83,7 @@ def shutdown_handler(sig: int, frame: types.FrameType) -> None:
 
   Within the 3 seconds window, try to do as much as possible:
     1. Commit all pending Pub/Sub messages (as much as possible).
+    2. Write all buffered log messages (as much as possible).
 
   You can read more about this practice:
   https://cloud.google.com/blog/topics/developers-practitioners/graceful-shutdowns-cloud-run-deep-dive.
@@ -116,6 +97,7 @@ def shutdown_handler(sig: int, frame: types.FrameType) -> None:
       'Signal received, safely shutting down.',
       log_level='WARNING')
   message.shutdown()
+  crmint_logging.flush(timeout=1.0)
   sys.exit(0)
 
 
@@ -0,0 +1,95 @@
+# Copyright 2024 Google Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs the jobs service in pull mode.
+
+Usage:
+  python jobs_puller.py --subscription=crmint-start-task-pull \
+      --max-workers=32 --worker-class-limit=BQWaiter=20
+
+The subscription must be a pull subscription to the `crmint-start-task` topic.
+Tasks failing with an unexpected error are nacked, give the subscription a
+retry policy so that they aren't delivered again at once, e.g.:
+
+  gcloud pubsub subscriptions create crmint-start-task-pull \
+      --topic=crmint-start-task --ack-deadline=60 \
+      --min-retry-delay=10s --max-retry-delay=600s
+"""
+
+import argparse
+import os
+import signal
+import sys
+import types
+
+from common import crmint_logging
+from common import message
+from jobs import puller
+
+_PROJECT = os.getenv('GOOGLE_CLOUD_PROJECT')
+
+
+def _parse_worker_class_limit(value: str) -> tuple[str, int]:
+  name, _, limit = value.partition('=')
+  try:
+    return name, int(limit)
+  except ValueError as e:
+    raise argparse.ArgumentTypeError(
+        f'Expected WORKER_CLASS=LIMIT, got: {value}') from e
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument(
+      '--subscription', default='crmint-start-task-pull',
+      help='Pull subscription ID or path to the crmint-start-task topic.')
+  parser.add_argument(
+      '--max-workers', type=int, default=16,
+      help='Maximum number of tasks executed concurrently.')
+  parser.add_argument(
+      '--worker-class-limit', type=_parse_worker_class_limit,
+      action='append', default=[], metavar='WORKER_CLASS=LIMIT',
+      help='Maximum number of concurrent tasks for a worker class.')
+  parser.add_argument(
+      '--max-lease-duration', type=int, default=3600,
+      help='Maximum number of seconds to extend the lease of a running task.')
+  args = parser.parse_args()
+
+  subscription_path = args.subscription
+  if '/' not in subscription_path:
+    subscription_path = f'projects/{_PROJECT}/subscriptions/{args.subscription}'
+  task_puller = puller.TaskPuller(
+      subscription_path,
+      max_workers=args.max_workers,
+      worker_class_limits=dict(args.worker_class_limit),
+      max_lease_duration=args.max_lease_duration)
+
+  def shutdown_handler(sig: int, frame: types.FrameType) -> None:
+    """Stops pulling tasks, waits for the running ones and exits."""
+    del sig, frame  # Unused argument
+    crmint_logging.log_global_message(
+        'Signal received, safely shutting down.',
+        log_level='WARNING')
+    task_puller.stop()
+    message.shutdown()
+    crmint_logging.flush(timeout=1.0)
+    sys.exit(0)
+
+  signal.signal(signal.SIGINT, shutdown_handler)
+  signal.signal(signal.SIGTERM, shutdown_handler)
+  task_puller.start().result()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,30 @@
+"""Backfill enqueued_workers_count of jobs from their enqueued tasks
+
+Revision ID: 3b7e5d9c1f42
+Revises: 64e9670466d2
+Create Date: 2024-06-03 10:12:41.518236
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7e5d9c1f42'
+down_revision = '64e9670466d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+  # Counts the tasks still running at upgrade time, the controller keeps the
+  # counter up-to-date from now on.
+  op.execute("""
+      UPDATE jobs SET enqueued_workers_count = (
+          SELECT COUNT(*) FROM enqueued_tasks
+          WHERE enqueued_tasks.task_namespace = CONCAT(
+              'pipeline=', jobs.pipeline_id, '_job=', jobs.id))
+  """)
+
+
+def downgrade():
+  op.execute('UPDATE jobs SET enqueued_workers_count = 0')
@@ -0,0 +1,34 @@
+"""Add job status counters to pipelines
+
+Revision ID: 8d2c4a6e0b17
+Revises: 3b7e5d9c1f42
+Create Date: 2024-06-05 15:27:09.204716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2c4a6e0b17'
+down_revision = '3b7e5d9c1f42'
+branch_labels = None
+depends_on = None
+
+_STATUSES = ('idle', 'waiting', 'running', 'stopping', 'succeeded', 'failed')
+
+
+def upgrade():
+  for status in _STATUSES:
+    op.add_column('pipelines', sa.Column(f'{status}_jobs_count', sa.Integer(),
+                                         nullable=False, server_default='0'))
+    op.execute(f"""
+        UPDATE pipelines SET {status}_jobs_count = (
+            SELECT COUNT(*) FROM jobs
+            WHERE jobs.pipeline_id = pipelines.id AND jobs.status = '{status}')
+    """)
+
+
+def downgrade():
+  for status in _STATUSES:
+    op.drop_column('pipelines', f'{status}_jobs_count')
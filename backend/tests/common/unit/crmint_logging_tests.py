@@ -0,0 +1,116 @@
+"""Tests for common.crmint_logging."""
+
+import datetime
+import threading
+import time
+from unittest import mock
+
+from absl.testing import absltest
+import freezegun
+from google.api_core import exceptions
+from google.cloud import logging
+
+from common import crmint_logging
+
+
+def _make_logger():
+  logger = mock.create_autospec(logging.Logger, instance=True)
+  logger.client = mock.create_autospec(logging.Client, instance=True)
+  logger.default_resource = None
+  return logger
+
+
+class BatchingTransportTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.patched_batch = self.enter_context(
+        mock.patch.object(logging, 'Batch', autospec=True))
+
+  def test_writes_entries_in_one_batch_per_logger(self):
+    transport = crmint_logging._BatchingTransport(max_latency=60)
+    first_logger = _make_logger()
+    second_logger = _make_logger()
+    transport.send(first_logger, 'log_text', 'foo', severity='INFO')
+    transport.send(first_logger, 'log_struct', {'message': 'bar'})
+    transport.send(second_logger, 'log_text', 'baz', severity='ERROR')
+    self.assertTrue(transport.flush(timeout=5))
+    self.assertEqual(self.patched_batch.call_count, 2)
+    batch = self.patched_batch.return_value
+    self.assertEqual(batch.commit.call_count, 2)
+    self.assertEqual(batch.log_text.call_args_list, [
+        mock.call('foo', severity='INFO', timestamp=mock.ANY),
+        mock.call('baz', severity='ERROR', timestamp=mock.ANY),
+    ])
+    batch.log_struct.assert_called_once_with(
+        {'message': 'bar'}, timestamp=mock.ANY)
+
+  def test_timestamps_entries_when_sent(self):
+    transport = crmint_logging._BatchingTransport(max_latency=60)
+    logger = _make_logger()
+    with freezegun.freeze_time('2024-01-01T00:00:00'):
+      transport.send(logger, 'log_text', 'foo')
+    self.assertTrue(transport.flush(timeout=5))
+    self.patched_batch.return_value.log_text.assert_called_once_with(
+        'foo',
+        timestamp=datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc))
+
+  def test_retries_transient_write_errors(self):
+    commit = self.patched_batch.return_value.commit
+    commit.side_effect = [exceptions.ServiceUnavailable('unavailable'), None]
+    self.enter_context(mock.patch('time.sleep', autospec=True))
+    transport = crmint_logging._BatchingTransport(max_latency=60)
+    transport.send(_make_logger(), 'log_text', 'foo')
+    self.assertTrue(transport.flush(timeout=5))
+    self.assertEqual(commit.call_count, 2)
+    self.assertEqual(transport.failed_entries, 0)
+
+  def test_splits_batches_above_max_batch_size(self):
+    transport = crmint_logging._BatchingTransport(
+        max_batch_size=2, max_latency=60)
+    logger = _make_logger()
+    for i in range(5):
+      transport.send(logger, 'log_text', f'message {i}')
+    self.assertTrue(transport.flush(timeout=5))
+    self.assertEqual(self.patched_batch.return_value.commit.call_count, 3)
+
+  def test_drops_entries_when_buffer_is_full(self):
+    transport = crmint_logging._BatchingTransport(max_buffer_size=2)
+    # Never consumes the buffer.
+    self.enter_context(
+        mock.patch.object(transport, '_ensure_thread', autospec=True))
+    logger = _make_logger()
+    for i in range(5):
+      transport.send(logger, 'log_text', f'message {i}')
+    self.assertEqual(transport.dropped_entries, 3)
+
+  def test_counts_entries_failed_to_be_written(self):
+    self.patched_batch.return_value.commit.side_effect = RuntimeError('boom')
+    transport = crmint_logging._BatchingTransport(max_latency=60)
+    logger = _make_logger()
+    transport.send(logger, 'log_text', 'foo')
+    transport.send(logger, 'log_text', 'bar')
+    with self.assertLogs(level='ERROR') as logs:
+      self.assertTrue(transport.flush(timeout=5))
+    self.assertEqual(transport.failed_entries, 2)
+    self.assertIn('Failed to write 2 log entries.', logs.output[0])
+
+  def test_flush_waits_at_most_the_timeout(self):
+    transport = crmint_logging._BatchingTransport(max_buffer_size=1)
+    # Never consumes the buffer, a thread frees it late in the flush instead.
+    self.enter_context(
+        mock.patch.object(transport, '_ensure_thread', autospec=True))
+    transport._thread = mock.Mock()
+    transport.send(_make_logger(), 'log_text', 'foo')
+    threading.Timer(0.3, transport._queue.get_nowait).start()
+    start = time.monotonic()
+    self.assertFalse(transport.flush(timeout=0.5))
+    self.assertLess(time.monotonic() - start, 0.7)
+
+  def test_flush_without_entries_returns_immediately(self):
+    transport = crmint_logging._BatchingTransport()
+    self.assertTrue(transport.flush(timeout=0))
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -35,6 +35,92 @@ class CommonMessageTest(absltest.TestCase):
     with self.assertRaises(TimeoutError):
       message.send(data={'foo': 'bar'}, topic='TOPIC', delay=1)
 
+  def _patch_publish(self, futures_by_topic):
+    def publish(unused_client, topic_path, unused_data, **unused_attrs):
+      return futures_by_topic[topic_path.rsplit('/', 1)[1]]
+
+    self.enter_context(
+        mock.patch.object(
+            auth,
+            'default',
+            autospec=True,
+            return_value=[_make_credentials, 'PROJECT']))
+    return self.enter_context(
+        mock.patch.object(
+            pubsub_v1.PublisherClient,
+            'publish',
+            autospec=True,
+            side_effect=publish))
+
+  def test_batch_waits_for_messages_when_leaving_context(self):
+    self.enter_context(mock.patch.object(message, '_PUBSUB_TIMEOUT', 0.1))
+    pending_future = pubsub_v1.publisher.futures.Future()
+    patched_publish = self._patch_publish({'TOPIC': pending_future})
+    with self.assertRaises(message.PublishError):
+      with message.batch():
+        message.send(data={'foo': 'bar'}, topic='TOPIC')
+        message.send(data={'foo': 'baz'}, topic='TOPIC')
+        # Messages are published without waiting for each other.
+        self.assertEqual(patched_publish.call_count, 2)
+
+  def test_send_many_reports_failed_messages(self):
+    success_future = pubsub_v1.publisher.futures.Future()
+    success_future.set_result('MESSAGE_ID')
+    failure_future = pubsub_v1.publisher.futures.Future()
+    failure_future.set_exception(RuntimeError('boom'))
+    self._patch_publish({'OK': success_future, 'KO': failure_future})
+    with self.assertRaises(message.PublishError) as context:
+      message.send_many([
+          ({'id': 1}, 'OK', 0),
+          ({'id': 2}, 'KO', 0),
+          ({'id': 3}, 'OK', 0),
+      ])
+    self.assertLen(context.exception.errors, 1)
+    self.assertEqual(context.exception.errors[0][0], {'id': 2})
+    self.assertIsInstance(context.exception.errors[0][1], RuntimeError)
+
+  def test_nested_batches_join_outermost_batch(self):
+    success_future = pubsub_v1.publisher.futures.Future()
+    success_future.set_result('MESSAGE_ID')
+    self._patch_publish({'OK': success_future})
+    with message.batch():
+      with message.batch():
+        message.send(data={'id': 1}, topic='OK')
+      self.assertLen(message._batches.pending, 1)
+    self.assertIsNone(message._batches.pending)
+
+  def test_non_joining_batch_waits_for_its_own_messages(self):
+    success_future = pubsub_v1.publisher.futures.Future()
+    success_future.set_result('MESSAGE_ID')
+    failure_future = pubsub_v1.publisher.futures.Future()
+    failure_future.set_exception(RuntimeError('boom'))
+    self._patch_publish({'OK': success_future, 'KO': failure_future})
+    with message.batch():
+      message.send(data={'id': 1}, topic='OK')
+      with self.assertRaises(message.PublishError) as context:
+        with message.batch(join=False):
+          message.send(data={'id': 2}, topic='KO')
+      self.assertEqual([data for data, _ in context.exception.errors],
+                       [{'id': 2}])
+      self.assertLen(message._batches.pending, 1)
+    self.assertIsNone(message._batches.pending)
+
+  def test_decode_data(self):
+    data = message.decode_data(b'{"foo": "bar"}', {'start_time': '0'})
+    self.assertEqual(data, {'foo': 'bar'})
+
+  def test_decode_data_too_early(self):
+    with self.assertRaises(message.TooEarlyError):
+      message.decode_data(b'{}', {'start_time': '4102444800'})  # Year 2100
+
+  def test_decode_data_invalid_message(self):
+    with self.subTest('Missing start time'):
+      with self.assertRaises(message.BadRequestError):
+        message.decode_data(b'{}', {})
+    with self.subTest('Invalid JSON'):
+      with self.assertRaises(message.BadRequestError):
+        message.decode_data(b'{', {'start_time': '0'})
+
 
 if __name__ == '__main__':
   absltest.main()
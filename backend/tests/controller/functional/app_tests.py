@@ -12,6 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from unittest import mock
+
+from common import crmint_logging
+from common import message
 from controller import models
 from controller_app import app
 from tests import controller_utils
@@ -43,3 +47,15 @@ class TestControllerApp(controller_utils.ControllerAppTest):
     self.assertLen(models.Pipeline.all(), 2)
     response = self.client.get('/api/pipelines')
     self.assertEqual(response.status_code, 200)
+
+  def test_warmup_reports_timings(self):
+    self.enter_context(
+        mock.patch.object(crmint_logging, 'get_logger', autospec=True))
+    self.enter_context(
+        mock.patch.object(crmint_logging, 'log_global_message', autospec=True))
+    self.enter_context(
+        mock.patch.object(message, 'get_publisher_client', autospec=True))
+    response = self.client.get('/_ah/warmup')
+    self.assertEqual(response.status_code, 200)
+    self.assertCountEqual(response.json, ['logging', 'pubsub', 'database'])
+    self.assertIsInstance(response.json['database'], float)
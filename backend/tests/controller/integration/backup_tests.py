@@ -0,0 +1,87 @@
+# Copyright 2024 Google Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+from absl.testing import absltest
+
+from controller import backup
+from controller import models
+from tests import controller_utils
+
+
+class TestBackup(controller_utils.ModelTestCase):
+
+  def _create_pipeline(self, name):
+    pipeline = models.Pipeline.create(name=name)
+    pipeline.assign_params(
+        [{'name': 'p1', 'label': 'P1', 'type': 'string', 'value': name}])
+    pipeline.assign_schedules([{'cron': '* * * * *'}])
+    job1 = models.Job.create(name='j1', worker_class='Commenter',
+                             pipeline_id=pipeline.id)
+    job2 = models.Job.create(name='j2', worker_class='Commenter',
+                             pipeline_id=pipeline.id)
+    job2.assign_start_conditions(
+        [{'preceding_job_id': job1.id, 'condition': 'success'}])
+    return pipeline
+
+  def test_dump_starts_with_global_params(self):
+    models.Param.update_list(
+        [{'name': 'g1', 'type': 'string', 'value': 'foo'}])
+    self._create_pipeline('pipeline1')
+    records = [json.loads(line) for line in backup.dump()]
+    self.assertEqual([r['kind'] for r in records],
+                     ['global_params', 'pipeline'])
+    self.assertEqual([p['name'] for p in records[0]['params']], ['g1'])
+    self.assertLen(records[1]['jobs'], 2)
+
+  def test_dump_in_batches(self):
+    for i in range(5):
+      self._create_pipeline(f'pipeline{i}')
+    records = [json.loads(line) for line in backup.dump(batch_size=2)]
+    self.assertEqual([r['name'] for r in records[1:]],
+                     [f'pipeline{i}' for i in range(5)])
+
+  def test_restore_round_trip(self):
+    models.Param.update_list(
+        [{'name': 'g1', 'type': 'string', 'value': 'foo'}])
+    for i in range(3):
+      self._create_pipeline(f'pipeline{i}')
+    lines = list(backup.dump())
+    for pipeline in models.Pipeline.all():
+      pipeline.destroy()
+    models.Param.update_list([])
+
+    num_restored = backup.restore(lines, batch_size=2)
+    self.assertEqual(num_restored, 3)
+    self.assertEqual(
+        [p.name for p in models.Param.where(pipeline_id=None, job_id=None)],
+        ['g1'])
+    pipelines = models.Pipeline.all()
+    self.assertEqual([p.name for p in pipelines],
+                     ['pipeline0', 'pipeline1', 'pipeline2'])
+    for pipeline in pipelines:
+      self.assertEqual([p.value for p in pipeline.params], [pipeline.name])
+      self.assertLen(pipeline.schedules, 1)
+      job1, job2 = sorted(pipeline.jobs, key=lambda j: j.name)
+      self.assertEqual(
+          [sc.preceding_job_id for sc in job2.start_conditions], [job1.id])
+
+  def test_restore_raises_on_unknown_kind(self):
+    with self.assertRaises(ValueError):
+      backup.restore(['{"kind": "unknown"}\n'])
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -12,12 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from concurrent import futures
+import contextlib
+import time
 from unittest import mock
 
 from absl.testing import absltest
 from absl.testing import parameterized
+import sqlalchemy
 
 from common import crmint_logging
+from common import message
 from common import task
 from controller import mailers
 from controller import models
@@ -135,7 +140,7 @@ class TestPipelineWithJobs(ModelTestCase):
     self.assertEqual(pipeline.status, models.Pipeline.STATUS.STOPPING)
     task1 = models.TaskEnqueued.all()[0]
     job1.task_succeeded(task1.name)
-    self.assertEqual(job1._enqueued_task_count(), 0)
+    self.assertEqual(job1.enqueued_workers_count, 0)
     self.assertEqual(job1.status, models.Job.STATUS.SUCCEEDED)
     self.assertEqual(job2.status, models.Job.STATUS.IDLE)
     self.assertEqual(pipeline.status, models.Pipeline.STATUS.IDLE)
@@ -155,12 +160,12 @@ class TestPipelineWithJobs(ModelTestCase):
     stopping = job1.stop()
     self.assertTrue(stopping)
     self.assertEqual(job1.status, models.Job.STATUS.STOPPING)
-    self.assertEqual(job1._enqueued_task_count(), 1)
+    self.assertEqual(job1.enqueued_workers_count, 1)
     self.assertEqual(job2.status, models.Job.STATUS.WAITING)
-    self.assertEqual(job2._enqueued_task_count(), 0)
+    self.assertEqual(job2.enqueued_workers_count, 0)
     job1.task_failed(task1.name)
     self.assertEqual(job1.status, models.Job.STATUS.FAILED)
-    self.assertEqual(job1._enqueued_task_count(), 0)
+    self.assertEqual(job1.enqueued_workers_count, 0)
 
   def test_inactive_job_unaffected_by_incoming_finished_task(self):
     pipeline = models.Pipeline.create(status=models.Pipeline.STATUS.IDLE)
@@ -196,23 +201,23 @@ class TestPipelineWithJobs(ModelTestCase):
       task1 = job1.start()
       self.assertIsNotNone(task1)
       self.assertEqual(job1.status, models.Job.STATUS.RUNNING)
-      self.assertEqual(job1._enqueued_task_count(), 1)
+      self.assertEqual(job1.enqueued_workers_count, 1)
     with self.subTest('Job 2 starts'):
       task2 = job2.start()
       self.assertIsNotNone(task2)
       self.assertEqual(job2.status, models.Job.STATUS.RUNNING)
-      self.assertEqual(job2._enqueued_task_count(), 1)
+      self.assertEqual(job2.enqueued_workers_count, 1)
     with self.subTest('Job 2 failed'):
       job2.task_failed(task2.name)
       self.assertEqual(job2.status, models.Job.STATUS.FAILED)
-      self.assertEqual(job2._enqueued_task_count(), 0)
+      self.assertEqual(job2.enqueued_workers_count, 0)
       self.assertEqual(pipeline.status, models.Pipeline.STATUS.FAILED)
       # It should trigger the end of the pipeline by itself
       self.assertEqual(job1.status, models.Job.STATUS.STOPPING)
-      self.assertEqual(job1._enqueued_task_count(), 1)
+      self.assertEqual(job1.enqueued_workers_count, 1)
       job1.task_succeeded(task1.name)
       self.assertEqual(job1.status, models.Job.STATUS.SUCCEEDED)
-      self.assertEqual(job1._enqueued_task_count(), 0)
+      self.assertEqual(job1.enqueued_workers_count, 0)
 
 
 class TestPipelineFinishingStatus(ModelTestCase):
@@ -407,6 +412,124 @@ class TestPipelineImport(ModelTestCase):
     self.assertEqual(pipeline.jobs[0].name, 'j1')
     self.assertEqual(pipeline.jobs[1].name, 'j2')
 
+  def test_import_many_remaps_job_ids(self):
+    documents = [
+        {
+            'name': f'pipeline{i}',
+            'params': [{'name': 'p1', 'type': 'string', 'value': i}],
+            'schedules': [{'cron': '* * * * *'}],
+            'jobs': [
+                {'id': 'a', 'name': 'j1', 'worker_class': 'Commenter',
+                 'params': [{'name': 'comment', 'type': 'text', 'value': ''}],
+                 'hash_start_conditions': []},
+                {'id': 'b', 'name': 'j2', 'worker_class': 'Commenter',
+                 'params': [],
+                 'hash_start_conditions': [
+                     {'preceding_job_id': 'a', 'condition': 'success'}]},
+            ],
+        }
+        for i in range(2)
+    ]
+    pipelines = models.Pipeline.import_many(documents)
+    self.assertEqual([p.name for p in pipelines], ['pipeline0', 'pipeline1'])
+    for i, pipeline in enumerate(pipelines):
+      self.assertEqual([p.value for p in pipeline.params], [str(i)])
+      self.assertEqual([s.cron for s in pipeline.schedules], ['* * * * *'])
+      job1, job2 = sorted(pipeline.jobs, key=lambda j: j.name)
+      self.assertEqual([p.name for p in job1.params], ['comment'])
+      self.assertEqual(
+          [(sc.preceding_job_id, sc.condition) for sc in job2.start_conditions],
+          [(job1.id, 'success')])
+      self.assertEqual(pipeline.idle_jobs_count, 2)
+
+
+class TestLoadProfiles(ModelTestCase):
+  """Checks that loading a pipeline doesn't fetch duplicated rows."""
+
+  NUM_JOBS = 20
+  NUM_JOB_PARAMS = 5
+
+  def setUp(self):
+    super().setUp()
+    pipeline = models.Pipeline.create(name='pipeline1')
+    pipeline.assign_params(
+        [{'name': f'p{i}', 'type': 'string', 'value': ''} for i in range(4)])
+    pipeline.assign_schedules([{'cron': '* * * * *'}] * 3)
+    jobs = models.Job.create_many(
+        [{'pipeline_id': pipeline.id} for _ in range(self.NUM_JOBS)])
+    models.Param.create_many([
+        {'job_id': job.id, 'name': f'p{i}', 'type': 'string'}
+        for job in jobs for i in range(self.NUM_JOB_PARAMS)
+    ])
+    # Each job depends on the two previous ones.
+    models.StartCondition.create_many([
+        {'job_id': job.id, 'preceding_job_id': preceding_job.id,
+         'condition': 'success'}
+        for i, job in enumerate(jobs)
+        for preceding_job in jobs[max(0, i - 2):i]
+    ])
+    self.pipeline_id = pipeline.id
+    self.num_start_conditions = 2 * self.NUM_JOBS - 3
+    models.Pipeline.session.expunge_all()
+
+  @contextlib.contextmanager
+  def _count_rows(self):
+    """Yields a list of the (number of queries, number of rows) fetched."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, *args):
+      del conn, cursor, args  # Unused arguments
+      if statement.lstrip().upper().startswith('SELECT'):
+        statements.append((statement, parameters))
+
+    counts = []
+    connection = models.Pipeline.session.connection()
+    engine = connection.engine
+    sqlalchemy.event.listen(
+        engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+      yield counts
+    finally:
+      sqlalchemy.event.remove(
+          engine, 'before_cursor_execute', before_cursor_execute)
+    num_rows = sum(
+        len(connection.exec_driver_sql(statement, parameters).fetchall())
+        for statement, parameters in statements)
+    counts.append((len(statements), num_rows))
+
+  def test_default_loads_each_record_once(self):
+    with self._count_rows() as counts:
+      pipeline = models.Pipeline.find(self.pipeline_id)
+      pipeline.graph  # pylint: disable=pointless-statement
+    num_records = (1 + self.NUM_JOBS * (1 + self.NUM_JOB_PARAMS) +
+                   self.num_start_conditions + 3 + 4)
+    # One query for pipelines, jobs, job params, start conditions, schedules
+    # and pipeline params.
+    self.assertEqual(counts, [(6, num_records)])
+
+  def test_single_profile_skips_job_relations(self):
+    with self._count_rows() as counts:
+      pipeline = models.Pipeline.find(self.pipeline_id, profile='single')
+      self.assertTrue(pipeline.has_jobs)
+    self.assertEqual(counts, [(4, 1 + self.NUM_JOBS + 3 + 4)])
+
+  def test_jobs_profile_skips_pipeline_relations(self):
+    with self._count_rows() as counts:
+      pipeline = models.Pipeline.find(self.pipeline_id, profile='jobs')
+      for job in pipeline.jobs:
+        _ = [sc.preceding_job_name for sc in job.start_conditions]
+    num_records = (1 + self.NUM_JOBS * (1 + self.NUM_JOB_PARAMS) +
+                   self.num_start_conditions)
+    self.assertEqual(counts, [(4, num_records)])
+
+  def test_task_result_profile_loads_job_and_pipeline(self):
+    job_id = models.Job.first().id
+    models.Pipeline.session.expunge_all()
+    with self._count_rows() as counts:
+      job = models.Job.find(job_id, profile='task_result')
+      self.assertEqual(job.pipeline.id, self.pipeline_id)
+    self.assertEqual(counts, [(1, 1)])
+
 
 class TestJobStartedStatus(ModelTestCase):
 
@@ -722,6 +845,124 @@ class TestJobStartWithDependentJobs(ModelTestCase):
     self.assertEqual(job3.status, models.Job.STATUS.WAITING)
 
 
+class TestJobEnqueueMany(ModelTestCase):
+
+  def test_records_all_enqueued_tasks(self):
+    pipeline = models.Pipeline.create(status=models.Pipeline.STATUS.RUNNING)
+    job = models.Job.create(
+        pipeline_id=pipeline.id, status=models.Job.STATUS.RUNNING)
+    tasks = job.enqueue_many([('WorkerA', {}, 0), ('WorkerB', {}, 30)])
+    self.assertLen(tasks, 2)
+    self.assertEqual(job.enqueued_workers_count, 2)
+    self.assertSequenceEqual(
+        [(c.args[0].worker_class, c.args[1:])
+         for c in self.patched_task_enqueue.call_args_list],
+        [('WorkerA', (0,)), ('WorkerB', (30,))])
+
+  def test_reads_general_settings_once(self):
+    pipeline = models.Pipeline.create(status=models.Pipeline.STATUS.RUNNING)
+    job = models.Job.create(
+        pipeline_id=pipeline.id, status=models.Job.STATUS.RUNNING)
+    models.GeneralSetting.create(name='app_title', value='CRMint')
+    with mock.patch.object(
+        models.GeneralSetting, 'all',
+        wraps=models.GeneralSetting.all) as patched_all:
+      job.enqueue_many([('WorkerA', {})] * 3)
+    patched_all.assert_called_once()
+    for c in self.patched_task_enqueue.call_args_list:
+      self.assertEqual(c.args[0].general_settings, {'app_title': 'CRMint'})
+
+  def test_counts_running_tasks(self):
+    pipeline = models.Pipeline.create(status=models.Pipeline.STATUS.RUNNING)
+    job = models.Job.create(
+        pipeline_id=pipeline.id, status=models.Job.STATUS.RUNNING)
+    task1, task2 = job.enqueue_many([('WorkerA', {}), ('WorkerB', {})])
+    self.assertEqual(job.enqueued_workers_count, 2)
+    self.assertEqual(job.task_succeeded(task1.name), 1)
+    self.assertEqual(job.enqueued_workers_count, 1)
+    self.assertEqual(job.status, models.Job.STATUS.RUNNING)
+    self.assertEqual(job.task_succeeded(task2.name), 0)
+    self.assertEqual(job.enqueued_workers_count, 0)
+    self.assertEqual(job.status, models.Job.STATUS.SUCCEEDED)
+
+  def test_does_nothing_if_job_is_not_running(self):
+    pipeline = models.Pipeline.create(status=models.Pipeline.STATUS.RUNNING)
+    job = models.Job.create(
+        pipeline_id=pipeline.id, status=models.Job.STATUS.WAITING)
+    self.assertEmpty(job.enqueue_many([('WorkerA', {}, 0)]))
+    self.assertEqual(job.enqueued_workers_count, 0)
+    self.patched_task_enqueue.assert_not_called()
+
+  def test_records_only_published_tasks_on_publish_error(self):
+    pipeline = models.Pipeline.create(status=models.Pipeline.STATUS.RUNNING)
+    job = models.Job.create(
+        pipeline_id=pipeline.id, status=models.Job.STATUS.RUNNING)
+
+    def fake_batch(join=True):
+      del join  # Unused argument
+      yield
+      failed = self.patched_task_enqueue.call_args_list[1].args[0]
+      raise message.PublishError([({'task_name': failed.name}, Exception())])
+
+    self.enter_context(mock.patch.object(
+        message, 'batch', contextlib.contextmanager(fake_batch)))
+    with self.assertRaises(message.PublishError):
+      job.enqueue_many([('WorkerA', {}, 0), ('WorkerB', {}, 0)])
+    self.assertEqual(job.enqueued_workers_count, 1)
+
+  def test_records_no_unpublished_task_when_starting_pipeline(self):
+    pipeline = models.Pipeline.create()
+    job = models.Job.create(pipeline_id=pipeline.id, worker_class='WorkerA')
+
+    def enqueue(task_inst, delay=0):
+      del delay  # Unused argument
+      future = futures.Future()
+      future.set_exception(RuntimeError('boom'))
+      message._batches.pending.append(({'task_name': task_inst.name}, future))
+
+    self.patched_task_enqueue.side_effect = enqueue
+    with self.assertRaises(message.PublishError):
+      pipeline.start()
+    self.assertEqual(models.Job.find(job.id).enqueued_workers_count, 0)
+
+
+class TestGeneralSettingCache(ModelTestCase):
+
+  def test_reads_values_once(self):
+    models.GeneralSetting.create(name='client_id', value='foo')
+    with mock.patch.object(
+        models.GeneralSetting, 'all',
+        wraps=models.GeneralSetting.all) as patched_all:
+      self.assertEqual(models.GeneralSetting.values(), {'client_id': 'foo'})
+      self.assertEqual(models.GeneralSetting.get_value('client_id'), 'foo')
+    patched_all.assert_called_once()
+
+  def test_returns_default_for_unset_values(self):
+    models.GeneralSetting.create(name='client_id')
+    self.assertEqual(
+        models.GeneralSetting.get_value('client_id', default='bar'), 'bar')
+    self.assertIsNone(models.GeneralSetting.get_value('unknown'))
+
+  def test_invalidates_values_on_save_and_delete(self):
+    setting = models.GeneralSetting.create(name='client_id', value='foo')
+    self.assertEqual(models.GeneralSetting.get_value('client_id'), 'foo')
+    setting.update(value='bar')
+    self.assertEqual(models.GeneralSetting.get_value('client_id'), 'bar')
+    setting.delete()
+    self.assertIsNone(models.GeneralSetting.get_value('client_id'))
+
+  def test_reloads_values_after_ttl(self):
+    setting = models.GeneralSetting.create(name='client_id', value='foo')
+    self.assertEqual(models.GeneralSetting.get_value('client_id'), 'foo')
+    # Simulates an update from another instance.
+    models.GeneralSetting.query.filter_by(id=setting.id).update(
+        {'value': 'bar'})
+    self.assertEqual(models.GeneralSetting.get_value('client_id'), 'foo')
+    with mock.patch.object(
+        models.time, 'monotonic', return_value=time.monotonic() + 60):
+      self.assertEqual(models.GeneralSetting.get_value('client_id'), 'bar')
+
+
 class TestJobStartingMultipleTasks(ModelTestCase):
 
   def test_succeeds_completing_tasks_in_series(self):
@@ -773,7 +1014,7 @@ class TestJobStartingMultipleTasks(ModelTestCase):
     with self.subTest('Job 1 finished'):
       job1_remaining_tasks = job1._task_finished(task1.name, job1_status)
       self.assertEqual(job1_remaining_tasks, 0)
-      self.assertEqual(job2._enqueued_task_count(), 1)
+      self.assertEqual(job2.enqueued_workers_count, 1)
       job2_ns = job2._get_task_namespace()
       task2 = models.TaskEnqueued.where(task_namespace=job2_ns).all()[0]
       self.assertEqual(job1.status, job1_status)
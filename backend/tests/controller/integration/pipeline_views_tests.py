@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
+import json
 from unittest import mock
 
 from absl.testing import absltest
@@ -63,6 +65,37 @@ class TestPipelineViews(controller_utils.ControllerAppTest):
     response = self.client.get('/api/pipelines/1/export')
     self.assertEqual(response.status_code, 200)
 
+  def test_import_pipelines_from_several_files(self):
+    files = []
+    for name in ('p1', 'p2'):
+      data = {'name': name, 'params': [], 'schedules': [], 'jobs': []}
+      files.append((io.BytesIO(json.dumps(data).encode()), f'{name}.json'))
+    response = self.client.post(
+        '/api/pipelines/import', data={'upload_file': files},
+        content_type='multipart/form-data')
+    self.assertEqual(response.status_code, 201)
+    self.assertEqual([p['name'] for p in response.json], ['p1', 'p2'])
+
+  def test_backup_and_restore_pipelines(self):
+    pipeline = models.Pipeline.create(name='My Pipeline')
+    models.Job.create(pipeline_id=pipeline.id)
+    response = self.client.get('/api/pipelines/backup')
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.mimetype, 'application/x-ndjson')
+    response = self.client.post(
+        '/api/pipelines/backup', data=response.data,
+        content_type='application/x-ndjson')
+    self.assertEqual(response.status_code, 201)
+    self.assertEqual(response.json, {'restored_pipelines': 1})
+    self.assertEqual([p.name for p in models.Pipeline.all()],
+                     ['My Pipeline', 'My Pipeline'])
+
+  def test_restore_pipelines_with_invalid_backup(self):
+    response = self.client.post(
+        '/api/pipelines/backup', data=b'{"kind": "unknown"}\n',
+        content_type='application/x-ndjson')
+    self.assertEqual(response.status_code, 400)
+
   def test_enable_run_on_schedule(self):
     pipeline = models.Pipeline.create()
     response = self.client.patch(
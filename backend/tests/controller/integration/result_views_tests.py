@@ -98,7 +98,7 @@ class TestResultViews(controller_utils.ControllerAppTest):
     response = self.client.post('/push/task-finished', json=payload)
     self.assertEqual(response.status_code, 200)
     self.assertEqual(job1.status, expected_job_status)
-    self.assertEqual(job1._enqueued_task_count(), expected_enqueing_count)
+    self.assertEqual(job1.enqueued_workers_count, expected_enqueing_count)
 
 
 if __name__ == '__main__':
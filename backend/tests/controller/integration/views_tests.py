@@ -72,6 +72,29 @@ class TestViews(controller_utils.ControllerAppTest):
         name='google_ads_refresh_token').first()
     self.assertEqual(ads_token_setting.value, 'new-token')
 
+  def test_update_general_settings_invalidates_cached_values(self):
+    self.assertIsNone(
+        models.GeneralSetting.get_value('emails_for_notifications'))
+    payload = {
+        'settings': [
+            {
+                'name': 'google_ads_authentication_code',
+                'type': 'string',
+                'value': '',
+            },
+            {
+                'name': 'emails_for_notifications',
+                'type': 'string',
+                'value': 'john@lenon.com',
+            },
+        ]
+    }
+    response = self.client.put('/api/general_settings', json=payload)
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(
+        models.GeneralSetting.get_value('emails_for_notifications'),
+        'john@lenon.com')
+
   def test_reset_statuses_expect_post(self):
     response = self.client.get('/api/reset/statuses')
     self.assertEqual(response.status_code, 405)
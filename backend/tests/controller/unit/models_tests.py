@@ -1,11 +1,14 @@
 """Tests for controller.models."""
 
 import textwrap
+from unittest import mock
 
 from absl.testing import absltest
 import freezegun
 import jinja2
+from sqlalchemy import orm
 
+from controller import extensions
 from controller import models
 from tests import controller_utils
 
@@ -367,19 +370,313 @@ class TestPipeline(controller_utils.ModelTestCase):
     self.assertTrue(pipeline.has_jobs)
 
 
-class TestTaskEnqueued(controller_utils.ModelTestCase):
+class TestPipelineGraph(controller_utils.ModelTestCase):
+
+  def test_indexes_start_conditions_once(self):
+    pipeline = models.Pipeline.create(name='pipeline1')
+    job1 = models.Job.create(name='job1', pipeline_id=pipeline.id)
+    job2 = models.Job.create(name='job2', pipeline_id=pipeline.id)
+    models.StartCondition.create(
+        job_id=job2.id,
+        preceding_job_id=job1.id,
+        condition=models.StartCondition.CONDITION.SUCCESS)
+    graph = pipeline.graph
+    self.assertEqual(graph.roots, {job1.id})
+    self.assertEqual(graph.leaves, {job2.id})
+    self.assertIs(pipeline.graph, graph)
+
+  def test_invalidates_graph_on_start_conditions_update(self):
+    pipeline = models.Pipeline.create(name='pipeline1')
+    job1 = models.Job.create(name='job1', pipeline_id=pipeline.id)
+    job2 = models.Job.create(name='job2', pipeline_id=pipeline.id)
+    self.assertEqual(pipeline.graph.roots, {job1.id, job2.id})
+    job2.assign_start_conditions(
+        [{'preceding_job_id': job1.id, 'condition': 'success'}])
+    self.assertEqual(pipeline.graph.roots, {job1.id})
+
+  def test_job_statuses(self):
+    pipeline = models.Pipeline.create(name='pipeline1')
+    job1 = models.Job.create(name='job1', pipeline_id=pipeline.id)
+    job2 = models.Job.create(
+        name='job2', pipeline_id=pipeline.id, status=models.Job.STATUS.FAILED)
+    self.assertEqual(pipeline.job_statuses(), {
+        job1.id: models.Job.STATUS.IDLE,
+        job2.id: models.Job.STATUS.FAILED,
+    })
+
+
+class TestPipelineJobStatusCounts(controller_utils.ModelTestCase):
+
+  def assert_counts(self, pipeline, **expected_counts):
+    counts = pipeline.job_status_counts()
+    self.assertEqual({k: v for k, v in counts.items() if v}, expected_counts)
+    # Counters must match the actual statuses of jobs.
+    pipeline.recount_job_statuses()
+    self.assertEqual(pipeline.job_status_counts(), counts)
+
+  def test_counts_created_jobs(self):
+    pipeline = models.Pipeline.create(name='pipeline1')
+    models.Job.create(name='job1', pipeline_id=pipeline.id)
+    models.Job.create(
+        name='job2', pipeline_id=pipeline.id, status=models.Job.STATUS.FAILED)
+    models.Job.create(name='job3')
+    self.assert_counts(pipeline, idle=1, failed=1)
+
+  def test_counts_status_changes(self):
+    pipeline = models.Pipeline.create(name='pipeline1')
+    job1 = models.Job.create(name='job1', pipeline_id=pipeline.id)
+    job2 = models.Job.create(name='job2', pipeline_id=pipeline.id)
+    job1.set_status(models.Job.STATUS.RUNNING)
+    self.assert_counts(pipeline, idle=1, running=1)
+    job1.set_status(models.Job.STATUS.SUCCEEDED)
+    job2.update(status=models.Job.STATUS.WAITING)
+    self.assert_counts(pipeline, waiting=1, succeeded=1)
+
+  def test_counts_deleted_and_moved_jobs(self):
+    pipeline1 = models.Pipeline.create(name='pipeline1')
+    pipeline2 = models.Pipeline.create(name='pipeline2')
+    job1 = models.Job.create(name='job1', pipeline_id=pipeline1.id)
+    job2 = models.Job.create(name='job2', pipeline_id=pipeline1.id)
+    job1.update(pipeline_id=pipeline2.id)
+    job2.delete()
+    self.assert_counts(pipeline1)
+    self.assert_counts(pipeline2, idle=1)
+
+  def test_has_finished(self):
+    pipeline = models.Pipeline.create(name='pipeline1')
+    job = models.Job.create(
+        name='job1', pipeline_id=pipeline.id, status=models.Job.STATUS.RUNNING)
+    self.assertFalse(pipeline.has_finished())
+    job.set_status(models.Job.STATUS.SUCCEEDED)
+    self.assertTrue(pipeline.has_finished())
+
+
+class TestPipelineSetJobStatuses(controller_utils.ModelTestCase):
+
+  def test_counts_status_changes_from_another_session(self):
+    pipeline = models.Pipeline.create(name='pipeline1')
+    job1 = models.Job.create(
+        name='job1', pipeline_id=pipeline.id, status=models.Job.STATUS.RUNNING)
+    models.Job.create(
+        name='job2', pipeline_id=pipeline.id, status=models.Job.STATUS.RUNNING)
+    other_session = orm.Session(bind=extensions.db.engine)
+    self.addCleanup(other_session.close)
+    # Another request finishes job1, while this one stops the pipeline jobs.
+    other_job = other_session.get(models.Job, job1.id)
+    other_job.status = models.Job.STATUS.SUCCEEDED
+    other_session.flush()
+    num_updated = pipeline.set_job_statuses(
+        models.Job.STATUS.STOPPING, from_statuses=[models.Job.STATUS.RUNNING])
+    other_session.commit()
+    self.assertEqual(num_updated, 1)
+    counts = pipeline.job_status_counts()
+    self.assertEqual({k: v for k, v in counts.items() if v},
+                     {'succeeded': 1, 'stopping': 1})
+    pipeline.recount_job_statuses()
+    self.assertEqual(pipeline.job_status_counts(), counts)
+
+  def test_update_where_counts_job_status_changes(self):
+    pipeline = models.Pipeline.create(name='pipeline1')
+    models.Job.create(name='job1', pipeline_id=pipeline.id)
+    models.Job.create(
+        name='job2', pipeline_id=pipeline.id, status=models.Job.STATUS.FAILED)
+    num_updated = models.Job.update_where(
+        {'status': models.Job.STATUS.WAITING}, pipeline_id=pipeline.id,
+        status=models.Job.STATUS.FAILED)
+    self.assertEqual(num_updated, 1)
+    counts = pipeline.job_status_counts()
+    self.assertEqual({k: v for k, v in counts.items() if v},
+                     {'idle': 1, 'waiting': 1})
+
+  def test_update_where_rejects_uncounted_changes(self):
+    with self.subTest('Status of jobs of any pipeline'):
+      with self.assertRaises(ValueError):
+        models.Job.update_where({'status': models.Job.STATUS.IDLE})
+    with self.subTest('Pipeline of jobs'):
+      with self.assertRaises(ValueError):
+        models.Job.update_where({models.Job.pipeline_id: 1}, pipeline_id=2)
+
+  def test_sets_all_job_statuses(self):
+    pipeline = models.Pipeline.create(name='pipeline1')
+    job1 = models.Job.create(name='job1', pipeline_id=pipeline.id)
+    job2 = models.Job.create(
+        name='job2', pipeline_id=pipeline.id, status=models.Job.STATUS.FAILED)
+    other_job = models.Job.create(name='job3')
+    self.assertEqual(pipeline.set_job_statuses(models.Job.STATUS.WAITING), 2)
+    self.assertEqual(job1.status, models.Job.STATUS.WAITING)
+    self.assertEqual(job2.status, models.Job.STATUS.WAITING)
+    self.assertIsNotNone(job1.status_changed_at)
+    self.assertEqual(other_job.status, models.Job.STATUS.IDLE)
+    self.assertEqual(pipeline.job_status_counts()[models.Job.STATUS.WAITING], 2)
+
+  def test_sets_job_statuses_from_given_statuses(self):
+    pipeline = models.Pipeline.create(name='pipeline1')
+    job1 = models.Job.create(
+        name='job1', pipeline_id=pipeline.id, status=models.Job.STATUS.RUNNING)
+    job2 = models.Job.create(
+        name='job2', pipeline_id=pipeline.id, status=models.Job.STATUS.WAITING)
+    num_updated = pipeline.set_job_statuses(
+        models.Job.STATUS.STOPPING, from_statuses=[models.Job.STATUS.RUNNING])
+    self.assertEqual(num_updated, 1)
+    self.assertEqual(job1.status, models.Job.STATUS.STOPPING)
+    self.assertEqual(job2.status, models.Job.STATUS.WAITING)
+    counts = pipeline.job_status_counts()
+    self.assertEqual(counts[models.Job.STATUS.STOPPING], 1)
+    self.assertEqual(counts[models.Job.STATUS.RUNNING], 0)
+
+  def test_applies_deltas_to_current_counters(self):
+    pipeline = models.Pipeline.create(name='pipeline1')
+    models.Job.create(
+        name='job1', pipeline_id=pipeline.id, status=models.Job.STATUS.RUNNING)
+    # Stands for a job created by another transaction, not visible here.
+    models.Pipeline.update_where(
+        {models.Pipeline.idle_jobs_count: 1}, id=pipeline.id)
+    pipeline.set_job_statuses(models.Job.STATUS.STOPPING,
+                              from_statuses=[models.Job.STATUS.RUNNING])
+    counts = pipeline.job_status_counts()
+    self.assertEqual(counts[models.Job.STATUS.IDLE], 1)
+    self.assertEqual(counts[models.Job.STATUS.STOPPING], 1)
+    self.assertEqual(counts[models.Job.STATUS.RUNNING], 0)
+
+
+class TestTransaction(controller_utils.ModelTestCase):
+
+  def test_commits_once_when_leaving_context(self):
+    with mock.patch.object(
+        models.Pipeline.session, 'commit',
+        wraps=models.Pipeline.session.commit) as patched_commit:
+      with models.Pipeline.transaction():
+        pipeline = models.Pipeline.create(name='pipeline1')
+        self.assertIsNotNone(pipeline.id)
+        job = models.Job.create(name='job1', pipeline_id=pipeline.id)
+        job.update(name='job2')
+        patched_commit.assert_not_called()
+    patched_commit.assert_called_once()
+    self.assertLen(models.Job.all(), 1)
+
+  def test_nested_contexts_join_the_outermost(self):
+    with mock.patch.object(
+        models.Pipeline.session, 'commit',
+        wraps=models.Pipeline.session.commit) as patched_commit:
+      with models.Pipeline.transaction():
+        with models.Job.transaction():
+          models.Pipeline.create(name='pipeline1')
+        patched_commit.assert_not_called()
+    patched_commit.assert_called_once()
+
+  def test_rolls_back_on_error(self):
+    with self.assertRaises(ValueError):
+      with models.Pipeline.transaction():
+        models.Pipeline.create(name='pipeline1')
+        raise ValueError('boom')
+    self.assertEmpty(models.Pipeline.all())
+    # Commits again once outside of the transaction.
+    models.Pipeline.create(name='pipeline2')
+    models.Pipeline.session.rollback()
+    self.assertLen(models.Pipeline.all(), 1)
+
+
+class TestBulkOperations(controller_utils.ModelTestCase):
+
+  def test_create_many(self):
+    with models.Schedule.transaction():
+      pipeline = models.Pipeline.create(name='pipeline1')
+      schedules = models.Schedule.create_many(
+          [{'pipeline_id': pipeline.id, 'cron': f'{i} * * * *'}
+           for i in range(3)])
+      self.assertTrue(all(s.id is not None for s in schedules))
+    self.assertLen(models.Schedule.where(pipeline_id=pipeline.id).all(), 3)
+
+  def test_create_many_raises_on_unknown_attribute(self):
+    with self.assertRaises(KeyError):
+      models.Schedule.create_many([{'unknown': 1}])
+
+  def test_destroy_deletes_records_with_ids(self):
+    schedules = models.Schedule.create_many([{'cron': '* * * * *'}] * 3)
+    ids = [s.id for s in schedules]
+    self.assertEqual(models.Schedule.destroy(ids[0], ids[2]), 2)
+    self.assertEqual([s.id for s in models.Schedule.all()], [ids[1]])
+    self.assertEqual(models.Schedule.destroy(), 0)
+
+  def test_update_where(self):
+    pipeline = models.Pipeline.create(name='pipeline1')
+    models.Schedule.create_many(
+        [{'pipeline_id': pipeline.id, 'cron': '* * * * *'},
+         {'pipeline_id': None, 'cron': '* * * * *'}])
+    num_updated = models.Schedule.update_where(
+        {'cron': '0 0 * * *'}, pipeline_id=pipeline.id)
+    self.assertEqual(num_updated, 1)
+    self.assertEqual(
+        sorted(s.cron for s in models.Schedule.all()),
+        ['* * * * *', '0 0 * * *'])
 
-  def test_count_is_zero(self):
-    self.assertEqual(models.TaskEnqueued.count_in_namespace('xyz'), 0)
+  def test_delete_where(self):
+    pipeline = models.Pipeline.create(name='pipeline1')
+    models.Schedule.create_many(
+        [{'pipeline_id': pipeline.id, 'cron': '* * * * *'},
+         {'pipeline_id': None, 'cron': '* * * * *'}])
+    self.assertEqual(
+        models.Schedule.delete_where(pipeline_id__in=[pipeline.id]), 1)
+    self.assertLen(models.Schedule.all(), 1)
+
+  def test_sync_many_inserts_updates_and_deletes(self):
+    pipeline = models.Pipeline.create(name='pipeline1')
+    kept, changed, removed = models.Schedule.create_many(
+        [{'pipeline_id': pipeline.id, 'cron': f'{i} * * * *'}
+         for i in range(3)])
+    counts = models.Schedule.sync_many(pipeline.schedules, [
+        {'id': kept.id, 'pipeline_id': pipeline.id, 'cron': '0 * * * *'},
+        {'id': changed.id, 'pipeline_id': pipeline.id, 'cron': '0 0 * * *'},
+        {'id': None, 'pipeline_id': pipeline.id, 'cron': '5 * * * *'},
+    ])
+    self.assertEqual(counts, (1, 1, 1))
+    self.assertIsNone(models.Schedule.find(removed.id))
+    self.assertEqual(
+        sorted(s.cron for s in models.Schedule.where(pipeline_id=pipeline.id)),
+        ['0 * * * *', '0 0 * * *', '5 * * * *'])
+
+  def test_sync_many_matches_on_key(self):
+    pipeline = models.Pipeline.create(name='pipeline1')
+    job1 = models.Job.create(pipeline_id=pipeline.id)
+    job2 = models.Job.create(pipeline_id=pipeline.id)
+    sc = models.StartCondition.create(
+        job_id=job2.id, preceding_job_id=job1.id, condition='success')
+    counts = models.StartCondition.sync_many(
+        [sc],
+        [{'job_id': job2.id, 'preceding_job_id': job1.id, 'condition': 'fail'}],
+        key='preceding_job_id')
+    self.assertEqual(counts, (0, 1, 0))
+    self.assertEqual(models.StartCondition.find(sc.id).condition, 'fail')
+
+  def test_sync_many_raises_on_unknown_attribute(self):
+    with self.assertRaises(KeyError):
+      models.Schedule.sync_many([], [{'unknown': 1}])
 
-  def test_count_is_zero_in_another_namespace(self):
-    models.TaskEnqueued.create(task_namespace='abc')
-    self.assertEqual(models.TaskEnqueued.count_in_namespace('xyz'), 0)
 
-  def test_count_is_not_zero_in_another_namespace(self):
-    models.TaskEnqueued.create(task_namespace='xyz')
-    models.TaskEnqueued.create(task_namespace='abc')
-    self.assertEqual(models.TaskEnqueued.count_in_namespace('xyz'), 1)
+class TestTaskEnqueued(controller_utils.ModelTestCase):
+
+  def test_delete_tasks_like_namespace_resets_running_tasks(self):
+    pipeline = models.Pipeline.create(name='pipeline1')
+    job = models.Job.create(
+        name='job1', pipeline_id=pipeline.id, enqueued_workers_count=2)
+    models.TaskEnqueued.create(task_namespace=job._get_task_namespace())
+    models.TaskEnqueued.delete_tasks_like_namespace(pipeline.id)
+    models.Job.session.commit()
+    self.assertEqual(job.enqueued_workers_count, 0)
+
+
+class TestJobRunningTasks(controller_utils.ModelTestCase):
+
+  def test_add_running_tasks_returns_updated_count(self):
+    job = models.Job.create(name='job1')
+    self.assertEqual(models.Job.add_running_tasks(job.id, 3), 3)
+    self.assertEqual(models.Job.add_running_tasks(job.id, -1), 2)
+    models.Job.session.commit()
+    self.assertEqual(job.enqueued_workers_count, 2)
+
+  def test_add_running_tasks_is_floored_at_zero(self):
+    job = models.Job.create(name='job1', enqueued_workers_count=1)
+    self.assertEqual(models.Job.add_running_tasks(job.id, -2), 0)
 
 
 if __name__ == '__main__':
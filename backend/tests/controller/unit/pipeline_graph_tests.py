@@ -0,0 +1,60 @@
+# Copyright 2024 Google Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from absl.testing import absltest
+
+from controller import pipeline_graph
+
+
+class TestPipelineGraph(absltest.TestCase):
+
+  def test_indexes_diamond(self):
+    # 1 -> 2 -> 4 and 1 -> 3 -> 4
+    graph = pipeline_graph.PipelineGraph(
+        [4, 3, 2, 1],
+        [(2, 1, 'success'), (3, 1, 'fail'), (4, 2, 'success'),
+         (4, 3, 'whatever')])
+    self.assertEqual(graph.roots, {1})
+    self.assertEqual(graph.leaves, {4})
+    self.assertEqual(graph.topological_order, (1, 2, 3, 4))
+    self.assertEqual(graph.dependents(1), (2, 3))
+    self.assertEqual(graph.conditions(4), ((2, 'success'), (3, 'whatever')))
+
+  def test_isolated_jobs_are_roots_and_leaves(self):
+    graph = pipeline_graph.PipelineGraph([1, 2], [])
+    self.assertEqual(graph.roots, {1, 2})
+    self.assertEqual(graph.leaves, {1, 2})
+    self.assertEqual(graph.dependents(1), ())
+    self.assertEqual(graph.conditions(1), ())
+
+  def test_ignores_edges_to_unknown_jobs(self):
+    graph = pipeline_graph.PipelineGraph([1, 2], [(2, 1, 'success'),
+                                                  (2, 42, 'success')])
+    self.assertEqual(graph.conditions(2), ((1, 'success'),))
+    self.assertEqual(graph.dependents(42), ())
+
+  def test_orders_cycles_last(self):
+    graph = pipeline_graph.PipelineGraph(
+        [1, 2, 3], [(2, 3, 'success'), (3, 2, 'success')])
+    self.assertEqual(graph.topological_order, (1, 2, 3))
+
+  def test_counts_duplicated_conditions_once(self):
+    graph = pipeline_graph.PipelineGraph(
+        [1, 2], [(2, 1, 'success'), (2, 1, 'fail')])
+    self.assertEqual(graph.dependents(1), (2,))
+    self.assertEqual(graph.topological_order, (1, 2))
+
+
+if __name__ == '__main__':
+  absltest.main()
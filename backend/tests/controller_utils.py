@@ -23,6 +23,7 @@ import flask
 from controller import app
 from controller import database
 from controller import extensions
+from controller import models
 from tests import utils
 
 
@@ -42,6 +43,7 @@ class ModelTestCase(parameterized.TestCase):
     self.ctx.push()
     # Creates tables & loads seed data
     extensions.db.create_all()
+    models.GeneralSetting.invalidate_cache()
 
   def tearDown(self):
     super().tearDown()
@@ -66,6 +68,7 @@ class ControllerAppTest(utils.AppTestCase):
     super().setUp()
     # Creates tables & loads seed data
     extensions.db.create_all()
+    models.GeneralSetting.invalidate_cache()
     database.load_fixtures()
 
   def tearDown(self):
@@ -12,6 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from unittest import mock
+
+from common import crmint_logging
+from common import message
+from jobs.workers.bigquery import bq_worker
+from jobs.workers.ga import ga_utils
 from jobs_app import app
 from tests import utils
 
@@ -27,3 +33,23 @@ class TestJobsApp(utils.AppTestCase):
   def test_root_accessible(self):
     response = self.client.get('/api/workers')
     self.assertEqual(response.status_code, 200)
+
+  def test_warmup_reports_timings(self):
+    self.enter_context(
+        mock.patch.object(crmint_logging, 'get_logger', autospec=True))
+    self.enter_context(
+        mock.patch.object(crmint_logging, 'log_global_message', autospec=True))
+    self.enter_context(
+        mock.patch.object(message, 'get_publisher_client', autospec=True))
+    self.enter_context(
+        mock.patch.object(bq_worker, 'get_client', autospec=True))
+    self.enter_context(
+        mock.patch.object(ga_utils, 'get_client', autospec=True,
+                          side_effect=RuntimeError('No credentials')))
+    response = self.client.get('/_ah/warmup')
+    self.assertEqual(response.status_code, 200)
+    self.assertIsInstance(response.json['workers'], float)
+    self.assertIsInstance(response.json['bigquery'], float)
+    with self.subTest('Reports failed steps'):
+      self.assertEqual(response.json['analytics'],
+                       'RuntimeError: No credentials')
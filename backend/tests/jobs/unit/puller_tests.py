@@ -0,0 +1,159 @@
+"""Tests for jobs.puller."""
+
+import datetime
+import json
+import threading
+from unittest import mock
+
+from absl.testing import absltest
+import freezegun
+from google.cloud import pubsub_v1
+from google.cloud.pubsub_v1.subscriber import futures
+from google.cloud.pubsub_v1.subscriber import message as pubsub_message
+
+from common import crmint_logging
+from jobs import puller
+from jobs import runner
+
+
+def _make_message(data, start_time=0):
+  msg = mock.create_autospec(
+      pubsub_message.Message, instance=True)
+  msg.data = json.dumps(data).encode('utf-8')
+  msg.attributes = {'start_time': str(start_time)}
+  msg.message_id = '123'
+  return msg
+
+
+def _task_data(worker_class='BQWaiter'):
+  return {
+      'task_name': 'TASK',
+      'pipeline_id': 1,
+      'job_id': 2,
+      'worker_class': worker_class,
+      'worker_params': {},
+      'general_settings': {},
+      'attempts': 1,
+  }
+
+
+class TaskPullerTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.patched_run_task = self.enter_context(
+        mock.patch.object(runner, 'run_task', autospec=True))
+    self.enter_context(
+        mock.patch.object(crmint_logging, 'log_global_message', autospec=True))
+    self.subscriber = mock.create_autospec(
+        pubsub_v1.SubscriberClient, instance=True)
+    self.subscriber.subscribe.return_value = mock.create_autospec(
+        futures.StreamingPullFuture, instance=True)
+
+  def test_executes_task_and_acks(self):
+    task_puller = puller.TaskPuller('SUBSCRIPTION', subscriber=self.subscriber)
+    msg = _make_message(_task_data())
+    task_puller.process_message(msg)
+    task_inst = self.patched_run_task.call_args[0][0]
+    self.assertEqual(task_inst.name, 'TASK')
+    self.assertEqual(task_inst.worker_class, 'BQWaiter')
+    msg.ack.assert_called_once()
+    msg.nack.assert_not_called()
+
+  @freezegun.freeze_time('2024-01-01T00:00:00')
+  def test_postpones_task_scheduled_later(self):
+    task_puller = puller.TaskPuller('SUBSCRIPTION', subscriber=self.subscriber)
+    now = datetime.datetime(2024, 1, 1).timestamp()
+    with self.subTest('Until the task is due'):
+      msg = _make_message(_task_data(), start_time=int(now) + 120)
+      task_puller.process_message(msg)
+      self.patched_run_task.assert_not_called()
+      msg.modify_ack_deadline.assert_called_once_with(120)
+      msg.drop.assert_called_once()
+      msg.nack.assert_not_called()
+    with self.subTest('At most for the maximum ack deadline'):
+      msg = _make_message(_task_data(), start_time=int(now) + 3600)
+      task_puller.process_message(msg)
+      msg.modify_ack_deadline.assert_called_once_with(
+          puller.TaskPuller.MAX_ACK_DEADLINE)
+      msg.drop.assert_called_once()
+
+  def test_acks_invalid_message_without_executing_it(self):
+    task_puller = puller.TaskPuller('SUBSCRIPTION', subscriber=self.subscriber)
+    msg = _make_message({'foo': 'bar'})
+    task_puller.process_message(msg)
+    self.patched_run_task.assert_not_called()
+    msg.ack.assert_called_once()
+
+  def test_nacks_on_unexpected_error(self):
+    self.patched_run_task.side_effect = RuntimeError('boom')
+    task_puller = puller.TaskPuller('SUBSCRIPTION', subscriber=self.subscriber)
+    msg = _make_message(_task_data())
+    with self.assertRaises(RuntimeError):
+      task_puller.process_message(msg)
+    msg.nack.assert_called_once()
+    msg.ack.assert_not_called()
+
+  def test_postpones_tasks_above_worker_class_limit(self):
+    task_puller = puller.TaskPuller(
+        'SUBSCRIPTION',
+        worker_class_limits={'BQWaiter': 1},
+        subscriber=self.subscriber)
+    running = threading.Event()
+    release = threading.Event()
+
+    def run_task(task_inst):
+      if task_inst.worker_class == 'BQWaiter':
+        running.set()
+        release.wait(timeout=5)
+
+    self.patched_run_task.side_effect = run_task
+    first_msg = _make_message(_task_data())
+    thread = threading.Thread(
+        target=task_puller.process_message, args=(first_msg,))
+    thread.start()
+    self.assertTrue(running.wait(timeout=5))
+
+    with self.subTest('Postpones task of the same worker class'):
+      msg = _make_message(_task_data())
+      task_puller.process_message(msg)
+      msg.modify_ack_deadline.assert_called_once_with(
+          puller.TaskPuller.WORKER_CLASS_LIMIT_BACKOFF)
+      msg.drop.assert_called_once()
+      msg.nack.assert_not_called()
+    with self.subTest('Executes task of another worker class'):
+      msg = _make_message(_task_data('BQQueryLauncher'))
+      task_puller.process_message(msg)
+      msg.ack.assert_called_once()
+
+    release.set()
+    thread.join(timeout=5)
+    first_msg.ack.assert_called_once()
+    with self.subTest('Executes task once the limit is released'):
+      msg = _make_message(_task_data())
+      task_puller.process_message(msg)
+      msg.ack.assert_called_once()
+
+  def test_subscribes_with_flow_control(self):
+    task_puller = puller.TaskPuller(
+        'SUBSCRIPTION',
+        max_workers=8,
+        max_lease_duration=600,
+        subscriber=self.subscriber)
+    task_puller.start()
+    kwargs = self.subscriber.subscribe.call_args.kwargs
+    self.assertEqual(kwargs['flow_control'].max_messages, 8)
+    self.assertEqual(kwargs['flow_control'].max_lease_duration, 600)
+
+  def test_stop_waits_for_running_tasks(self):
+    task_puller = puller.TaskPuller('SUBSCRIPTION', subscriber=self.subscriber)
+    streaming_pull_future = task_puller.start()
+    task_puller.stop()
+    kwargs = self.subscriber.subscribe.call_args.kwargs
+    self.assertTrue(kwargs['await_callbacks_on_shutdown'])
+    streaming_pull_future.cancel.assert_called_once_with()
+    streaming_pull_future.result.assert_called_once_with()
+
+
+if __name__ == '__main__':
+  absltest.main()
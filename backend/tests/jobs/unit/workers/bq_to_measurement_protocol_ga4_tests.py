@@ -8,6 +8,7 @@ from unittest import mock
 from absl.testing import absltest
 from google.auth import credentials
 from google.cloud import bigquery
+from google.cloud import storage
 import requests
 
 from jobs.workers import worker
@@ -70,90 +71,203 @@ def _use_query_results(bq_client: bigquery.Client,
 
 class BQToMeasurementProtocolGA4Test(absltest.TestCase):
 
-  def test_read_and_process_table_with_two_pages(self):
+  def _make_scheduler(self, extra_params=None):
+    params = {
+        'job_id': 'JOBID',
+        'bq_project_id': 'BQID',
+        'bq_dataset_id': 'DTID',
+        'bq_table_id': 'table_id',
+        'measurement_id': 'G-4713LA7M1F',
+        'api_secret': 'xyz',
+        'template': _SAMPLE_WEB_TEMPLATE,
+        'mp_batch_size': 20,
+    }
+    params.update(extra_params or {})
     worker_inst = bq_to_measurement_protocol_ga4.BQToMeasurementProtocolGA4(
-        {
-            'job_id': 'JOBID',
-            'bq_project_id': 'BQID',
-            'bq_dataset_id': 'DTID',
-            'bq_table_id': 'table_id',
-            'bq_page_token': None,
-            'measurement_id': 'G-4713LA7M1F',
-            'api_secret': 'xyz',
-            'template': _SAMPLE_WEB_TEMPLATE,
-            'mp_batch_size': 20,
-        },
+        params,
         pipeline_id=1,
         job_id=1,
         logger_project='PROJECT',
         logger_credentials=_make_credentials())
+    self.enter_context(mock.patch.object(worker_inst, '_log', autospec=True))
+    return worker_inst
 
-    # Stubs the BigQuery table read response.
-    # https://cloud.google.com/bigquery/docs/reference/rest/v2/tabledata/list#response-body
-    api_response_page_1 = {
-        'kind': 'bigquery#tableDataList',
-        'totalRows': 2,
-        'pageToken': 'abc',
-        'rows': [
-            {
-                'f': [
-                    {'v': 'UA-12345-1'},
-                    {'v': '35009a79-1a05-49d7-b876-2b884d0f825b'},
-                    {'v': 1234000000},
-                    {'v': 0.9},
-                    {'v': 'LTV v1'},
-                ]
-            },
-            {
-                'f': [
-                    {'v': 'UA-12345-1'},
-                    {'v': '35009a79-1a05-49d7-b876-2b884d0f825b'},
-                    {'v': 1234000000},
-                    {'v': 0.8},
-                    {'v': 'LTV v1'},
-                ]
-            },
-        ],
-    }
-    # Empties the `pageToken` for the 2nd page to simulate the end of the table.
-    api_response_page_2 = api_response_page_1.copy()
-    api_response_page_2['pageToken'] = ''
-
+  def _use_table_with_num_rows(self, worker_inst, num_rows):
     bq_client = bigquery.Client(
         project='PROJECT', credentials=_make_credentials())
-    table_schema = [
-        bigquery.SchemaField('tracking_id', 'STRING'),
-        bigquery.SchemaField('client_id', 'STRING'),
-        bigquery.SchemaField('event_timestamp', 'TIMESTAMP'),
-        bigquery.SchemaField('score', 'FLOAT'),
-        bigquery.SchemaField('model_type', 'STRING'),
-    ]
-    _use_query_results(bq_client,
-                       table_schema,
-                       [api_response_page_1, api_response_page_2])
-
-    self.enter_context(mock.patch.object(worker_inst, '_log', autospec=True))
+    _use_query_results(bq_client, [], [])
+    bq_client.get_table.return_value.num_rows = num_rows
     self.enter_context(
         mock.patch.object(
             worker_inst, '_get_client', autospec=True, return_value=bq_client))
-    # Limits the enqueuing to 1 processing tasks and the batch size to 100
+    return bq_client
+
+  def test_plans_shards_from_table_row_count(self):
+    worker_inst = self._make_scheduler()
+    bq_client = self._use_table_with_num_rows(worker_inst, 250)
+    worker_inst.BQ_BATCH_SIZE = 100
+    enqueued_workers = worker_inst.execute()
+    bq_client.get_table.assert_called_once_with('BQID.DTID.table_id')
+    with self.subTest('Never reads the table rows'):
+      bq_client._connection.api_request.assert_not_called()
+    with self.subTest('Enqueued one processing task per shard'):
+      self.assertEqual(
+          [(w[0], w[1]['bq_start_index'], w[1]['bq_batch_size'])
+           for w in enqueued_workers],
+          [
+              ('BQToMeasurementProtocolProcessorGA4', 0, 100),
+              ('BQToMeasurementProtocolProcessorGA4', 100, 100),
+              ('BQToMeasurementProtocolProcessorGA4', 200, 100),
+          ])
+
+  def test_empty_table_enqueues_nothing(self):
+    worker_inst = self._make_scheduler()
+    self._use_table_with_num_rows(worker_inst, 0)
+    self.assertEmpty(worker_inst.execute())
+
+  def test_spawns_scheduler_for_remaining_shards(self):
+    worker_inst = self._make_scheduler()
+    self._use_table_with_num_rows(worker_inst, 250)
     worker_inst.BQ_BATCH_SIZE = 100
-    worker_inst.MAX_ENQUEUED_JOBS = 1
+    worker_inst.MAX_ENQUEUED_JOBS = 2
     enqueued_workers = worker_inst.execute()
-    self.assertLen(enqueued_workers, 2)
-    with self.subTest('Enqueued one processing task worker'):
+    self.assertLen(enqueued_workers, 3)
+    with self.subTest('Enqueued two processing task workers'):
       expected_params = worker_inst._params.copy()
+      expected_params['bq_start_index'] = 100
       expected_params['bq_batch_size'] = 100
       self.assertEqual(
-          enqueued_workers[0],
+          enqueued_workers[1],
           ('BQToMeasurementProtocolProcessorGA4', expected_params, 0))
-    with self.subTest('Enqueued the next page worker'):
+    with self.subTest('Enqueued the next shards scheduler'):
       expected_params = worker_inst._params.copy()
-      expected_params['bq_page_token'] = 'abc'
+      expected_params['bq_num_rows'] = 250
+      expected_params['bq_start_index'] = 200
       self.assertEqual(
-          enqueued_workers[1],
+          enqueued_workers[2],
           ('BQToMeasurementProtocolGA4', expected_params, 0))
 
+  def test_next_scheduler_reuses_planned_row_count(self):
+    worker_inst = self._make_scheduler(
+        {'bq_num_rows': 250, 'bq_start_index': 200})
+    bq_client = self._use_table_with_num_rows(worker_inst, 1000)
+    worker_inst.BQ_BATCH_SIZE = 100
+    enqueued_workers = worker_inst.execute()
+    bq_client.get_table.assert_not_called()
+    self.assertEqual(
+        [(w[0], w[1]['bq_start_index']) for w in enqueued_workers],
+        [('BQToMeasurementProtocolProcessorGA4', 200)])
+
+  def test_shares_run_id_with_processors_and_next_scheduler(self):
+    worker_inst = self._make_scheduler()
+    self._use_table_with_num_rows(worker_inst, 250)
+    worker_inst.BQ_BATCH_SIZE = 100
+    worker_inst.MAX_ENQUEUED_JOBS = 2
+    enqueued_workers = worker_inst.execute()
+    run_ids = {w[1]['mp_run_id'] for w in enqueued_workers}
+    self.assertLen(run_ids, 1)
+    self.assertNotIn('', run_ids)
+
+  def test_fails_to_resume_from_legacy_page_token(self):
+    worker_inst = self._make_scheduler({'bq_page_token': 'TOKEN'})
+    bq_client = self._use_table_with_num_rows(worker_inst, 250)
+    with self.assertRaisesRegex(worker.WorkerException, 'legacy page token'):
+      worker_inst.execute()
+    bq_client.get_table.assert_not_called()
+
+
+class GroupPayloadsTest(absltest.TestCase):
+
+  def test_merges_events_with_identical_shared_fields(self):
+    payloads = [
+        {'client_id': 'a', 'events': [{'name': 'e1'}]},
+        {'client_id': 'b', 'events': [{'name': 'e2'}]},
+        {'client_id': 'a', 'events': [{'name': 'e3'}, {'name': 'e4'}]},
+    ]
+    self.assertEqual(
+        bq_to_measurement_protocol_ga4._group_payloads(payloads, 25),
+        [
+            {'client_id': 'a',
+             'events': [{'name': 'e1'}, {'name': 'e3'}, {'name': 'e4'}]},
+            {'client_id': 'b', 'events': [{'name': 'e2'}]},
+        ])
+
+  def test_does_not_merge_different_timestamps(self):
+    payloads = [
+        {'user_id': 'a', 'timestamp_micros': '1', 'events': [{'name': 'e1'}]},
+        {'user_id': 'a', 'timestamp_micros': '2', 'events': [{'name': 'e2'}]},
+    ]
+    self.assertLen(
+        bq_to_measurement_protocol_ga4._group_payloads(payloads, 25), 2)
+
+  def test_splits_events_above_max_events(self):
+    payloads = [
+        {'client_id': 'a', 'events': [{'name': f'e{i}'}]} for i in range(5)
+    ]
+    batched_payloads = bq_to_measurement_protocol_ga4._group_payloads(
+        payloads, 2)
+    self.assertEqual([len(p['events']) for p in batched_payloads], [2, 2, 1])
+
+  def test_keeps_payloads_without_events(self):
+    payloads = [
+        {'client_id': 'a', 'events': [{'name': 'e1'}]},
+        {'client_id': 'a'},
+        {'client_id': 'a', 'events': []},
+        {'client_id': 'a', 'events': [{'name': 'e2'}]},
+    ]
+    self.assertEqual(
+        bq_to_measurement_protocol_ga4._group_payloads(payloads, 25),
+        [
+            {'client_id': 'a', 'events': [{'name': 'e1'}, {'name': 'e2'}]},
+            {'client_id': 'a'},
+            {'client_id': 'a', 'events': []},
+        ])
+
+  def test_splits_events_above_max_bytes(self):
+    payloads = [
+        {'client_id': 'a',
+         'events': [{'name': 'e', 'params': {'v': 'x' * 40}}]}
+        for _ in range(5)
+    ]
+    batched_payloads = bq_to_measurement_protocol_ga4._group_payloads(
+        payloads, 25, max_bytes=200)
+    self.assertEqual([len(p['events']) for p in batched_payloads], [2, 2, 1])
+    for payload in batched_payloads:
+      self.assertLessEqual(len(json.dumps(payload)), 200)
+
+  def test_sends_single_event_above_max_bytes_alone(self):
+    payloads = [
+        {'client_id': 'a',
+         'events': [{'name': 'e', 'params': {'v': 'x' * 300}}]}
+        for _ in range(2)
+    ]
+    batched_payloads = bq_to_measurement_protocol_ga4._group_payloads(
+        payloads, 25, max_bytes=200)
+    self.assertEqual([len(p['events']) for p in batched_payloads], [1, 1])
+
+
+class TokenBucketTest(absltest.TestCase):
+
+  def test_no_rate_limit_never_sleeps(self):
+    patched_sleep = self.enter_context(
+        mock.patch('time.sleep', autospec=True))
+    bucket = bq_to_measurement_protocol_ga4._TokenBucket(0)
+    for _ in range(100):
+      bucket.acquire()
+    patched_sleep.assert_not_called()
+
+  def test_sleeps_when_bucket_is_empty(self):
+    self.enter_context(
+        mock.patch('time.monotonic', autospec=True, return_value=0.0))
+    patched_sleep = self.enter_context(
+        mock.patch('time.sleep', autospec=True, side_effect=StopIteration))
+    bucket = bq_to_measurement_protocol_ga4._TokenBucket(2)
+    bucket.acquire()
+    bucket.acquire()
+    with self.assertRaises(StopIteration):
+      bucket.acquire()
+    patched_sleep.assert_called_once_with(0.5)
+
 
 class TestBQToMeasurementProtocolProcessor(absltest.TestCase):
 
@@ -168,7 +282,121 @@ class TestBQToMeasurementProtocolProcessor(absltest.TestCase):
             autospec=True,
             return_value=self._bq_client))
     self._patched_post = self.enter_context(
-        mock.patch.object(requests, 'post', autospec=True))
+        mock.patch.object(requests.Session, 'post', autospec=True))
+
+  def _make_processor_with_checkpoint(self):
+    worker_inst = bq_to_measurement_protocol_ga4.BQToMeasurementProtocolProcessorGA4(
+        {
+            'bq_project_id': 'BQID',
+            'bq_dataset_id': 'DTID',
+            'bq_table_id': 'table_id',
+            'bq_start_index': 1000,
+            'bq_batch_size': 10,
+            'mp_batch_size': 1,
+            'mp_checkpoint_uri': 'gs://bucket/checkpoints',
+            'mp_run_id': 'RUNID',
+            'measurement_id': 'G-4713LA7M1F',
+            'api_secret': 'xyz',
+            'template': _SAMPLE_WEB_TEMPLATE,
+            'debug': False,
+        },
+        pipeline_id=1,
+        job_id=1,
+        logger_project='PROJECT',
+        logger_credentials=_make_credentials())
+    worker_inst.CHECKPOINT_INTERVAL = 2
+    self.enter_context(mock.patch.object(worker_inst, '_log', autospec=True))
+
+    # Stubs the BigQuery table read response with 3 rows.
+    # https://cloud.google.com/bigquery/docs/reference/rest/v2/tabledata/list#response-body
+    api_response = {
+        'kind': 'bigquery#tableDataList',
+        'totalRows': 3,
+        'rows': [
+            {'f': [{'v': 'client-1'}, {'v': 1234000000}, {'v': 0.1},
+                   {'v': 'LTV v1'}]},
+            {'f': [{'v': 'client-2'}, {'v': 1234000000}, {'v': 0.2},
+                   {'v': 'LTV v1'}]},
+            {'f': [{'v': 'client-3'}, {'v': 1234000000}, {'v': 0.3},
+                   {'v': 'LTV v1'}]},
+        ],
+    }
+    table_schema = [
+        bigquery.SchemaField('client_id', 'STRING'),
+        bigquery.SchemaField('event_timestamp', 'INTEGER'),
+        bigquery.SchemaField('score', 'FLOAT'),
+        bigquery.SchemaField('model_type', 'STRING'),
+    ]
+    _use_query_results(self._bq_client, table_schema, [api_response])
+
+    mock_storage_client = mock.create_autospec(
+        storage.Client, instance=True, spec_set=True)
+    self.enter_context(
+        mock.patch.object(storage, 'Client', autospec=True,
+                          return_value=mock_storage_client))
+    return worker_inst, mock_storage_client.bucket.return_value
+
+  def test_checkpoints_progress_after_each_chunk(self):
+    worker_inst, mock_bucket = self._make_processor_with_checkpoint()
+    mock_bucket.get_blob.return_value = None
+    post_response = requests.Response()
+    post_response.status_code = 204
+    self._patched_post.return_value = post_response
+    worker_inst._execute()
+    self.assertEqual(self._patched_post.call_count, 3)
+    mock_bucket.get_blob.assert_called_once_with(
+        'checkpoints/RUNID/shard-1000/checkpoint.json')
+    saved_states = [
+        json.loads(c.args[0])
+        for c in mock_bucket.blob.return_value.upload_from_string.call_args_list
+    ]
+    self.assertEqual(saved_states, [
+        {'next_request_index': 2, 'failed_requests': 0},
+        {'next_request_index': 3, 'failed_requests': 0},
+    ])
+
+  def test_resumes_from_checkpoint(self):
+    worker_inst, mock_bucket = self._make_processor_with_checkpoint()
+    mock_bucket.get_blob.return_value.download_as_text.return_value = (
+        json.dumps({'next_request_index': 2, 'failed_requests': 0}))
+    post_response = requests.Response()
+    post_response.status_code = 204
+    self._patched_post.return_value = post_response
+    worker_inst._execute()
+    self._patched_post.assert_called_once()
+    sent_payload = json.loads(self._patched_post.call_args.kwargs['data'])
+    self.assertEqual(sent_payload['client_id'], 'client-3')
+
+  def test_records_failed_requests_instead_of_failing(self):
+    worker_inst, mock_bucket = self._make_processor_with_checkpoint()
+    mock_bucket.get_blob.return_value = None
+    success_response = requests.Response()
+    success_response.status_code = 204
+    failure_response = requests.Response()
+    failure_response.status_code = 400
+
+    def post(unused_session, unused_url, data, headers):
+      del headers  # Unused.
+      if json.loads(data)['client_id'] == 'client-2':
+        return failure_response
+      return success_response
+
+    self._patched_post.side_effect = post
+    worker_inst._execute()
+    self.assertEqual(self._patched_post.call_count, 3)
+    blob_names = [c.args[0] for c in mock_bucket.blob.call_args_list]
+    self.assertIn('checkpoints/RUNID/shard-1000/errors-000000.ndjson',
+                  blob_names)
+    uploads = [
+        c.args[0]
+        for c in mock_bucket.blob.return_value.upload_from_string.call_args_list
+    ]
+    errors = [json.loads(line) for line in uploads[0].splitlines()]
+    self.assertLen(errors, 1)
+    self.assertEqual(errors[0]['payload']['client_id'], 'client-2')
+    self.assertIn('status code (400)', errors[0]['error'])
+    self.assertEqual(json.loads(uploads[-1]),
+                     {'next_request_index': 3, 'failed_requests': 1})
 
   def test_debug_flag_sends_data_to_debug_endpoint(self):
     worker_inst = bq_to_measurement_protocol_ga4.BQToMeasurementProtocolProcessorGA4(
@@ -176,7 +404,7 @@ class TestBQToMeasurementProtocolProcessor(absltest.TestCase):
             'bq_project_id': 'BQID',
             'bq_dataset_id': 'DTID',
             'bq_table_id': 'table_id',
-            'bq_page_token': None,
+            'bq_start_index': 0,
             'bq_batch_size': 10,
             'mp_batch_size': 20,
             'measurement_id': 'G-4713LA7M1F',
@@ -230,6 +458,7 @@ class TestBQToMeasurementProtocolProcessor(absltest.TestCase):
         mock.patch.object(worker_inst, 'log_warn', autospec=True))
     worker_inst._execute()
     self._patched_post.assert_called_once_with(
+        mock.ANY,
         'https://www.google-analytics.com/debug/mp/collect?measurement_id=G-4713LA7M1F&api_secret=xyz',
         data=json.dumps({
             'client_id': '35009a79-1a05-49d7-b876-2b884d0f825b',
@@ -252,7 +481,7 @@ class TestBQToMeasurementProtocolProcessor(absltest.TestCase):
             'bq_project_id': 'BQID',
             'bq_dataset_id': 'DTID',
             'bq_table_id': 'table_id',
-            'bq_page_token': None,
+            'bq_start_index': 0,
             'bq_batch_size': 10,
             'mp_batch_size': 20,
             'measurement_id': 'G-4713LA7M1F',
@@ -306,30 +535,91 @@ class TestBQToMeasurementProtocolProcessor(absltest.TestCase):
 
     self.enter_context(mock.patch.object(worker_inst, '_log', autospec=True))
     worker_inst._execute()
-    self.assertEqual(self._patched_post.call_count, 2)
-    self._patched_post.assert_called_with(
+    with self.subTest('Reads the chunk addressed by its start index'):
+      query_params = (
+          self._bq_client._connection.api_request.call_args[1]['query_params'])
+      self.assertEqual(query_params['startIndex'], 0)
+      self.assertEqual(query_params['maxResults'], 10)
+    self._patched_post.assert_called_once_with(
+        mock.ANY,
         'https://www.google-analytics.com/mp/collect?measurement_id=G-4713LA7M1F&api_secret=xyz',
         data=json.dumps({
             'client_id': '35009a79-1a05-49d7-b876-2b884d0f825b',
             'timestamp_micros': '1970-01-01 00:20:34+00:00',
             'nonPersonalizedAds': False,
-            'events': [{
-                'name': 'post_score',
-                'params': {
-                    'score': '0.8',
-                    'model_type': 'LTV v1',
-                }
-            }]
+            'events': [
+                {
+                    'name': 'post_score',
+                    'params': {
+                        'score': '0.9',
+                        'model_type': 'LTV v1',
+                    }
+                },
+                {
+                    'name': 'post_score',
+                    'params': {
+                        'score': '0.8',
+                        'model_type': 'LTV v1',
+                    }
+                },
+            ]
         }),
         headers={'content-type': 'application/json'})
 
+  def test_reads_page_of_legacy_page_token(self):
+    worker_inst = bq_to_measurement_protocol_ga4.BQToMeasurementProtocolProcessorGA4(
+        {
+            'bq_project_id': 'BQID',
+            'bq_dataset_id': 'DTID',
+            'bq_table_id': 'table_id',
+            'bq_page_token': 'TOKEN',
+            'bq_batch_size': 10,
+            'mp_batch_size': 20,
+            'measurement_id': 'G-4713LA7M1F',
+            'api_secret': 'xyz',
+            'template': _SAMPLE_WEB_TEMPLATE,
+            'debug': False,
+        },
+        pipeline_id=1,
+        job_id=1,
+        logger_project='PROJECT',
+        logger_credentials=_make_credentials())
+    api_response = {
+        'kind': 'bigquery#tableDataList',
+        'totalRows': 1,
+        'pageToken': 'NEXT_TOKEN',
+        'rows': [
+            {'f': [{'v': 'client-1'}, {'v': 1234000000}, {'v': 0.1},
+                   {'v': 'LTV v1'}]},
+        ],
+    }
+    table_schema = [
+        bigquery.SchemaField('client_id', 'STRING'),
+        bigquery.SchemaField('event_timestamp', 'INTEGER'),
+        bigquery.SchemaField('score', 'FLOAT'),
+        bigquery.SchemaField('model_type', 'STRING'),
+    ]
+    _use_query_results(self._bq_client, table_schema, [api_response])
+    post_response = requests.Response()
+    post_response.status_code = 204
+    self._patched_post.return_value = post_response
+    self.enter_context(mock.patch.object(worker_inst, '_log', autospec=True))
+    worker_inst._execute()
+    with self.subTest('Reads only the page of the token'):
+      self._bq_client._connection.api_request.assert_called_once()
+      query_params = (
+          self._bq_client._connection.api_request.call_args[1]['query_params'])
+      self.assertEqual(query_params['pageToken'], 'TOKEN')
+      self.assertNotIn('startIndex', query_params)
+    self._patched_post.assert_called_once()
+
   def test_success_with_one_post_request_android(self):
     worker_inst = bq_to_measurement_protocol_ga4.BQToMeasurementProtocolProcessorGA4(
         {
             'bq_project_id': 'BQID',
             'bq_dataset_id': 'DTID',
             'bq_table_id': 'table_id',
-            'bq_page_token': None,
+            'bq_start_index': 0,
             'bq_batch_size': 10,
             'mp_batch_size': 20,
             'measurement_id': '1:1234567890:android:321abc456def7890',
@@ -380,20 +670,29 @@ class TestBQToMeasurementProtocolProcessor(absltest.TestCase):
 
     self.enter_context(mock.patch.object(worker_inst, '_log', autospec=True))
     worker_inst._execute()
-    self.assertEqual(self._patched_post.call_count, 2)
-    self._patched_post.assert_called_with(
+    self._patched_post.assert_called_once_with(
+        mock.ANY,
         'https://www.google-analytics.com/mp/collect?firebase_app_id=1%3A1234567890%3Aandroid%3A321abc456def7890&api_secret=xyz',
         data=json.dumps({
             'app_instance_id': 'AE9C7A5E358F2E0E0E90E4B8DD67AE76',
             'timestamp_micros': '1970-01-01 00:20:34+00:00',
             'nonPersonalizedAds': False,
-            'events': [{
-                'name': 'post_score',
-                'params': {
-                    'score': '0.8',
-                    'model_type': 'LTV v1',
-                }
-            }]
+            'events': [
+                {
+                    'name': 'post_score',
+                    'params': {
+                        'score': '0.9',
+                        'model_type': 'LTV v1',
+                    }
+                },
+                {
+                    'name': 'post_score',
+                    'params': {
+                        'score': '0.8',
+                        'model_type': 'LTV v1',
+                    }
+                },
+            ]
         }),
         headers={'content-type': 'application/json'})
 
@@ -403,7 +702,7 @@ class TestBQToMeasurementProtocolProcessor(absltest.TestCase):
             'bq_project_id': 'BQID',
             'bq_dataset_id': 'DTID',
             'bq_table_id': 'table_id',
-            'bq_page_token': None,
+            'bq_start_index': 0,
             'bq_batch_size': 10,
             'mp_batch_size': 20,
             'measurement_id': '1:1234567890:ios:321abc456def7890',
@@ -454,30 +753,133 @@ class TestBQToMeasurementProtocolProcessor(absltest.TestCase):
 
     self.enter_context(mock.patch.object(worker_inst, '_log', autospec=True))
     worker_inst._execute()
-    self.assertEqual(self._patched_post.call_count, 2)
-    self._patched_post.assert_called_with(
+    self._patched_post.assert_called_once_with(
+        mock.ANY,
         'https://www.google-analytics.com/mp/collect?firebase_app_id=1%3A1234567890%3Aios%3A321abc456def7890&api_secret=xyz',
         data=json.dumps({
             'app_instance_id': 'AE9C7A5E358F2E0E0E90E4B8DD67AE76',
             'timestamp_micros': '1970-01-01 00:20:34+00:00',
             'nonPersonalizedAds': False,
-            'events': [{
-                'name': 'post_score',
-                'params': {
-                    'score': '0.8',
-                    'model_type': 'LTV v1',
-                }
-            }]
+            'events': [
+                {
+                    'name': 'post_score',
+                    'params': {
+                        'score': '0.9',
+                        'model_type': 'LTV v1',
+                    }
+                },
+                {
+                    'name': 'post_score',
+                    'params': {
+                        'score': '0.8',
+                        'model_type': 'LTV v1',
+                    }
+                },
+            ]
         }),
         headers={'content-type': 'application/json'})
 
+  def test_splits_requests_by_user_and_batch_size(self):
+    worker_inst = bq_to_measurement_protocol_ga4.BQToMeasurementProtocolProcessorGA4(
+        {
+            'bq_project_id': 'BQID',
+            'bq_dataset_id': 'DTID',
+            'bq_table_id': 'table_id',
+            'bq_start_index': 0,
+            'bq_batch_size': 10,
+            'mp_batch_size': 2,
+            'measurement_id': 'G-4713LA7M1F',
+            'api_secret': 'xyz',
+            'template': _SAMPLE_WEB_TEMPLATE,
+            'debug': False,
+        },
+        pipeline_id=1,
+        job_id=1,
+        logger_project='PROJECT',
+        logger_credentials=_make_credentials())
+
+    # Stubs the BigQuery table read response with 3 rows for one user and
+    # 1 row for another user.
+    # https://cloud.google.com/bigquery/docs/reference/rest/v2/tabledata/list#response-body
+    api_response = {
+        'kind': 'bigquery#tableDataList',
+        'totalRows': 4,
+        'rows': [
+            {'f': [{'v': 'UA-12345-1'}, {'v': 'client-1'},
+                   {'v': 1234000000}, {'v': 0.1}, {'v': 'LTV v1'}]},
+            {'f': [{'v': 'UA-12345-1'}, {'v': 'client-2'},
+                   {'v': 1234000000}, {'v': 0.2}, {'v': 'LTV v1'}]},
+            {'f': [{'v': 'UA-12345-1'}, {'v': 'client-1'},
+                   {'v': 1234000000}, {'v': 0.3}, {'v': 'LTV v1'}]},
+            {'f': [{'v': 'UA-12345-1'}, {'v': 'client-1'},
+                   {'v': 1234000000}, {'v': 0.4}, {'v': 'LTV v1'}]},
+        ],
+    }
+    table_schema = [
+        bigquery.SchemaField('tracking_id', 'STRING'),
+        bigquery.SchemaField('client_id', 'STRING'),
+        bigquery.SchemaField('event_timestamp', 'INTEGER'),
+        bigquery.SchemaField('score', 'FLOAT'),
+        bigquery.SchemaField('model_type', 'STRING'),
+    ]
+    _use_query_results(self._bq_client, table_schema, [api_response])
+
+    post_response = requests.Response()
+    post_response.status_code = 204
+    self._patched_post.return_value = post_response
+
+    self.enter_context(mock.patch.object(worker_inst, '_log', autospec=True))
+    worker_inst._execute()
+    # Requests are sent concurrently, so we sort them for a stable comparison.
+    sent_payloads = [json.loads(c.kwargs['data'])
+                     for c in self._patched_post.call_args_list]
+    self.assertCountEqual(
+        [(p['client_id'], [e['params']['score'] for e in p['events']])
+         for p in sent_payloads],
+        [
+            ('client-1', ['0.1', '0.3']),
+            ('client-1', ['0.4']),
+            ('client-2', ['0.2']),
+        ])
+
+  def test_retries_only_with_checkpoints(self):
+    processor_class = (
+        bq_to_measurement_protocol_ga4.BQToMeasurementProtocolProcessorGA4)
+    with_checkpoints = processor_class(
+        {'mp_checkpoint_uri': 'gs://bucket/checkpoints', 'mp_run_id': 'RUNID'},
+        pipeline_id=1, job_id=1)
+    self.assertEqual(with_checkpoints.MAX_ATTEMPTS,
+                     processor_class.CHECKPOINTED_MAX_ATTEMPTS)
+    without_checkpoints = processor_class({}, pipeline_id=1, job_id=1)
+    self.assertEqual(without_checkpoints.MAX_ATTEMPTS, 1)
+
+  def test_disables_checkpoints_without_run_id(self):
+    worker_inst = (
+        bq_to_measurement_protocol_ga4.BQToMeasurementProtocolProcessorGA4(
+            {'mp_checkpoint_uri': 'gs://bucket/checkpoints'},
+            pipeline_id=1, job_id=1))
+    self.enter_context(mock.patch.object(worker_inst, '_log', autospec=True))
+    self.assertIsNone(worker_inst._get_checkpoint())
+    self.assertEqual(worker_inst.MAX_ATTEMPTS, 1)
+
+  def test_session_retries_throttled_and_server_errors(self):
+    worker_inst = bq_to_measurement_protocol_ga4.BQToMeasurementProtocolProcessorGA4(
+        {}, pipeline_id=1, job_id=1)
+    session = worker_inst._get_session(max_concurrency=4)
+    adapter = session.get_adapter('https://www.google-analytics.com')
+    self.assertEqual(adapter._pool_maxsize, 4)
+    self.assertEqual(adapter.max_retries.total, worker_inst.MAX_RETRIES)
+    self.assertIn('POST', adapter.max_retries.allowed_methods)
+    self.assertContainsSubset([429, 500, 503],
+                              adapter.max_retries.status_forcelist)
+
   def test_log_exception_if_http_fails(self):
     worker_inst = bq_to_measurement_protocol_ga4.BQToMeasurementProtocolProcessorGA4(
         {
             'bq_project_id': 'BQID',
             'bq_dataset_id': 'DTID',
             'bq_table_id': 'table_id',
-            'bq_page_token': None,
+            'bq_start_index': 0,
             'bq_batch_size': 10,
             'mp_batch_size': 20,
             'measurement_id': 'G-4713LA7M1F',
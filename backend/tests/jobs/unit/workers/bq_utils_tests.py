@@ -1,12 +1,43 @@
 """Tests for bq_utils."""
 
+from unittest import mock
+
 from absl.testing import absltest
 from absl.testing import parameterized
+from google.auth import credentials
 from google.cloud import bigquery
+from google.cloud import bigquery_storage
+import pyarrow
 
 from jobs.workers.bigquery import bq_utils
 
 
+def _make_table(num_rows):
+  table = bigquery.Table(
+      'PROJECT.DATASET.table',
+      schema=[
+          bigquery.SchemaField('name', 'STRING'),
+          bigquery.SchemaField('score', 'FLOAT'),
+      ])
+  table._properties['numRows'] = str(num_rows)
+  return table
+
+
+def _make_client():
+  creds = mock.create_autospec(
+      credentials.Credentials, instance=True, spec_set=True)
+  client = bigquery.Client(project='PROJECT', credentials=creds)
+  client._connection = mock.MagicMock()
+  client._connection.api_request.return_value = {
+      'totalRows': 2,
+      'rows': [
+          {'f': [{'v': 'foo'}, {'v': 0.1}]},
+          {'f': [{'v': 'bar'}, {'v': 0.2}]},
+      ],
+  }
+  return client
+
+
 class BigqueryUtilsTest(parameterized.TestCase):
 
   def test_get_schema_field_with_float_required(self):
@@ -64,6 +95,86 @@ class BigqueryUtilsTest(parameterized.TestCase):
     processed_units = bq_utils.bytes_converter(10000000000000)
     self.assertEqual(processed_units, '10.0 TB')
 
+  def test_read_rows_of_small_table_with_tabledata_api(self):
+    client = _make_client()
+    bqstorage_client = mock.create_autospec(
+        bigquery_storage.BigQueryReadClient, instance=True)
+    rows = list(bq_utils.read_rows(
+        client, _make_table(2), bqstorage_client=bqstorage_client))
+    self.assertEqual(rows, [
+        {'name': 'foo', 'score': 0.1},
+        {'name': 'bar', 'score': 0.2},
+    ])
+    bqstorage_client.create_read_session.assert_not_called()
+
+  def test_read_rows_range_with_tabledata_api(self):
+    client = _make_client()
+    bqstorage_client = mock.create_autospec(
+        bigquery_storage.BigQueryReadClient, instance=True)
+    rows = list(bq_utils.read_rows(
+        client,
+        _make_table(bq_utils.STORAGE_READ_API_MIN_ROWS),
+        start_index=10,
+        max_results=2,
+        bqstorage_client=bqstorage_client))
+    self.assertLen(rows, 2)
+    query_params = client._connection.api_request.call_args[1]['query_params']
+    self.assertEqual(query_params['startIndex'], 10)
+    bqstorage_client.create_read_session.assert_not_called()
+
+  def test_read_rows_range_of_table_reference_fetches_table_once(self):
+    client = _make_client()
+    patched_get_table = self.enter_context(
+        mock.patch.object(
+            client, 'get_table', autospec=True, return_value=_make_table(2)))
+    rows = list(bq_utils.read_rows(
+        client,
+        'PROJECT.DATASET.table',
+        start_index=10,
+        max_results=2,
+        num_rows=bq_utils.STORAGE_READ_API_MIN_ROWS))
+    self.assertLen(rows, 2)
+    patched_get_table.assert_called_once()
+
+  def test_read_rows_picks_api_from_given_num_rows(self):
+    client = _make_client()
+    bqstorage_client = mock.create_autospec(
+        bigquery_storage.BigQueryReadClient, instance=True)
+    patched_to_arrow_iterable = self.enter_context(
+        mock.patch.object(
+            bigquery.table.RowIterator,
+            'to_arrow_iterable',
+            autospec=True,
+            return_value=iter([])))
+    list(bq_utils.read_rows(
+        client,
+        _make_table(0),
+        bqstorage_client=bqstorage_client,
+        num_rows=bq_utils.STORAGE_READ_API_MIN_ROWS))
+    patched_to_arrow_iterable.assert_called_once()
+
+  def test_read_rows_of_large_table_with_storage_api(self):
+    client = _make_client()
+    bqstorage_client = mock.create_autospec(
+        bigquery_storage.BigQueryReadClient, instance=True)
+    record_batch = pyarrow.RecordBatch.from_pydict(
+        {'name': ['foo', 'bar'], 'score': [0.1, 0.2]})
+    patched_to_arrow_iterable = self.enter_context(
+        mock.patch.object(
+            bigquery.table.RowIterator,
+            'to_arrow_iterable',
+            autospec=True,
+            return_value=iter([record_batch, record_batch])))
+    rows = list(bq_utils.read_rows(
+        client,
+        _make_table(bq_utils.STORAGE_READ_API_MIN_ROWS),
+        bqstorage_client=bqstorage_client))
+    self.assertLen(rows, 4)
+    self.assertEqual(rows[1], {'name': 'bar', 'score': 0.2})
+    patched_to_arrow_iterable.assert_called_once_with(
+        mock.ANY, bqstorage_client=bqstorage_client)
+    client._connection.api_request.assert_not_called()
+
 
 if __name__ == '__main__':
   absltest.main()
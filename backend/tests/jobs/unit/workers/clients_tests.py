@@ -0,0 +1,59 @@
+"""Tests for clients."""
+
+from concurrent import futures
+from unittest import mock
+
+from absl.testing import absltest
+
+from jobs.workers import clients
+
+
+class GetClientTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.addCleanup(clients.clear)
+
+  def test_reuses_client_for_same_key(self):
+    client_class = mock.Mock()
+    first = clients.get_client(client_class, project='PROJECT', foo='bar')
+    second = clients.get_client(client_class, project='PROJECT', foo='bar')
+    self.assertIs(first, second)
+    client_class.assert_called_once_with(project='PROJECT', foo='bar')
+
+  def test_creates_one_client_per_project_location_and_scopes(self):
+    client_class = mock.Mock(side_effect=lambda **kwargs: object())
+    created = {
+        clients.get_client(client_class),
+        clients.get_client(client_class, project='PROJECT'),
+        clients.get_client(client_class, location='us-central1'),
+        clients.get_client(client_class, location='europe-west1'),
+        clients.get_client(client_class, scopes=['scope']),
+    }
+    self.assertLen(created, 5)
+    with self.subTest('Does not pass the project if not provided'):
+      self.assertEqual(client_class.call_args_list[0], mock.call())
+
+  def test_creates_one_client_per_class(self):
+    first_class = mock.Mock()
+    second_class = mock.Mock()
+    self.assertIsNot(clients.get_client(first_class),
+                     clients.get_client(second_class))
+
+  def test_creates_client_once_across_threads(self):
+    client_class = mock.Mock(side_effect=lambda **kwargs: object())
+    with futures.ThreadPoolExecutor(max_workers=8) as executor:
+      created = set(executor.map(
+          lambda _: clients.get_client(client_class), range(32)))
+    self.assertLen(created, 1)
+    client_class.assert_called_once()
+
+  def test_clear_forgets_clients(self):
+    client_class = mock.Mock(side_effect=lambda **kwargs: object())
+    first = clients.get_client(client_class)
+    clients.clear()
+    self.assertIsNot(first, clients.get_client(client_class))
+
+
+if __name__ == '__main__':
+  absltest.main()
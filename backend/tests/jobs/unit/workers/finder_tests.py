@@ -1,13 +1,16 @@
 """Tests for the find method in workers.__init__."""
 
+from unittest import mock
+
 from absl.testing import absltest
+from absl.testing import parameterized
 
 from jobs.workers import finder
 from jobs.workers.bigquery import bq_query_launcher
 from jobs.workers.bigquery import bq_to_measurement_protocol_ga4
 
 
-class FindWorkerClassTest(absltest.TestCase):
+class FindWorkerClassTest(parameterized.TestCase):
 
   def test_can_find_worker_class(self):
     worker_class = finder.get_worker_class('BQQueryLauncher')
@@ -23,6 +26,25 @@ class FindWorkerClassTest(absltest.TestCase):
     with self.assertRaises(ModuleNotFoundError):
       finder.get_worker_class('UnknownWorkerClass')
 
+  @parameterized.parameters(
+      *finder.WORKERS_MAPPING, *finder._PRIVATE_WORKERS_MAPPING)
+  def test_reads_worker_params_from_source(self, class_name):
+    worker_class = finder.get_worker_class(class_name)
+    self.assertEqual(
+        finder.get_worker_params(class_name),
+        [tuple(p) for p in worker_class.PARAMS])
+
+  def test_worker_params_do_not_import_worker_module(self):
+    finder.get_worker_params.cache_clear()
+    self.addCleanup(finder.get_worker_params.cache_clear)
+    with mock.patch('importlib.import_module', autospec=True) as patched:
+      finder.get_worker_params('VertexAITabularTrainer')
+    patched.assert_not_called()
+
+  def test_raises_on_unknown_worker_params(self):
+    with self.assertRaises(ModuleNotFoundError):
+      finder.get_worker_params('UnknownWorkerClass')
+
 
 if __name__ == '__main__':
   absltest.main()
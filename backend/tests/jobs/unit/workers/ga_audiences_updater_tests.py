@@ -46,6 +46,7 @@ def _use_query_results(bq_client: bigquery.Client,
   mock_table = mock.create_autospec(
       bigquery.Table, instance=True, spec_set=True)
   mock_table.schema = schema
+  mock_table.num_rows = sum(int(r['totalRows']) for r in stub_json_responses)
   mock_dataset.table.return_value = mock_table
   bq_client._connection = mock.MagicMock()
   bq_client._connection.api_request.side_effect = stub_json_responses
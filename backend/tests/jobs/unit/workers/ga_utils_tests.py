@@ -3,6 +3,7 @@
 import json
 import os
 import textwrap
+import threading
 from unittest import mock
 
 from absl.testing import absltest
@@ -11,6 +12,7 @@ from google import auth
 from google.auth import credentials
 from google.cloud import bigquery
 from googleapiclient import discovery
+from googleapiclient import discovery_cache
 from googleapiclient import http
 
 from common import crmint_logging
@@ -48,6 +50,8 @@ class GoogleAnalyticsUtilsTest(parameterized.TestCase):
         headers={'status': '200'})
     self.patched_log_message = self.enter_context(
         mock.patch.object(crmint_logging, 'log_global_message', autospec=True))
+    self.enter_context(
+        mock.patch.object(ga_utils, '_clients', threading.local()))
 
   @parameterized.parameters(
       ('analytics', 'v3',
@@ -70,6 +74,72 @@ class GoogleAnalyticsUtilsTest(parameterized.TestCase):
     client = ga_utils.get_client(service, version)
     self.assertEqual(client._baseUrl, api_base_url)
 
+  def test_get_client_reuses_client_in_same_thread(self):
+    first_credentials = mock.create_autospec(
+        credentials.Credentials, instance=True, spec_set=True)
+    second_credentials = mock.create_autospec(
+        credentials.Credentials, instance=True, spec_set=True)
+    patched_build = self.enter_context(
+        mock.patch.object(discovery, 'build', autospec=True))
+    client = ga_utils.get_client(
+        'analytics', 'v3', credentials=first_credentials)
+    with self.subTest('Builds from the static discovery document'):
+      patched_build.assert_not_called()
+    with self.subTest('Reuses client for the same credentials'):
+      self.assertIs(
+          ga_utils.get_client('analytics', 'v3', credentials=first_credentials),
+          client)
+    with self.subTest('Builds a client for other credentials'):
+      self.assertIsNot(
+          ga_utils.get_client(
+              'analytics', 'v3', credentials=second_credentials),
+          client)
+    with self.subTest('Builds a client for other threads'):
+      other_clients = []
+
+      def get_client_in_thread():
+        other_clients.append(ga_utils.get_client(
+            'analytics', 'v3', credentials=first_credentials))
+
+      thread = threading.Thread(target=get_client_in_thread)
+      thread.start()
+      thread.join()
+      self.assertIsNot(other_clients[0], client)
+
+  def test_get_client_parses_discovery_document_once_per_process(self):
+    ga_utils._get_discovery_document.cache_clear()
+    self.addCleanup(ga_utils._get_discovery_document.cache_clear)
+    mock_credentials = mock.create_autospec(
+        credentials.Credentials, instance=True, spec_set=True)
+    patched_get_static_doc = self.enter_context(
+        mock.patch.object(
+            discovery_cache,
+            'get_static_doc',
+            wraps=discovery_cache.get_static_doc))
+    patched_build_from_document = self.enter_context(
+        mock.patch.object(
+            discovery,
+            'build_from_document',
+            wraps=discovery.build_from_document))
+    client = ga_utils.get_client(
+        'analytics', 'v3', credentials=mock_credentials)
+    other_clients = []
+
+    def get_client_in_thread():
+      other_clients.append(ga_utils.get_client(
+          'analytics', 'v3', credentials=mock_credentials))
+
+    thread = threading.Thread(target=get_client_in_thread)
+    thread.start()
+    thread.join()
+    self.assertIsNot(other_clients[0], client)
+    self.assertEqual(other_clients[0]._baseUrl, client._baseUrl)
+    patched_get_static_doc.assert_called_once_with('analytics', 'v3')
+    documents = [c.args[0] for c in patched_build_from_document.call_args_list]
+    self.assertLen(documents, 2)
+    self.assertIsInstance(documents[0], dict)
+    self.assertIs(documents[1], documents[0])
+
   def test_get_dataimport_upload_status_pending(self):
     # Response does not contain yet an upload item.
     response = {
@@ -525,6 +595,7 @@ class GoogleAnalyticsUtilsTest(parameterized.TestCase):
   def test_get_audience_patches(self):
     bq_client = mock.create_autospec(
         bigquery.Client, instance=True, spec_set=True)
+    bq_client.get_table.return_value.num_rows = 2
     bq_client.list_rows.return_value = [
         {
             'name': 'foo',
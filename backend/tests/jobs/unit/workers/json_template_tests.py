@@ -0,0 +1,94 @@
+# Copyright 2024 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for json_template."""
+
+import datetime
+import decimal
+import textwrap
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+from jobs.workers import json_template
+
+
+class JSONTemplateTest(parameterized.TestCase):
+
+  def test_renders_placeholders_inside_strings(self):
+    template = json_template.JSONTemplate(textwrap.dedent("""\
+        {
+          "client_id": "${client_id}",
+          "events": [{"name": "score", "params": {"value": "$score"}}]
+        }"""))
+    self.assertEqual(
+        template.render({'client_id': 'abc', 'score': 0.8}),
+        {
+            'client_id': 'abc',
+            'events': [{'name': 'score', 'params': {'value': '0.8'}}],
+        })
+
+  def test_renders_values_with_their_text_representation(self):
+    template = json_template.JSONTemplate('{"ts": "${ts}"}')
+    ts = datetime.datetime(1970, 1, 1, 0, 20, 34, tzinfo=datetime.timezone.utc)
+    self.assertEqual(template.render({'ts': ts}),
+                     {'ts': '1970-01-01 00:20:34+00:00'})
+
+  def test_renders_strings_mixing_text_and_placeholders(self):
+    template = json_template.JSONTemplate('{"name": "${first} $$ ${last}!"}')
+    self.assertEqual(template.render({'first': 'John', 'last': 'Doe'}),
+                     {'name': 'John $ Doe!'})
+
+  def test_escapes_special_characters(self):
+    template = json_template.JSONTemplate('{"name": "${name}"}')
+    self.assertEqual(template.render({'name': 'say "hi"\\'}),
+                     {'name': 'say "hi"\\'})
+
+  @parameterized.named_parameters(
+      ('Integer', 3, 3),
+      ('Float', 0.5, 0.5),
+      ('Boolean', True, True),
+      ('Null', None, None),
+      ('Decimal', decimal.Decimal('1.25'), 1.25),
+      ('JSON string', '[1, 2]', [1, 2]),
+  )
+  def test_renders_placeholders_outside_strings_as_json_values(
+      self, value, expected_value):
+    template = json_template.JSONTemplate('{"value": ${value}}')
+    self.assertEqual(template.render({'value': value}),
+                     {'value': expected_value})
+
+  def test_falls_back_to_text_substitution(self):
+    template = json_template.JSONTemplate('{"value": ${integer}.5}')
+    self.assertEqual(template.render({'integer': 3}), {'value': 3.5})
+
+  def test_does_not_share_rendered_structures(self):
+    template = json_template.JSONTemplate('{"events": [{"name": "x"}]}')
+    first = template.render({})
+    first['events'].append({'name': 'y'})
+    self.assertEqual(template.render({}), {'events': [{'name': 'x'}]})
+
+  def test_raises_key_error_on_missing_value(self):
+    template = json_template.JSONTemplate('{"name": "${name}"}')
+    with self.assertRaises(KeyError):
+      template.render({})
+
+  def test_raises_value_error_on_invalid_placeholder(self):
+    template = json_template.JSONTemplate('{"name": "${1}"}')
+    with self.assertRaises(ValueError):
+      template.render({})
+
+
+if __name__ == '__main__':
+  absltest.main()